@@ -0,0 +1,189 @@
+''' Command-line batch runner: apply control standards to every rig file in a directory, one file per worker process.
+
+    Each file is loaded into its own offline_cmds scene (rig files are JSON scene files for now, see
+    offline_cmds.saveScene), the chosen pipeline of tool operations is run on it, and the result is saved.
+    A JSON line is printed per file as soon as it is done, with the time and command count of every step,
+    so a sweep can be watched, piped into other tools, or resumed from the files that failed.
+
+    Usage:
+        python batch_runner.py RIG_DIR --output OUT_DIR [--pipeline colours,offsetGrps] [--workers N]
+        python batch_runner.py RIG_DIR --in-place --pipeline shapes --shape-cache hero.ncsc
+
+    Pipeline steps (run in the order given):
+        shapes          restore control shapes and colours from --shape-cache (nurbCtrls.importCtrlShapes)
+        colours         colour l_/r_ controls by side (nurbCtrls.colourByRule)
+        offsetGrps      zero out controls without an offset group (create_group.makeOffsetGrps)
+        mirror          mirror l_ control shapes onto r_ ones (nurbCtrls.mirrorCtrls)
+        simplify        simplify control shapes to --tolerance (nurbCtrls.simplifyCtrls)'''
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import offline_cmds
+
+# Steps run when no --pipeline is given.
+DEFAULT_PIPELINE = ("colours", "offsetGrps")
+
+# Suffix of the groups the offsetGrps step creates (and of the groups that mark a control as already zeroed out).
+OFFSET_SUFFIX = "_offsetGrp"
+
+
+def _controls(cmds):
+    ''' full paths of every transform with a nurbsCurve shape'''
+
+    shapes = cmds.ls(type="nurbsCurve", long=True)
+    return sorted(cmds.listRelatives(shapes, parent=True, fullPath=True) or []) if shapes else []
+
+
+def stepShapes(cmds, options):
+    import nurbCtrls
+    if not options.get("shapeCache"):
+        raise ValueError("the shapes step needs --shape-cache")
+    return {"rewritten" : len(nurbCtrls.importCtrlShapes(options["shapeCache"]))}
+
+
+def stepColours(cmds, options):
+    import nurbCtrls
+    controls = _controls(cmds)
+    nurbCtrls.colourByRule(controls, nurbCtrls.SIDE_COLOURS)
+    return {"controls" : len(controls)}
+
+
+def stepOffsetGrps(cmds, options):
+    import create_group
+    controls = [path for path in _controls(cmds) if not path.rsplit("|", 1)[0].endswith(path.rsplit("|", 1)[1] + OFFSET_SUFFIX)]
+    return {"grouped" : len(create_group.makeOffsetGrps(controls, suffixes=(OFFSET_SUFFIX,)))}
+
+
+def stepMirror(cmds, options):
+    import nurbCtrls
+    return {"mirrored" : len(nurbCtrls.mirrorCtrls())}
+
+
+def stepSimplify(cmds, options):
+    import nurbCtrls
+    result = nurbCtrls.simplifyCtrls(tolerance=options.get("tolerance", 0.01))
+    return {"rebuilt" : len(result["rebuilt"]), "removed" : len(result["removed"]), "cvsBefore" : result["cvsBefore"],
+            "cvsAfter" : result["cvsAfter"], "maxDeviation" : result["maxDeviation"]}
+
+
+# Pipeline step name -> function(cmds, options) applying it to the open scene, returning a JSON-ready summary.
+STEPS = {"shapes" : stepShapes,
+         "colours" : stepColours,
+         "offsetGrps" : stepOffsetGrps,
+         "mirror" : stepMirror,
+         "simplify" : stepSimplify}
+
+
+def processFile(task):
+    ''' Load one rig file, run the pipeline on it and save it
+
+        task : (path, outputPath, pipeline, options), as one tuple so it can be handed to a process pool
+
+        On Exit:
+        Returns the file's JSON-ready result: {"file", "output", "ok", "seconds", "commands", "steps" : [{"step",
+        "seconds", "commands", "result"}]}, plus "error" and "traceback" if a step failed (the file is then not saved).'''
+
+    path, outputPath, pipeline, options = task
+    cmds = offline_cmds.install()
+    result = {"file" : path, "output" : outputPath, "ok" : True, "steps" : [], "worker" : os.getpid()}
+    start = time.time()
+    cmds.reset()
+
+    try:
+        cmds.loadScene(path)
+        for step in pipeline:
+            stepStart, stepCommands = time.time(), cmds.total()
+            summary = STEPS[step](cmds, options)
+            result["steps"].append({"step" : step, "seconds" : round(time.time() - stepStart, 6),
+                                    "commands" : cmds.total() - stepCommands, "result" : summary})
+        cmds.saveScene(outputPath)
+    except Exception as error:
+        result.update(ok=False, error="%s: %s" % (type(error).__name__, error), traceback=traceback.format_exc())
+
+    result["seconds"] = round(time.time() - start, 6)
+    result["commands"] = cmds.total()
+    return result
+
+
+def runBatch(paths, outputDir=None, pipeline=DEFAULT_PIPELINE, options=None, workers=None, stream=None):
+    ''' Run the pipeline over many rig files, in a process pool
+
+        paths : rig files to process
+        outputDir : directory to save the results in (same file names), or None to overwrite the files
+        pipeline : STEPS names, run in order on each file
+        options : step options, e.g. {"shapeCache" : path, "tolerance" : 0.01}
+        workers : worker processes, defaults to one per core. 1 runs every file in this process.
+        stream : file to write each result to as a JSON line as soon as it is done, e.g. sys.stdout
+
+        On Exit:
+        Returns the results of every file (see processFile), in the order they finished.'''
+
+    unknown = [step for step in pipeline if step not in STEPS]
+    if unknown:
+        raise ValueError("Unknown pipeline steps: %s (choose from %s)" % (", ".join(unknown), ", ".join(sorted(STEPS))))
+
+    tasks = [(path, os.path.join(outputDir, os.path.basename(path)) if outputDir else path, tuple(pipeline), dict(options or {}))
+             for path in paths]
+    workers = min(workers or multiprocessing.cpu_count(), len(tasks)) or 1
+    results = []
+
+    def collect(result):
+        results.append(result)
+        if stream is not None:
+            stream.write(json.dumps(result, sort_keys=True) + "\n")
+            stream.flush()
+
+    if workers == 1:
+        for task in tasks:
+            collect(processFile(task))
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for result in pool.imap_unordered(processFile, tasks):
+                collect(result)
+        finally:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply control standards to every rig file in a directory.")
+    parser.add_argument("directory", help="directory of rig files (JSON scene files)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="directory to save processed files in")
+    target.add_argument("--in-place", action="store_true", help="overwrite the rig files")
+    parser.add_argument("--pipeline", default=",".join(DEFAULT_PIPELINE),
+                        help="comma separated steps, from: %s (default: %%(default)s)" % ", ".join(sorted(STEPS)))
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--shape-cache", help="shape cache for the shapes step, see nurbCtrls.exportCtrlShapes")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="tolerance for the simplify step")
+    args = parser.parse_args(argv)
+
+    pipeline = [step for step in args.pipeline.split(",") if step]
+    unknown = [step for step in pipeline if step not in STEPS]
+    if unknown:
+        parser.error("unknown pipeline steps: %s" % ", ".join(unknown))
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.json")))
+    if args.output and not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    start = time.time()
+    results = runBatch(paths, args.output, pipeline,
+                       {"shapeCache" : args.shape_cache, "tolerance" : args.tolerance}, args.workers, sys.stdout)
+    failed = len([result for result in results if not result["ok"]])
+    sys.stderr.write("%i files, %i failed, %.2f s\n" % (len(results), failed, time.time() - start))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+''' Opt-in maya.cmds call profiler for the rigging tools.
+
+    While enabled, the tool modules' "cmds" is swapped for a proxy that times every command, and each tool
+    function is wrapped so commands are attributed to the outermost tool function that caused them
+    (nurbDiamond, stretchSwitch, makeGrpFunc, ...). Nothing is patched while disabled, so there is no overhead.
+    Commands an OperationRecorder plans are attributed to the tool that recorded them, whoever commits the plan.
+
+    Works with the real maya.cmds or any stand-in for it (e.g. offline_cmds, the offline scene rig_benchmarks runs on).
+
+    For example:
+        import nurbCtrls, cmds_profiler
+        cmds_profiler.enable()
+        nurbCtrls.nurbDiamond()
+        cmds_profiler.disable()
+        print(cmds_profiler.report())'''
+
+import contextlib
+import json
+import sys
+import time
+import types
+
+# Tool modules patched by enable() when no modules are given (those already imported). scene_cache runs the
+# queries the tools make through it, op_recorder applies their recorded edits, and name_allocator indexes names for them.
+TOOL_MODULES = ("nurbCtrls", "ik_limb_gui", "create_group", "scene_cache", "rest_pose", "op_recorder", "name_allocator")
+
+# Recorded calls: command -> list of durations, and (tool, command) -> call count.
+_durations = {}
+_toolCounts = {}
+
+# Tool functions currently running, outermost first, and the recording tools of planned commands being applied.
+_toolStack = []
+_replaying = []
+
+# Patched modules: module -> (original cmds, {function name: original function}).
+_patched = {}
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class ProfiledCmds(object):
+    ''' Proxy for a cmds module which records the duration and calling tool of every command run through it'''
+
+    def __init__(self, cmds):
+        self._cmds = cmds
+        self._wrapped = {}
+
+    def __getattr__(self, command):
+        if command not in self._wrapped:
+            self._wrapped[command] = _profiledCommand(command, getattr(self._cmds, command))
+        return self._wrapped[command]
+
+
+def _profiledCommand(command, func):
+    ''' wrap a cmds command to record its duration against the current outermost tool function'''
+
+    def profiled(*args, **kwargs):
+        start = _clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _durations.setdefault(command, []).append(_clock() - start)
+            key = (_currentTool() or "<none>", command)
+            _toolCounts[key] = _toolCounts.get(key, 0) + 1
+
+    profiled.__name__ = command
+    return profiled
+
+
+def _currentTool():
+    ''' the tool commands are attributed to right now: the recorder of a planned command being applied, or else
+        the outermost tool function running'''
+
+    if _replaying:
+        return _replaying[-1]
+    return _toolStack[0] if _toolStack else None
+
+
+@contextlib.contextmanager
+def _replay(tool):
+    ''' op_recorder.replayHook: attribute the commands applied inside to the tool that recorded them'''
+
+    _replaying.append(tool)
+    try:
+        yield
+    finally:
+        _replaying.pop()
+
+
+def _trackedTool(name, func):
+    ''' wrap a tool function so commands run beneath it are attributed to it (when it is the outermost tool call)'''
+
+    def tracked(*args, **kwargs):
+        _toolStack.append(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _toolStack.pop()
+
+    tracked.__name__ = func.__name__
+    tracked.__doc__ = func.__doc__
+    return tracked
+
+
+def enable(*modules):
+    ''' Start profiling the given tool modules (default: whichever of TOOL_MODULES are imported)
+
+        On Exit:
+        Each module's cmds is a ProfiledCmds proxy and its public functions are tracked, until disable() is called.
+        If op_recorder is among them, planned commands are attributed to the tool that recorded them.'''
+
+    if not modules:
+        modules = [sys.modules[name] for name in TOOL_MODULES if name in sys.modules]
+
+    for module in modules:
+        if module in _patched:
+            continue
+
+        if module.__name__ == "op_recorder":
+            module.recordHook = _currentTool
+            module.replayHook = _replay
+
+        # Private helpers aren't tools: they run beneath the public functions that are.
+        originals = {}
+        for name, func in list(vars(module).items()):
+            if isinstance(func, types.FunctionType) and func.__module__ == module.__name__ and not name.startswith("_"):
+                originals[name] = func
+                setattr(module, name, _trackedTool("%s.%s" % (module.__name__, name), func))
+
+        _patched[module] = (module.cmds, originals)
+        module.cmds = ProfiledCmds(module.cmds)
+
+
+def disable():
+    ''' Stop profiling: restore every patched module's cmds and functions. Recorded calls are kept for report().'''
+
+    for module, (cmds, originals) in _patched.items():
+        if module.__name__ == "op_recorder":
+            module.recordHook = None
+            module.replayHook = None
+        module.cmds = cmds
+        for name, func in originals.items():
+            setattr(module, name, func)
+
+    _patched.clear()
+
+
+def reset():
+    ''' Discard all recorded calls'''
+
+    _durations.clear()
+    _toolCounts.clear()
+
+
+def stats():
+    ''' Summary of recorded calls
+
+        On Exit:
+        Returns a list of dicts, one per command, slowest total first:
+        {"command", "calls", "total", "p95", "tools" : {tool : calls}}, times in seconds.'''
+
+    rows = []
+
+    for command, durations in _durations.items():
+        ordered = sorted(durations)
+        tools = dict((tool, count) for (tool, cmd), count in _toolCounts.items() if cmd == command)
+        rows.append({"command" : command,
+                     "calls" : len(ordered),
+                     "total" : sum(ordered),
+                     "p95" : ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                     "tools" : tools})
+
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    return rows
+
+
+def report(asJson=False):
+    ''' Recorded calls as a text table (or JSON), slowest total first, with the tool that issued most of each command'''
+
+    rows = stats()
+
+    if asJson:
+        return json.dumps(rows, indent=4, sort_keys=True)
+
+    lines = ["%-20s %9s %12s %10s  %s" % ("command", "calls", "total ms", "p95 ms", "top tool (calls)")]
+    for row in rows:
+        tool, calls = max(row["tools"].items(), key=lambda item: item[1])
+        lines.append("%-20s %9i %12.3f %10.4f  %s (%i)" % (row["command"], row["calls"], row["total"] * 1000, row["p95"] * 1000, tool, calls))
+
+    return "\n".join(lines)
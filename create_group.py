@@ -1,15 +1,15 @@
 import maya.cmds as cmds
-from utility_pm import snap_a_to_b  # Utility_pm written by Anarygyros Sarafopoulos
-from utility_pm import aim_pivots
+from name_allocator import NameAllocator
+from op_recorder import OperationRecorder
 
 def makeGrpFunc(*pArgs):
 
-    '''create a parent group to offset trans/rot/scale values of selected obj. Primarily for zeroing out animation controls.
+    '''create a parent group to offset trans/rot/scale values of selected objs. Primarily for zeroing out animation controls.
 
         On Exit: 
-        Group will be created with the same translation, rotation and scale values as the selected object.
+        Group will be created with the same translation, rotation and scale values as each selected object.
         Object will be parented to the group, and (if applicable) the group re-parented to what the original object was parented to.
-        Selected object's channel attributes freed up. 
+        Selected objects' channel attributes freed up. 
         Best used as shelf item.
      
      For example:
@@ -19,30 +19,65 @@ def makeGrpFunc(*pArgs):
         'pCube1'
         -> 'pCube2_offsetGrp'
         ---> 'pCube2'''
-    
-    # Boolean marker to note if selected object had a non-world parent.
-    parentCheck = False
 
-    # Save selected object in var,  
-    selected = cmds.ls(selection=True)
+    makeOffsetGrps(cmds.ls(selection=True))
 
-    # Check to see if object is parented to non-world parent.
-    if cmds.listRelatives(p=True) != None:                       # List will evaluate to 'None' if the world is the parent.
-        returnLoc = cmds.listRelatives(p=True)                   # Variable to hold where to parent the offsetGrp back to to return things back to position.
-        parentCheck = True
 
-    # Deselect everything so group is created at world origin
-    cmds.select(d=True)
-    grp = cmds.group(em=True)
+def makeOffsetGrps(objects, suffixes=("_offsetGrp",), ops=None):
 
-    # Lecturer-provided utility scripts, matching group to selected obj's translations etc. Parent selected obj to the grp.
-    snap_a_to_b(grp, selected[0]) 
-    aim_pivots(selected[0], grp)
-    cmds.parent(selected[0], grp)
+    '''create a stack of offset groups above each given object, zeroing out its channels.
 
-    # If selected obj was originally a child, parent the offsetGrp back to that location
-    if parentCheck == True:
-        cmds.parent(grp, "%s" % returnLoc[0])
+        objects : transforms to zero out, in any order. Objects nested under each other are handled.
+        suffixes : one group is created per suffix, outermost first, e.g. ("_offsetGrp", "_sdkGrp") gives
+                   'pCube1_offsetGrp' -> 'pCube1_sdkGrp' -> 'pCube1'
+        ops : OperationRecorder to record the edits into, for the caller to commit. By default they are committed
+              straight away.
 
-    # And give the group a rename to "[selected_obj]_offsetGrp"
-    cmds.rename(grp, "%s" % selected[0] +"_offsetGrp")
\ No newline at end of file
+        On Exit:
+        Every object is parented under its group stack, which sits where the object used to be in the hierarchy
+        and matches its world matrix and pivot. All done in a single undo chunk, without touching the selection.
+        Returns a list of the created group names per object, outermost first, in the order objects were given.'''
+
+    if not objects or not suffixes:
+        return []
+
+    # Full paths give every object's parent without a listRelatives per object.
+    paths = cmds.ls(objects, long=True)
+
+    # Read all world matrices and pivots before the hierarchy changes.
+    matrices = [cmds.getAttr("%s.worldMatrix[0]" % path) for path in paths]
+    pivots = [cmds.xform(path, q=True, worldSpace=True, rotatePivot=True) for path in paths]
+
+    # Deepest objects first: reparenting an object only renames the paths below it, which are already done by then.
+    order = sorted(range(len(paths)), key=lambda i: paths[i].count("|"), reverse=True)
+    groups = [None] * len(paths)
+    names = NameAllocator(indexScene=True)
+    recorder = ops or OperationRecorder()
+
+    for i in order:
+        parentPath, name = paths[i].rsplit("|", 1)
+        stack = []
+
+        # Each group of the stack is created under the previous one (or the object's parent), so only the outermost
+        # needs its transform set: the rest inherit it with identity local values.
+        for suffix in suffixes:
+            # createNode rather than group, as group selects what it makes.
+            if parentPath:
+                grp = recorder.createNode("transform", n=names.allocate("%s" % name + suffix), p=parentPath)
+            else:
+                grp = recorder.createNode("transform", n=names.allocate("%s" % name + suffix))
+            parentPath = "%s|%s" % (parentPath, grp)
+            stack.append(grp)
+
+            if len(stack) == 1:
+                recorder.xform(parentPath, worldSpace=True, matrix=matrices[i])
+                if [round(v, 6) for v in pivots[i]] != [round(v, 6) for v in matrices[i][12:15]]:
+                    recorder.xform(parentPath, worldSpace=True, pivots=pivots[i])
+
+        recorder.parent(paths[i], parentPath)
+        groups[i] = stack
+
+    if ops is None:
+        recorder.commit(chunkName="makeOffsetGrps")
+
+    return groups
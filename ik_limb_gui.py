@@ -1,6 +1,20 @@
 import maya.cmds as cmds
 import functools
-import ik_stretchy_joints_pm as sj          # Script written by Anargyros Sarafopoulos
+import json
+import rest_pose
+from name_allocator import NameAllocator
+from op_recorder import OperationRecorder
+from scene_cache import scoped, sharedCache
+
+# Rig spec limb settings that name nodes in the scene, see buildLimbs.
+LIMB_SPEC_NODES = ("startJoint", "endJoint", "poleControl", "settingsControl", "resultJoint")
+
+# Settings control attributes: the stretch toggle, and the stretch network fingerprints (see updateStretchSwitch).
+STRETCH_TOGGLE_ATTR = "ikStretchToggle"
+STRETCH_NETWORK_ATTR = "stretchToggleNetworks"
+
+# Suffix of the blendColors nodes stretchSwitch creates, after the (first) joint they drive.
+STRETCH_NODE_SUFFIX = "_stretchToggle_blendColors"
 
 def limbGUI():
     '''GUI window for limb setup'''
@@ -45,9 +59,17 @@ def limbGUI():
     cmds.text(label="Result Ankle Joint:")
     cmds.textField("resultJoint")
     cmds.button(label="Select", command=functools.partial(updateTexField, "resultJoint"))
+
+    cmds.text(label="Stretch Toggle Nodes:")
+    cmds.checkBox("packedStretch", label="Pack joints into one blendColors node", value=False)
+    cmds.separator(visible = False)
+
+    cmds.text(label="Rest Pose:")
+    cmds.button(label="Snapshot Selected Skeleton (or All Joints)", command=functools.partial(rest_pose.snapshotSelected))
+    cmds.button(label="Diff", command=functools.partial(rest_pose.reportPoseDiff))
             
     cmds.button(label="Close", command=functools.partial(closeWindow,myWin))
-    cmds.separator(visible = False)
+    cmds.button(label="Save to Rig Spec...", command=functools.partial(saveSpec))
     cmds.button(label="Apply", command=functools.partial(toolFunction, "startJoint", "endJoint", "kneeElbowControl", "gScaleObj", "gScaleName", "ikHandName", "limbSettingsCtrl", "resultJoint"))
     
     cmds.showWindow(myWin)
@@ -55,7 +77,7 @@ def limbGUI():
     
 def toolFunction(*pArgs):
 
-    ''' main function block, call to all other functions within this block
+    ''' main function block: turn the GUI fields into a one-limb rig spec and build it
     
         On Exit:
             3-joint stretchy pole vector IK setup created
@@ -64,71 +86,370 @@ def toolFunction(*pArgs):
             '''
     
     currentlySelected = cmds.ls(selection = True)
+
+    buildLimbs(limbSpecFromGUI())
+    
+    # Re-select what was originally selected.
+    cmds.select(currentlySelected)
+
+
+def saveSpec(*pArgs):
+    ''' Append the limb in the GUI fields to a rig spec file (created if it doesn't exist), for headless rebuilds'''
+
+    path = cmds.fileDialog2(fileFilter="Rig Spec (*.json)", dialogStyle=2, fileMode=0)
+    if not path:
+        return
+
+    try:
+        spec = loadLimbSpec(path[0])
+    except IOError:
+        spec = {"limbs" : []}
+
+    spec["limbs"] += limbSpecFromGUI()["limbs"]
+
+    specFile = open(path[0], "w")
+    try:
+        json.dump(spec, specFile, indent=4, sort_keys=True)
+    finally:
+        specFile.close()
+
+
+def limbSpecFromGUI():
+    ''' Query text from all the GUI text windows into a rig spec holding a single limb (see buildLimbs)'''
+
+    return {"limbs" : [{"startJoint" : cmds.textField("startJoint", q=True, text=True),
+                        "endJoint" : cmds.textField("endJoint", q=True, text=True),
+                        "poleControl" : cmds.textField("kneeElbowControl", q=True, text=True),
+                        "globalScale" : "%s.%s" % (cmds.textField("gScaleObj", q=True, text=True), cmds.optionMenu("gScaleName", q=True, v=True)),
+                        "prefix" : cmds.textField("ikHandleName", q=True, text=True),
+                        "settingsControl" : cmds.textField("limbSettingsCtrl", q=True, text=True),
+                        "resultJoint" : cmds.textField("resultJoint", q=True, text=True),
+                        "packed" : cmds.checkBox("packedStretch", q=True, value=True)}]}
+
+
+def loadLimbSpec(path):
+    ''' Read a rig spec from a .json file (or .toml, where a TOML reader is available)'''
+
+    if path.endswith(".toml"):
+        import tomllib              # Python 3.11+, not available in every Maya
+        specFile = open(path, "rb")
+        try:
+            return tomllib.load(specFile)
+        finally:
+            specFile.close()
+
+    specFile = open(path)
+    try:
+        return json.load(specFile)
+    finally:
+        specFile.close()
+
+
+def buildLimbsFromFile(path):
+    ''' Headless entry point: build every limb listed in a rig spec file, see buildLimbs'''
+
+    return buildLimbs(loadLimbSpec(path))
+
+
+def validateLimbSpec(spec):
+    ''' Check a rig spec's limbs have every setting, and that every node they reference exists (one ls for all of them)
     
-    # Query text from all the GUI text windows. 
+        On Exit:
+            Raises ValueError listing every problem found, so nothing is built from a broken spec.'''
+
+    problems = []
+    nodes = []
+
+    for i, limb in enumerate(spec.get("limbs", [])):
+        missingKeys = [key for key in LIMB_SPEC_NODES + ("globalScale",) if not limb.get(key)]
+        # An empty prefix is valid (the GUI's first preset builds "ikHandle"), it only has to be given.
+        if "prefix" not in limb:
+            missingKeys.append("prefix")
+        if missingKeys:
+            problems.append("limb %i is missing %s" % (i, ", ".join(missingKeys)))
+        else:
+            nodes += [limb[key] for key in LIMB_SPEC_NODES] + [limb["globalScale"].split(".")[0]]
 
-    sjString = cmds.textField("startJoint", q=True, text=True)
-    ejString = cmds.textField("endJoint", q=True, text=True)
-    kejString = cmds.textField("kneeElbowControl", q=True, text=True)
-    gsoString = cmds.textField("gScaleObj", q=True, text=True)
-    gsnString = cmds.optionMenu("gScaleName", q=True, v=True)
-    ikhString = (cmds.textField("ikHandleName", q=True, text=True) + "ikHandle")
-    limbSetString = cmds.textField("limbSettingsCtrl", q=True, text=True)
-    resultString = cmds.textField("resultJoint", q=True, text=True)
+    found = set(cmds.ls(nodes)) if nodes else set()
+    missingNodes = sorted(set(node for node in nodes if node not in found and node.split("|")[-1] not in found))
+    if missingNodes:
+        problems.append("nodes not found: %s" % ", ".join(missingNodes))
 
-    cmds.ikHandle(sj = sjString, ee = ejString, n=ikhString)
+    if problems:
+        raise ValueError("Invalid rig spec: %s" % "; ".join(problems))
+
+
+@scoped
+def buildLimbs(spec):
+    ''' Build every limb of a rig spec in a single undo chunk, with viewport refresh suspended
+    
+        spec : {"limbs" : [limb, ...]}, each limb a dict of
+            startJoint, endJoint : start and end joints of the IK chain
+            poleControl : knee/elbow control the chain is locked to
+            globalScale : global scale plug, e.g. "main_ctrl.globalScale"
+            prefix : IK handle prefix, e.g. "l_Arm_", or "" for none
+            settingsControl : control to hold the stretch toggle
+            resultJoint : result chain joint matching the end of the IK chain
+            packed : (optional) pack stretch toggles into shared blendColors channels, see stretchSwitch
+        
+        On Exit:
+            Every limb built as toolFunction would. Returns the IK handle names, in spec order.
+            Only ikHandle and the lecturer's stretchy_ik can change the selection: toolFunction restores it.
+            The stretch toggle networks of every limb are committed together, once all IK setups are built.
+            Rest lengths come from the rest pose snapshot (see rest_pose), which is taken of every joint first
+            if the scene has none, so it records the pose the limbs are built in.'''
+
+    validateLimbSpec(spec)
+    names = NameAllocator(indexScene=True)
+    ops = OperationRecorder()
+    handles = []
+    restPose = rest_pose.readRestPose() or rest_pose.snapshotRestPose(ops=ops)
+
+    cmds.undoInfo(openChunk=True, chunkName="buildLimbs")
+    cmds.refresh(suspend=True)
+    try:
+        for limb in spec["limbs"]:
+            handles.append(buildLimb(limb, names, ops, restPose))
+        ops.commit(chunkName="stretchSwitch")
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+
+    return handles
+
+
+def buildLimb(limb, names=None, ops=None, restPose=None):
+    ''' Build one limb from its spec entry (see buildLimbs), returning the IK handle name.
+        names : NameAllocator shared by the limbs of a spec, see stretchSwitch
+        ops : OperationRecorder the stretch toggle network is recorded into, see stretchSwitch
+        restPose : rest pose snapshot shared by the limbs of a spec, see stretchSwitch'''
+
+    if names is None:
+        names = NameAllocator()
+
+    ikhString = names.allocate(limb["prefix"] + "ikHandle")
+    cmds.ikHandle(sj = limb["startJoint"], ee = limb["endJoint"], n=ikhString)
 
     # Lecturer script creates the ik setup for the limb, including elbow/knee lock.
-    stretchIK = sj.stretchy_ik(ikhString, global_scale = gsoString + "." + gsnString, axis = "x")
-    stretchIK.lock_joint(kejString)
+    # Imported on first use, so opening the tool (or building the shelf) doesn't pay for it.
+    import ik_stretchy_joints_pm as sj          # Script written by Anargyros Sarafopoulos
+    stretchIK = sj.stretchy_ik(ikhString, global_scale = limb["globalScale"], axis = "x")
+    stretchIK.lock_joint(limb["poleControl"])
     
     # Additional functionality added by me to add toggle to turn off ik stretching.
-    stretchSwitch(resultString, limbSetString)
-    
-    # Re-select what was originally selected.
-    cmds.select(currentlySelected)
+    stretchSwitch(limb["resultJoint"], limb["settingsControl"], packed=limb.get("packed", False), names=names, ops=ops, restPose=restPose)
+
+    return ikhString
+
     
-def stretchSwitch(jointName, IKSettingCtrl, *pArgs):
+def stretchSwitch(jointName, IKSettingCtrl, packed=False, names=None, ops=None, restPose=None):
 
     ''' In a stretchy IK limb setup, establish attribute to limit stretch function on IK control
     
         jointname : name of the end joint of the result chain that corresponds to the end of the IK chain.
         IKSettingCtrl : nurbsShape/Geometry used to hold IK toggle settings.
+        packed : share blendColors nodes between joints, one joint per R/G/B channel (one node per limb instead of one per joint).
+        names : NameAllocator to name the blendColors nodes from, batch callers share one so the scene is only indexed once.
+        ops : OperationRecorder to record the edits into, for the caller to commit. By default they are committed straight away.
+        restPose : rest pose snapshot to take rest lengths from (see rest_pose.readRestPose), read from the scene by default.
+            Joints it doesn't cover use their current translateX, so a posed or stretched limb needs a snapshot.
         
         On Exit:
-            Additional attribute on IKSettingCtrl which allows toggling IK stretch on/off.'''
+            Additional attribute on IKSettingCtrl which allows toggling IK stretch on/off.
+            Safe to re-run: an existing network is only patched where it differs, see updateStretchSwitch.
+            Returns the limb's blendColors nodes.'''
+
+    return updateStretchSwitch(jointName, IKSettingCtrl, packed, names, ops, restPose)["nodes"]
+
+
+@scoped
+def updateStretchSwitch(jointName, IKSettingCtrl, packed=False, names=None, ops=None, restPose=None):
+    ''' Build a limb's stretch toggle network (see stretchSwitch), or patch an existing one to match
+
+        Each limb's network (joints, channels, stretch source plugs and rest lengths) is fingerprinted onto
+        IKSettingCtrl, so a re-run knows the rest lengths of joints the network already drives. The live graph is
+        compared against that, and only missing nodes, connections and values are added; nodes the limb no longer
+        needs (e.g. after switching packed) are removed. Re-running on an unchanged limb changes nothing.
+        Rest lengths in the rest pose snapshot take precedence over the fingerprint, so a new snapshot corrects them.
+
+        On Exit:
+            Returns {"nodes" : the limb's blendColors nodes,
+                     "added" : nodes and attributes created,
+                     "removed" : nodes deleted,
+                     "reconnected" : plugs reconnected, disconnected or reset}
+            "added", "removed" and "reconnected" are empty when the network was already up to date.
+            With ops, the changes are only recorded, and happen once the caller commits it.'''
+
+    changes = {"added" : [], "removed" : [], "reconnected" : []}
+    recorder = ops or OperationRecorder()
+    toggle = "%s.%s" % (IKSettingCtrl, STRETCH_TOGGLE_ATTR)
+    if restPose is None:
+        restPose = rest_pose.readRestPose(ops=recorder)
 
     # Stretch achieved with translation of latter 2 ik joints in 3 joint ik chain. 
     # To establish toggle, the corresponding joints in the result chain are needed.
     # Blend colour nodes used to hold the stretched and default lengths to swap between.     
-    cmds.select("%s" % jointName)
-    cmds.select(cmds.listRelatives(type="joint", parent=True), add=True)
-    jList = cmds.ls(selection=True)                                            
-    
-    cmds.addAttr(IKSettingCtrl, longName = "ikStretchToggle", niceName = "IK Stretch Toggle", attributeType = "float", min = 0, max = 1, dv = 0, keyable=True)
-    
-    for i in range(len(jList)):
-        
-        # Cleanup if already exists
-        if cmds.objExists("%s" % jList[i] + "_stretchToggle_blendColors"):            
-            cmds.delete("%s" % jList[i] + "_stretchToggle_blendColors")
-            
+    jList = [jointName] + (sharedCache().listRelatives(jointName, type="joint", parent=True) or [])
 
-        # First 3 unitConversion nodes will be the translate X, Y, Z attrs. Next 3 are the rotate X, Y, Z. Only after Translate X.
-        cmds.select(jList[i])
-        connectList = cmds.listConnections(destination=False, plugs=True, type = "unitConversion")
+    fingerprints = _stretchFingerprints(IKSettingCtrl, recorder)
+    previous = fingerprints.get(jointName, {"packed" : packed, "nodes" : []})
+    previousChannels = dict((joint, (source, rest)) for node, channels in previous["nodes"] for joint, channel, source, rest in channels)
 
-        # Creating BlendColour node for the limb stretch toggle
-        colourNode = cmds.createNode("blendColors", n="%s" % jList[i] + "_stretchToggle_blendColors") 
+    inputs = {}
+    def liveInputs(node):
+        if node not in inputs:
+            inputs[node] = _connectedPlugs(node, source=True)
+        return inputs[node]
 
-        # Get length of joint at resting position
-        jLength = cmds.getAttr("%s.translateX" % jList[i])                                                    
-        
-        # Setup and connect stretch and non-stretch values to blend node, and connect the toggle to the blendColour node.
-        cmds.setAttr("%s" % colourNode + ".color1R", jLength)                                                        
-        cmds.connectAttr("%s" % connectList[0] , "%s" %  colourNode + ".color2.color2R", force=True)
-        cmds.connectAttr("%s" % IKSettingCtrl + ".ikStretchToggle", "%s" % colourNode + ".blender", force=True)
-        cmds.connectAttr("%s" % colourNode + ".output.outputR", jList[i] + ".translate.translateX", force=True)
+    # Work out every joint's stretch source and rest length before changing anything.
+    # Rest lengths come from the rest pose snapshot where it has the joint. Otherwise, joints already driven by a
+    # stretch toggle node read them back from it (and the fingerprint), as their translateX is then the blended
+    # length rather than the rest length.
+    wanted = []
+    for joint in jList:
+        driver = liveInputs(joint).get("translateX")
+        driverNode = driver.split(".")[0] if driver else None
+        rest = restPose[joint]["translate"][0] if joint in restPose else None
+
+        if driverNode and driverNode.rstrip("0123456789").endswith(STRETCH_NODE_SUFFIX):
+            channel = driver.split(".")[-1][-1]
+            source, previousRest = previousChannels.get(joint, (None, None))
+            source = liveInputs(driverNode).get("color2" + channel) or source
+            if rest is None:
+                rest = previousRest if previousRest is not None else cmds.getAttr("%s.color1%s" % (driverNode, channel))
+        elif driver or joint not in previousChannels:
+            driverNode = None
+            # First 3 unitConversion nodes will be the translate X, Y, Z attrs. Next 3 are the rotate X, Y, Z. Only after Translate X.
+            source = driver or sharedCache().listConnections(joint, destination=False, plugs=True, type = "unitConversion")[0]
+            if rest is None:
+                rest = cmds.getAttr("%s.translateX" % joint)
+        else:
+            # Its toggle node was deleted, taking the stretch connection with it: rebuild from the fingerprint.
+            driverNode = None
+            source, previousRest = previousChannels[joint]
+            if rest is None:
+                rest = previousRest
+
+        wanted.append((joint, driverNode, source, round(rest, 6)))
+
+    if not recorder.objExists(toggle):
+        recorder.addAttr(IKSettingCtrl, longName = STRETCH_TOGGLE_ATTR, niceName = "IK Stretch Toggle", attributeType = "float", min = 0, max = 1, dv = 0, keyable=True)
+        changes["added"].append(toggle)
+
+    # Each group of joints shares one blendColors node, each joint using its own channel.
+    # Packed nodes are named after the first joint of their group.
+    groupSize = 3 if packed else 1
+    named = set(cmds.ls(["%s" % joint + STRETCH_NODE_SUFFIX for joint in jList]) or [])
+    colourNodes = []
+    network = []
+
+    for first in range(0, len(jList), groupSize):
+        group = wanted[first:first + groupSize]
+
+        # Reuse the node already driving the group's first joint, or the one named after it.
+        colourNode = group[0][1] or ("%s" % jList[first] + STRETCH_NODE_SUFFIX if "%s" % jList[first] + STRETCH_NODE_SUFFIX in named else None)
+        created = colourNode is None or colourNode in colourNodes
+        if created:
+            if names is None:
+                names = NameAllocator()
+            colourNode = recorder.createNode("blendColors", n=names.allocate("%s" % jList[first] + STRETCH_NODE_SUFFIX))
+            changes["added"].append(colourNode)
+        colourNodes.append(colourNode)
+
+        nodeInputs = {} if created else liveInputs(colourNode)
+        nodeOutputs = {} if created else _connectedPlugs(colourNode, source=False)
+        patched = []
+
+        if not _samePlug(nodeInputs.get("blender"), toggle):
+            recorder.connectAttr(toggle, "%s" % colourNode + ".blender", force=True)
+            patched.append("%s" % colourNode + ".blender")
+
+        channels = []
+        for (joint, driverNode, source, rest), channel in zip(group, "RGB"):
+            # Setup and connect stretch and non-stretch values to blend node, and connect the blendColour node to the joint.
+            if created or round(cmds.getAttr("%s" % colourNode + ".color1" + channel), 6) != rest:
+                recorder.setAttr("%s" % colourNode + ".color1" + channel, rest)
+                patched.append("%s" % colourNode + ".color1" + channel)
+            if not _samePlug(nodeInputs.get("color2" + channel), source):
+                recorder.connectAttr("%s" % source, "%s" % colourNode + ".color2.color2" + channel, force=True)
+                patched.append("%s" % colourNode + ".color2" + channel)
+            if not any(_samePlug(destination, joint + ".translateX") for destination in nodeOutputs.get("output" + channel, [])):
+                recorder.connectAttr("%s" % colourNode + ".output.output" + channel, joint + ".translate.translateX", force=True)
+                patched.append(joint + ".translateX")
+            channels.append([joint, channel, source, rest])
+
+        # Channels left over from a bigger group (e.g. packed before) are cut loose.
+        for channel in "RGB"[len(group):]:
+            if nodeInputs.get("color2" + channel):
+                recorder.disconnectAttr(nodeInputs["color2" + channel], "%s" % colourNode + ".color2.color2" + channel)
+                patched.append("%s" % colourNode + ".color2" + channel)
+            for destination in nodeOutputs.get("output" + channel, []):
+                recorder.disconnectAttr("%s" % colourNode + ".output.output" + channel, destination)
+                patched.append(destination)
+
+        if not created:
+            changes["reconnected"].extend(patched)
+        network.append([colourNode, channels])
+
+    # Nodes that drove these joints, or belonged to the limb last time, but are no longer needed.
+    stale = (named | set(node for node, channels in previous["nodes"]) | set(driverNode for joint, driverNode, source, rest in wanted if driverNode)) - set(colourNodes)
+    stale = cmds.ls(sorted(stale)) if stale else []
+    if stale:
+        recorder.delete(stale)
+        changes["removed"].extend(stale)
+        if names is not None:
+            names.release(*stale)
+
+    fingerprint = {"packed" : packed, "nodes" : network}
+    if fingerprint != previous:
+        fingerprints[jointName] = fingerprint
+        _storeStretchFingerprints(IKSettingCtrl, fingerprints, recorder)
+
+    if ops is None:
+        recorder.commit(chunkName="stretchSwitch")
+
+    changes["nodes"] = colourNodes
+    return changes
+
+
+def _connectedPlugs(node, source=True):
+    ''' node's incoming connections as {attribute : source plug} (source=True),
+        or its outgoing ones as {attribute : [destination plugs]} (source=False), from one listConnections.
+        Attributes are keyed by their leaf name, e.g. "color2R" for "node.color2.color2R".'''
+
+    pairs = sharedCache().listConnections(node, source=source, destination=not source, connections=True, plugs=True) or []
+    connected = {}
+    for mine, other in zip(pairs[::2], pairs[1::2]):
+        if source:
+            connected[mine.split(".")[-1]] = other
+        else:
+            connected.setdefault(mine.split(".")[-1], []).append(other)
+    return connected
+
+
+def _samePlug(plug, other):
+    ''' True if two plug names are the same node and attribute ("node.translate.translateX" == "node.translateX")'''
+
+    return plug is not None and plug.split(".")[0] == other.split(".")[0] and plug.split(".")[-1] == other.split(".")[-1]
+
+
+def _stretchFingerprints(IKSettingCtrl, recorder):
+    ''' stretch toggle network fingerprints stored on a settings control, {end joint : network}, see updateStretchSwitch.
+        Read through the recorder, so fingerprints of limbs recorded but not yet committed are included.'''
+
+    plug = "%s.%s" % (IKSettingCtrl, STRETCH_NETWORK_ATTR)
+    if not recorder.objExists(plug):
+        return {}
+    return json.loads(recorder.getAttr(plug) or "{}")
+
+
+def _storeStretchFingerprints(IKSettingCtrl, fingerprints, recorder):
+    ''' record writing the stretch toggle network fingerprints to a settings control, adding the attribute if needed'''
+
+    plug = "%s.%s" % (IKSettingCtrl, STRETCH_NETWORK_ATTR)
+    if not recorder.objExists(plug):
+        recorder.addAttr(IKSettingCtrl, longName = STRETCH_NETWORK_ATTR, dataType = "string")
+    recorder.setAttr(plug, json.dumps(fingerprints, sort_keys=True), type="string")
         
           
 def closeWindow(myWin, *pArgs ):
@@ -147,7 +468,7 @@ def updateTexField(currentTextField, *pArgs):
 
     list = cmds.ls(selection = True)
     if len(list) == 0:
-        print "Error: No object selected"
+        print("Error: No object selected")
     else:    
         cmds.textField("%s" % currentTextField, edit=True, tx="%s" % list[0])
         
@@ -173,16 +494,15 @@ def updateDropDown(gScaleObj, dropdown, *pArgs):
 
     # Text field to update with dropdown text              
     updateString = cmds.textField("gScaleObj", q=True, text=True)
-    cmds.select(updateString)
-
-    userAttrs = cmds.listAttr(ud=True)
+    userAttrs = sharedCache().listAttr(updateString, ud=True)
 
     if userAttrs == None:
-        print "No user defined attributes."
+        print("No user defined attributes.")
     else:
-        print "User defined attributes detected."
+        print("User defined attributes detected.")
         for i in range(len(userAttrs)):
             cmds.menuItem( label="%s" % userAttrs[i], p = dropdown)
-        
 
-limbGUI()
\ No newline at end of file
+
+if __name__ == "__main__":
+    limbGUI()
@@ -0,0 +1,87 @@
+''' Clash-free node names for the rigging tools, handed out without asking Maya to resolve collisions.
+
+    Creating or renaming a node onto a taken name makes Maya search the scene for the next free number,
+    per node, and the result depends on whatever happens to be in the scene ("nurbsDiamond1Ctrl7").
+    A NameAllocator knows which names are taken, so every name it hands out is free and predictable:
+    the requested name if nobody has it, otherwise the same Maya-style increment (foo1 -> foo2).
+
+    By default each candidate name is checked on its own (one objExists), which suits a tool making a node or two.
+    Batch tools handing out many names from one allocator index the whole scene up front instead, with
+    NameAllocator(indexScene=True).
+
+    For example:
+        names = NameAllocator()
+        ctrl = cmds.createNode("transform", n=names.allocate("nurbsCube1"))
+        shape = cmds.createNode("nurbsCurve", n=names.allocate(ctrl + "Shape"), p=ctrl)     # "nurbsCube1Shape"
+        shape = cmds.createNode("nurbsCurve", n=names.allocate(ctrl + "Shape"), p=ctrl)     # "nurbsCube1Shape1"'''
+
+import maya.cmds as cmds
+
+# Taken numbers a per-name allocator checks one objExists at a time, before listing the rest of that base's names
+# with a single ls instead (a long run such as nurbsCube1...nurbsCube500).
+PROBE_LIMIT = 8
+
+
+class NameAllocator(object):
+    ''' Index of the names in use, handing out free names and recording them as taken
+
+        names : names already in use. By default the scene is asked about each candidate name as it comes up.
+        indexScene : index every node in the scene up front (one ls call), for allocators shared by a batch'''
+
+    def __init__(self, names=None, indexScene=False):
+        if names is None and indexScene:
+            names = cmds.ls() or []
+        self.taken = set(name.split("|")[-1] for name in names or [])
+
+        # Base names whose scene names have all been listed, or None when the index was given or built up front.
+        self._indexed = set() if names is None else None
+        # Names released while checking per name: free, even though their nodes may still be in the scene.
+        self._released = set()
+
+        # Next number to try per base name, so repeated clashes on a base don't rescan the numbers already handed out.
+        self._next = {}
+
+    def allocate(self, name):
+        ''' name if it is free, otherwise the next free numbered name with the same base (e.g. "foo1" -> "foo2",
+            "fooShape" -> "fooShape1"). The returned name is taken from then on.'''
+
+        base = name.rstrip("0123456789")
+        if not self._inUse(name, base):
+            self.taken.add(name)
+            return name
+
+        number = max(int(name[len(base):] or 0) + 1, self._next.get(base, 1))
+        probes = 0
+        while self._inUse("%s%i" % (base, number), base):
+            number += 1
+            probes += 1
+            if probes == PROBE_LIMIT and self._indexed is not None:
+                self._indexed.add(base)
+                self.taken.update(node for node in (node.split("|")[-1] for node in cmds.ls(base + "*") or [])
+                                  if node not in self._released)
+
+        self._next[base] = number + 1
+        name = "%s%i" % (base, number)
+        self.taken.add(name)
+        return name
+
+    def release(self, *names):
+        ''' Mark names as free again, e.g. once their nodes are deleted'''
+
+        for name in names:
+            name = name.split("|")[-1]
+            self.taken.discard(name)
+            if self._indexed is not None:
+                self._released.add(name)
+
+    def _inUse(self, name, base):
+        ''' whether name is taken, asking the scene (objExists) only for names the allocator knows nothing about'''
+
+        if name in self.taken:
+            return True
+        if self._indexed is None or base in self._indexed or name in self._released:
+            return False
+        if cmds.objExists(name):
+            self.taken.add(name)
+            return True
+        return False
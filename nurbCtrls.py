@@ -1,5 +1,48 @@
 import maya.cmds as cmds
 import functools
+import array
+import hashlib
+import math
+import mmap
+import struct
+import sys
+
+from name_allocator import NameAllocator
+from op_recorder import OperationRecorder
+from scene_cache import scoped, sharedCache
+
+# Cached shape tables, see shapeLibrary()
+_shapeLibrary = None
+
+# Colour rules for colourByRule, matching ik_limb_gui's l_/r_ presets: left blue, right red (index slider values).
+SIDE_COLOURS = [("l_", 7), ("r_", 14)]
+
+# Colours swapped when mirroring controls to the other side, see mirrorCtrls: index slider values, and the same
+# blue and red as (r, g, b) colours. Colours not in the map are kept.
+SIDE_COLOUR_SWAP = {7 : 14, 14 : 7, (0.0, 0.0, 1.0) : (1.0, 0.0, 0.0), (1.0, 0.0, 0.0) : (0.0, 0.0, 1.0)}
+
+# Curve samples per span simplifyCtrls measures deviation over, and the grid (in scene units) that overlapping
+# curves must match on to count as duplicates.
+SIMPLIFY_SAMPLES = 8
+SIMPLIFY_DUPLICATE_GRID = 1e-4
+
+# Radius of each library shape at unit size (its furthest extent from the origin along an axis), which buildCtrl
+# scales its CVs against to give a control a particular radius. The pyramid's turned side edges reach 0.5 + sqrt(0.5) out.
+SHAPE_RADIUS = {"nurbsCircle" : 1.0, "nurbsSphere" : 1.0, "nurbsSquare" : 0.5, "nurbsCube" : 0.5,
+                "nurbsPyramid" : 0.5 + math.sqrt(0.5), "nurbsDiamond" : 0.5 + math.sqrt(0.5)}
+
+# Auto-sizing (see targetRadii): joint controls span this fraction of their longest bone, and mesh controls sit
+# this much outside the mesh's bounding box.
+AUTO_SIZE_BONE_SCALE = 0.25
+AUTO_SIZE_PADDING = 1.1
+
+# Control shape cache file layout (little-endian), see exportCtrlShapes:
+#   header, one record per shape, shape names (utf-8, padded to 8 bytes), then all knots/CVs as doubles.
+SHAPE_CACHE_MAGIC = b"NCSC"
+SHAPE_CACHE_HEADER = struct.Struct("<4sIIII")              # magic, version, shape count, name bytes, double count
+SHAPE_CACHE_RECORD = struct.Struct("<IIBBBBIIIII3d16s")    # name offset/length, degree, form, override enabled,
+                                                           # RGB mode, colour index, knot start/count, CV start/count,
+                                                           # RGB colour, content hash
 
 
 def createCtrlGUI():
@@ -30,6 +73,27 @@ def createCtrlGUI():
     cmds.button(label="Diamond", command=functools.partial(nurbDiamond), parent = row3, width = 100)
     cmds.separator(style="single", parent = rowColumn)
     cmds.button(label="Select CVs", parent = rowColumn, command=functools.partial(cvSelect))  
+
+    row4 = cmds.rowLayout(numberOfColumns=3, p=rowColumn, cw3=(100,120,80))
+    cmds.text("Batch Shape:", al="left", parent = row4)
+    cmds.optionMenu("batchShape", parent = row4)
+    for shapeType in sorted(shapeLibrary()):
+        cmds.menuItem(shapeType)
+    cmds.checkBox("batchAutoSize", label="Auto Size", value=False, parent = row4)
+    cmds.separator(style="single", parent = rowColumn)
+    cmds.button(label="Ctrl per Selected", parent = rowColumn, command=functools.partial(ctrlPerSelected))
+
+    row5 = cmds.rowLayout(numberOfColumns=2, p=rowColumn, cw2=(150,150))
+    cmds.button(label="Export Shapes...", parent = row5, width = 150, command=functools.partial(shapeCacheDialog, exportCtrlShapes))
+    cmds.button(label="Import Shapes...", parent = row5, width = 150, command=functools.partial(shapeCacheDialog, importCtrlShapes))
+    cmds.separator(style="none", parent = rowColumn)
+    cmds.button(label="Mirror l_ to r_", parent = rowColumn, command=functools.partial(mirrorSelected))
+
+    row6 = cmds.rowLayout(numberOfColumns=2, p=rowColumn, cw2=(150,150))
+    cmds.text("Simplify Tolerance:", al="left", parent = row6)
+    cmds.floatField("simplifyTolerance", parent = row6, value=0.01, minValue=0, precision=4)
+    cmds.separator(style="none", parent = rowColumn)
+    cmds.button(label="Simplify Shapes", parent = rowColumn, command=functools.partial(simplifySelected))
         
     cmds.separator(style="double", parent = rowColumn)  
     cmds.separator(style="double", parent = rowColumn) 
@@ -51,189 +115,430 @@ def createCtrlGUI():
     cmds.colorIndexSliderGrp("index", parent = sliderColumn, min=1, max=32, value=1, h=20)            
     cmds.colorSliderGrp("rgb", parent = sliderColumn, h=1)
     
+    cmds.separator(style="single", parent = rowColumn)
+    cmds.button(label="Colour by Side (l_/r_)", parent = rowColumn, command=functools.partial(colourBySide))
+
+    cmds.separator(style="none", parent = rowColumn)
     cmds.separator(style="single", parent = rowColumn)
     cmds.button(label="Close", command=functools.partial(closeWindow,myWin), parent = rowColumn)
     
     cmds.showWindow(myWin)     
 
 def locator(*pArgs):
-    ''' creates locator and applies universal 'clean' func to it 
+    ''' creates locator, see makeLocator
     
         On Exit: 
-        Locator created at origin with no construction history'''
+        Locator created at origin with no construction history, and selected'''
+
+    cmds.select(makeLocator())
 
-    locator = cmds.spaceLocator()
-    cleanupCtrl("locator1", locator[0])
+
+def makeLocator(name="locator1", names=None):
+    ''' creates a locator without touching the selection
+
+        name : name of the locator transform (incremented on a clash)
+        names : NameAllocator to take names from, see buildCtrl
+
+        On Exit:
+        Locator created at origin, its shape named "<locator>Shape". Returns the name of the locator transform.'''
+
+    if names is None:
+        names = NameAllocator()
+
+    xform = cmds.createNode("transform", n=names.allocate(name), ss=True)
+    cmds.createNode("locator", n=names.allocate("%s" % xform + "Shape"), p=xform, ss=True)
+    return xform
 
 
 def nurbCircle(*pArgs):
-    ''' creates nurbsCircle and applies universal 'clean' func to it  
+    ''' creates nurbsCircle from the shape library  
     
         On Exit: 
         nurbCircle created at origin with no construction history'''
 
-    circleCurve = cmds.circle()
-    cleanupCtrl("nurbsCircle1", circleCurve[0])
+    cmds.select(buildCtrl("nurbsCircle"))
 
     
 def nurbSquare(*pArgs):
-    ''' creates nurbsSquare and applies universal 'clean' func to it  
+    ''' creates nurbsSquare from the shape library  
     
         On Exit: 
         nurbSquare created at origin with no construction history'''
 
-    square = cmds.nurbsSquare()
-    cleanupCtrl("nurbsSquare1", square[0])
+    cmds.select(buildCtrl("nurbsSquare"))
 
 
 def nurbSphere(*pArgs):
-    ''' creates a "nurbsSphere" using 3 nurbsCircles and applies universal 'clean' func to it  
+    ''' creates a "nurbsSphere" (3 nurbsCircles on the XY, XZ and YZ planes) from the shape library  
     
         On Exit: 
         nurbsSphere created at origin as single object with no construction history'''
 
-    circle1 = cmds.circle()
-    circle2 = cmds.circle()
-    cmds.xform(r=True, ro=[90,0,0])
-    circle3 = cmds.circle()
-    cmds.xform(r=True, ro=[0,90,0])
-    
-    freeze(circle1[0], circle2[0], circle3[0])
-    cleanupCtrl("nurbsSphere1", circle1[0], circle2[0], circle3[0])
+    cmds.select(buildCtrl("nurbsSphere"))
 
     
 def nurbCube(*pArgs):
-    ''' creates a "nurbsCube" using 4 nurbsSquares and applies universal 'clean' func to it 
+    ''' creates a "nurbsCube" (4 nurbsSquares, 16 edges) from the shape library 
     
         On Exit: 
         nurbCube created at origin as single object with no construction history'''
 
-    square1 = cmds.nurbsSquare()
-    cmds.xform(r=True, t=[-0.5,0,0], ro=[0,90,0])
-
-    square2 = cmds.nurbsSquare()
-    cmds.xform(r=True, t=[0.5,0,0], ro=[0,-90,0])
-    
-    square3 = cmds.nurbsSquare()
-    cmds.xform(r=True, t=[0,0,-0.5])
-    
-    square4 = cmds.nurbsSquare()
-    cmds.xform(r=True, t=[0,0,0.5])
-    
-    freeze(square1[0], square2[0], square3[0], square4[0])
-    cleanupCtrl("nurbsCube1", square1[0], square2[0], square3[0], square4[0])
+    cmds.select(buildCtrl("nurbsCube"))
 
     
 def nurbPyramid(*pArgs):
-    ''' creates a "nurbsPyramid" using 2 nurbsSquares and applies universal 'clean' func to it 
+    ''' creates a "nurbsPyramid" (2 nurbsSquares, the edges of the first turned about its corners) from the shape library 
     
         On Exit: 
         nurbPyramid created at origin as single object with no construction history'''
-    
-    # The four lists are used to transform and format each edge of a nurbsSquare into the angled 'point' of the pyramid.
-    dirList = ["top", "left", "bottom", "right"]
-    xcoordList = (0.5, 0.5, -0.5, -0.5)
-    zcoordList = (0.5, 0-.5, -0.5, 0.5)
-    pivotList = ([45,0,-45], [0,-45,-45], [-45,0,-45], [0,45,-45])
-    
-    pyrSides = cmds.nurbsSquare()
-    
-    cmds.xform(r=True, ro=[90,0,0])
-
-    for i in range(len(dirList)):
 
-        # Rename each edge and position according to placement.
-        relativeList = cmds.listRelatives(pyrSides[0])
-        cmds.rename(relativeList[i], "%s%s" % (dirList[i], pyrSides[0]))
-        cmds.move(xcoordList[i], 0, zcoordList[i],  "%s%s.scalePivot" % (dirList[i], pyrSides[0]), "%s%s.rotatePivot" % (dirList[i], pyrSides[0]), absolute=True)
-        cmds.select("%s" % dirList[i] + "%s" % pyrSides[0])
-        cmds.xform(r=True, ro=pivotList[i])
-        
-    pyrBase = cmds.nurbsSquare()
-    cmds.xform(r=True, ro=[90,0,0])
-    
-    freeze(pyrSides[0], pyrBase[0])
-    cleanupCtrl("nurbsPyramid1", pyrSides[0], pyrBase[0])
+    cmds.select(buildCtrl("nurbsPyramid"))
     
     
 def nurbDiamond(*pArgs):
-    ''' creates a "nurbsDiamond" using 2 nurbsDiamond and applies universal 'clean' func to it 
+    ''' creates a "nurbsDiamond" (2 nurbsPyramids, the second flipped upside-down) from the shape library 
     
         On Exit: 
         nurbsDiamond created at origin as single object with no construction history'''
+
+    cmds.select(buildCtrl("nurbsDiamond"))
+
+
+def buildCtrl(shapeType, name=None, names=None, radius=None):
+    ''' creates a control of the given library shape, with one nurbsCurve shape node per curve in the shape's table
+
+        shapeType : key into shapeLibrary() (e.g. "nurbsPyramid")
+        name : name of the control transform, defaults to shapeType + "1" (incremented on a clash, e.g. "nurbsPyramid2")
+        names : NameAllocator to take names from, batch callers share one so the scene is only indexed once
+        radius : size of the control (see SHAPE_RADIUS), defaults to the library's unit size
+
+        On Exit:
+        Control created at origin with frozen transforms and no construction history. The selection is untouched.
+        Any radius is baked into the CVs, so the control's scale stays 1 and there is nothing to freeze.
+        Its shapes are named "<ctrl>Shape", "<ctrl>Shape1", ...
+        Returns the name of the control transform.'''
+
+    if names is None:
+        names = NameAllocator()
+
+    curves = shapeLibrary()[shapeType]
+    if radius is not None:
+        scale = radius / SHAPE_RADIUS.get(shapeType, 1.0)
+        curves = [(degree, form, knots, array.array("d", [v * scale for v in cvs])) for degree, form, knots, cvs in curves]
+    ctrl = cmds.createNode("transform", n=names.allocate(name or "%s1" % shapeType), ss=True)
+
+    # Each shape is created straight under the control and given its CV/knot data in one write,
+    # so there is nothing to freeze, reparent or clean up afterwards.
+    for curve in curves:
+        shape = cmds.createNode("nurbsCurve", n=names.allocate("%s" % ctrl + "Shape"), p=ctrl, ss=True)
+        cmds.setAttr("%s.cc" % shape, *curveData(curve), type="nurbsCurve")
+
+    return ctrl
+
+
+def ctrlPerSelected(*pArgs):
+    ''' GUI callback: create a control of the "Batch Shape" dropdown's shape on every selected transform,
+        coloured with the current colour slider value, and sized to their targets if "Auto Size" is ticked.
+
+        On Exit:
+        See ctrlPerTransform. The new controls are selected.'''
+
+    shapeType = cmds.optionMenu("batchShape", q=True, value=True)
+    autoSize = cmds.checkBox("batchAutoSize", q=True, value=True)
+    ctrls = ctrlPerTransform(shapeType, cmds.ls(sl=True, type="transform"), sliderColour(), autoSize=autoSize)
+    if ctrls:
+        cmds.select(ctrls)
+
+
+@scoped
+def ctrlPerTransform(shapeType, targets, colour=None, autoSize=False):
+    ''' creates one control of the given library shape per target transform, matched to the target's world matrix
+
+        shapeType : key into shapeLibrary() (e.g. "nurbsCircle")
+        targets : transforms to build controls for
+        colour : optional override colour for the new controls, a colour index (1-32, as on the index slider) or RGB tuple
+        autoSize : size each control to its target (see targetRadii) instead of building it at unit size
+
+        On Exit:
+        "<target>_ctrl" created for each target, matched to it and coloured, all in a single undo chunk.
+        Auto sizes are baked into the controls' CVs, allowing for the targets' own scale.
+        Returns the new controls' names in target order.'''
+
+    if not targets:
+        return []
+
+    # Read every target's world matrix before anything is created, so matching is one write per control
+    # instead of a matchTransform (and its selection changes) per control.
+    matrices = [cmds.getAttr("%s.worldMatrix[0]" % target) for target in targets]
+    radii = [None] * len(targets)
+    if autoSize:
+        # Radii are in world units, and the control inherits its target's scale through the matched matrix.
+        radii = [radius / max(math.sqrt(sum(v * v for v in matrix[i * 4:i * 4 + 3])) for i in range(3)) if radius else None
+                 for radius, matrix in zip(targetRadii(targets), matrices)]
+    names = NameAllocator(indexScene=True)
+    ctrls = []
+
+    cmds.undoInfo(openChunk=True, chunkName="ctrlPerTransform")
+    cmds.refresh(suspend=True)
+    try:
+        for target, matrix, radius in zip(targets, matrices, radii):
+            ctrl = buildCtrl(shapeType, "%s_ctrl" % target.split("|")[-1], names=names, radius=radius)
+            cmds.xform(ctrl, worldSpace=True, matrix=matrix)
+            ctrls.append(ctrl)
+
+        if colour is not None:
+            applyColour(sharedCache().listRelatives(ctrls, shapes=True, fullPath=True), colour)
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+
+    return ctrls
+
+
+def targetRadii(targets, boneScale=AUTO_SIZE_BONE_SCALE, padding=AUTO_SIZE_PADDING):
+    ''' control radius suiting each target, for a whole batch of targets at once
+
+        targets : joints and mesh transforms (or meshes) to size controls for
+        boneScale : fraction of a joint's longest bone (to a child joint, or for an end joint from its parent joint) its radius is
+        padding : how far outside a mesh's world bounding box its radius is, as a multiple of the box's largest half extent
+
+        On Exit:
+        Returns the radii in world units, in target order: None for targets with nothing to size by (e.g. a lone joint).
+        The scene is read with the same five bulk queries however many targets there are. Needs numpy.'''
+
+    numpy = _numpy("targetRadii")
+
+    if not targets:
+        return []
+
+    # Parents are listed with the targets, to tell which end joints have a parent bone to size by.
+    paths = cmds.ls(targets, long=True)
+    parents = [path.rsplit("|", 1)[0] for path in paths if path.rsplit("|", 1)[0]]
+    jointPaths = set(cmds.ls(paths + parents, type="joint", long=True))
+    joints = set(path for path in paths if path in jointPaths)
+    children = []
+    if joints:
+        children = sharedCache().listRelatives(sorted(joints), children=True, type="joint", fullPath=True) or []
+    vertices = cmds.ls(["%s.vtx[*]" % path for path in paths if path not in joints], long=True) or []
+
+    # Bones as (joint, other end) pairs: each joint to its child joints, and end joints back to their parent.
+    bones = [(child.rsplit("|", 1)[0], child) for child in children]
+    ends = joints - set(joint for joint, child in bones)
+    bones.extend((joint, joint.rsplit("|", 1)[0]) for joint in ends if joint.rsplit("|", 1)[0] in jointPaths)
+
+    # Each target's vertex ranges, so its points come back together. Ranges may name the target or its mesh shapes.
+    index = dict((path, i) for i, path in enumerate(paths))
+    ranges = [(index.get(name.split(".", 1)[0], index.get(name.split(".", 1)[0].rsplit("|", 1)[0])), name) for name in vertices]
+    ranges = sorted((i, name) for i, name in ranges if i is not None)
+    counts = []
+    for i, name in ranges:
+        first, _, last = name.rsplit("[", 1)[1].rstrip("]").partition(":")
+        counts.append(int(last or first) - int(first) + 1)
+
+    # One query for every position needed: bone ends, then vertices.
+    boneEnds = sorted(set(path for bone in bones for path in bone))
+    queried = boneEnds + [name for i, name in ranges]
+    positions = numpy.array(cmds.xform(queried, q=True, ws=True, t=True) if queried else [], dtype=float).reshape(-1, 3)
+    radii = numpy.zeros(len(paths))
+
+    if bones:
+        slot = dict((path, i) for i, path in enumerate(boneEnds))
+        starts = numpy.array([slot[joint] for joint, other in bones])
+        lengths = numpy.linalg.norm(positions[numpy.array([slot[other] for joint, other in bones])] - positions[starts], axis=1)
+        numpy.maximum.at(radii, numpy.array([index[joint] for joint, other in bones]), lengths * boneScale)
+
+    if ranges:
+        # Targets' points are contiguous after the bone ends, so their bounds are one reduction per axis.
+        points = positions[len(boneEnds):]
+        owners = numpy.repeat(numpy.array([i for i, name in ranges]), counts)
+        starts = numpy.flatnonzero(numpy.r_[True, owners[1:] != owners[:-1]])
+        extents = numpy.maximum.reduceat(points, starts) - numpy.minimum.reduceat(points, starts)
+        radii[owners[starts]] = extents.max(axis=1) * 0.5 * padding
+
+    return [float(radius) if radius > 0 else None for radius in radii]
+
+
+def curveData(curve):
+    ''' flatten a shape library curve into the value list for a nurbsCurve ".cc" setAttr
     
-    # Create 2 pyramids and label their edges as either the top or bottom of the diamond, and rotate the latter upside-down.
-    nurbPyramid()
-    cmds.pickWalk(direction="up")
-    bottomHalf = cmds.ls(selection=True)
-    
-    nurbPyramid()
-    cmds.pickWalk(direction="up")
-    topHalf = cmds.ls(selection=True)
-    cmds.xform(r=True, ro=[180,0,0])
+        curve : (degree, form, knots, cvs) tuple, with knots and cvs as flat arrays'''
+
+    degree, form, knots, cvs = curve
+    numCVs = len(cvs) // 3
+    points = [tuple(cvs[i*3:i*3+3]) for i in range(numCVs)]
+
+    # degree, spans, form (0 open, 2 periodic), rational, dimension, knot count, knots, CV count, CVs
+    return [degree, numCVs - degree, form, False, 3, len(knots)] + list(knots) + [numCVs] + points
+
+
+def shapeLibrary():
+    ''' CV/degree/knot tables of every library control shape, computed on first call and cached for the session
     
-    # Bottom half already frozen as it hasn't been altered since creation, and pyramids are already frozen at creation.
-    freeze(topHalf[0])
-    cleanupCtrl("nurbsDiamond1", bottomHalf[0], topHalf[0])
+        On Exit:
+        Returns a dict of shape name -> tuple of (degree, form, knots, cvs) curves, knots and cvs packed as array('d').
+        CV positions are those the original nurbsSquare/circle construction gave after freezing.'''
+
+    global _shapeLibrary
+
+    if _shapeLibrary is None:
+        circle = _circleCVs()
+        square = _squareEdges()
+        
+        # Sphere: default circle, plus copies rotated 90 in X and Y (as the original xform calls did).
+        sphere = [circle, _transformed(circle, ro=(90,0,0)), _transformed(circle, ro=(0,90,0))]
+
+        # Cube: squares moved to the -X/+X sides (rotated to face outward) and the -Z/+Z sides.
+        cube = (_transformed(square, t=(-0.5,0,0), ro=(0,90,0)) + _transformed(square, t=(0.5,0,0), ro=(0,-90,0)) +
+                _transformed(square, t=(0,0,-0.5)) + _transformed(square, t=(0,0,0.5)))
+
+        # Pyramid, as the original construction built it: a square laid flat (rotated 90 in X) whose top, left, bottom
+        # and right edges were each turned about a corner pivot, followed by a second flat square as the base.
+        # The pivots were placed in world space, so in the square's own (unrotated) space they sit at (x, z, 0).
+        pivots = [((0.5,0.5,0), (45,0,-45)), ((0.5,-0.5,0), (0,-45,-45)), ((-0.5,-0.5,0), (-45,0,-45)), ((-0.5,0.5,0), (0,45,-45))]
+        sides = [_transformed(edge, ro=ro, pivot=pivot) for edge, (pivot, ro) in zip(square, pivots)]
+        base = _transformed(square, ro=(90,0,0))
+        pyramid = _transformed(sides, ro=(90,0,0)) + base
+
+        # Diamond: two pyramids, the second flipped upside-down.
+        diamond = pyramid + _transformed(pyramid, ro=(180,0,0))
+
+        library = {"nurbsCircle" : [circle],
+                   "nurbsSquare" : square,
+                   "nurbsSphere" : sphere,
+                   "nurbsCube" : cube,
+                   "nurbsPyramid" : pyramid,
+                   "nurbsDiamond" : diamond}
+        
+        _shapeLibrary = dict((shapeType, tuple(_packCurve(points, periodic) for points, periodic in curves))
+                             for shapeType, curves in library.items())
+
+    return _shapeLibrary
+
+
+def _packCurve(points, periodic):
+    ''' pack a degree 3 curve's points into a (degree, form, knots, cvs) library entry'''
+
+    if periodic:
+        knots = range(-2, len(points))
+    else:
+        knots = [0, 0, 0, 1, 1, 1]
+
+    cvs = array.array("d", [round(v, 10) + 0.0 for point in points for v in point])
+    return (3, 2 if periodic else 0, array.array("d", knots), cvs)
+
+
+def _circleCVs():
+    ''' cmds.circle() defaults: periodic degree 3, 8 sections, radius 1, normal Z'''
+
+    # CVs sit slightly outside the radius, so that the curve itself passes through radius 1.
+    cvRadius = 6.0 / (4.0 + math.sqrt(2.0))
+    points = []
+
+    for i in range(8):
+        angle = math.radians(45 + 45*i)
+        points.append((cvRadius * math.cos(angle), cvRadius * math.sin(angle), 0.0))
+
+    # Periodic curves repeat their first 'degree' CVs at the end.
+    return (points + points[:3], True)
+
+
+def _squareEdges():
+    ''' cmds.nurbsSquare() defaults: 4 single span degree 3 edges, side length 1, normal Z'''
+
+    corners = [(0.5,0.5,0), (-0.5,0.5,0), (-0.5,-0.5,0), (0.5,-0.5,0)]
+    return [_line(corners[i], corners[(i+1) % 4]) for i in range(4)]
+
+
+def _line(start, end):
+    ''' single span degree 3 straight curve, CVs evenly spaced from start to end'''
+
+    points = [tuple(start[axis] + (end[axis] - start[axis]) * i / 3.0 for axis in range(3)) for i in range(4)]
+    return (points, False)
+
+
+def _transformed(curves, t=(0,0,0), ro=(0,0,0), pivot=(0,0,0)):
+    ''' copy of curves rotated (xyz rotate order, degrees) about pivot then translated, as a frozen xform would leave them
+
+        curves : single (points, periodic) curve or list of them'''
+
+    if isinstance(curves, tuple):
+        return _transformed([curves], t, ro, pivot)[0]
+
+    radians = [math.radians(angle) for angle in ro]
+    cos = [math.cos(angle) for angle in radians]
+    sin = [math.sin(angle) for angle in radians]
+    result = []
+
+    for points, periodic in curves:
+        newPoints = []
+        for x, y, z in points:
+            x, y, z = x - pivot[0], y - pivot[1], z - pivot[2]
+            y, z = y*cos[0] - z*sin[0], y*sin[0] + z*cos[0]
+            x, z = x*cos[1] + z*sin[1], -x*sin[1] + z*cos[1]
+            x, y = x*cos[2] - y*sin[2], x*sin[2] + y*cos[2]
+            newPoints.append((x + pivot[0] + t[0], y + pivot[1] + t[1], z + pivot[2] + t[2]))
+        result.append((newPoints, periodic))
+
+    return result
     
-def cleanupCtrl(name, *pArgs):
+
+@scoped
+def cleanupCtrl(name, *pArgs, **kwargs):
     ''' cleanup function to remove construction leftovers and parent multiple individual curves under a single group/shape
         
         name: final name of the shape when process is finished (e.g. "nurbsPyramid1")
+        ops: OperationRecorder to record the edits into (committed by the caller), otherwise they are committed here
         
         On Exit:
-        All individual curves comprising the complex shapes are parented under a single group.'''
-
-    #Create new grps for curves to be parented to
-    newGrp = cmds.group(em=True)                
-    holdGrp = cmds.group(em=True)
-    
-    #List all args provided.
-    pArgsList = pArgs                            
-      
-    for i in range(len(pArgsList)):
-        # Create list of all children of items in list and parent them to a temporary holding group.
-        # The original parent groups to these children are deleted.
-        pArgsCurves = cmds.listRelatives(pArgsList[i])
-        cmds.parent(pArgsCurves, holdGrp, shape=True, relative=True)
-        cmds.delete(pArgsList[i])
-
-    # Rename final group to given name and initialize variable with updated name.
-    # I.e it attempts "nurbsSphere1", but if that already exists, it will be automatically renamed to "nurbsSphere2"
+        All individual curves comprising the complex shapes are parented under a single group,
+        and named "<group>Shape", "<group>Shape1", ... The selection is untouched. Returns the group's name.'''
+
+    # Every name below comes from the allocator rather than from Maya's clash resolution.
+    names = NameAllocator()
+    recorder = kwargs.get("ops") or OperationRecorder()
+
+    # Read the curves up front, since nothing reaches the scene until the plan is committed.
+    # Each argument's children are thrown into the holding group; any of those with children of their own
+    # (transforms) only contribute those children, the shapes (in practice transforms had single children).
+    pArgsCurves = [sharedCache().listRelatives(pArg) or [] for pArg in pArgs]
+    shapes = [sharedCache().listRelatives(curve) or [curve] for curves in pArgsCurves for curve in curves]
+
+    #Create grp for curves to be parented to
+    holdGrp = recorder.createNode("transform", n=names.allocate("transform1"))
+
+    for pArg, curves in zip(pArgs, pArgsCurves):
+        # Parent all children of each argument to the holding group, and delete the original parent groups.
+        if curves:
+            recorder.parent(curves, holdGrp, shape=True, relative=True)
+        recorder.delete(pArg)
+        names.release(pArg)
+
+    # Create the final group under the given name, or the next free one.
+    # I.e it attempts "nurbsSphere1", but if that already exists, it will be named "nurbsSphere2"
     # name would still equal "nurbsSphere1" but updatedName would hold "nurbsSphere2"        
-    updatedName = cmds.rename(newGrp, name)
+    updatedName = recorder.createNode("transform", n=names.allocate(name))
 
-    # All children were thrown into holding group, we need to remove transform nodes and keep shape nodes.
-    pArgsCurves = cmds.listRelatives(holdGrp) 
-        
-    for i in range(len(pArgsCurves)):
-        #Since all curves thrown blindly into holdGrp, need to sort any transforms from shapes (we want the latter)
-        #Assigns value held in list to temporary holding variable, and reassigns list value to the list of children
-        #If there are no children, restore list value to it's original value using temp node.
-        # (in short, reassign value to child if the list value has child, do nothing otherwise)
-        #When written, transform nodes only had single children in practice, so method worked to remove junk nodes.
-
-        currentVal = pArgsCurves[i]                            
-        pArgsCurves[i] = cmds.listRelatives(pArgsCurves[i])
-        if pArgsCurves[i] is None:
-            pArgsCurves[i] = currentVal
-
-        #Parent list's new contents to final group and re-name each curve to final name to avoid clashes
-        cmds.parent(pArgsCurves[i], updatedName, shape=True, relative=True)    
-        cmds.rename(pArgsCurves[i], "%s" % updatedName + "Ctrl1")   
-
-    cmds.delete(updatedName, constructionHistory=True)
-    cmds.delete(holdGrp)
-    cmds.select(updatedName)                                                         
+    for shapeList in shapes:
+        #Parent the shapes to final group and re-name each curve to the next free "<group>Shape" name
+        recorder.parent(shapeList, updatedName, shape=True, relative=True)
+        for shape in shapeList:
+            names.release(shape)
+            recorder.rename(shape, names.allocate("%s" % updatedName + "Shape"))
+
+    recorder.delete(updatedName, constructionHistory=True)
+    recorder.delete(holdGrp)
+
+    if not kwargs.get("ops"):
+        recorder.commit(chunkName="cleanupCtrl")
+    return updatedName
     
 def freeze(*pArgs):
     ''' Freeze transformations of all arguments passed to function
     
         On Exit:
-        Object named in function call has default keyable values 0'd out.'''
+        Object named in function call has default keyable values 0'd out. The selection is untouched.'''
 
-    cmds.select(pArgs)
-    cmds.makeIdentity(apply=True) 
+    cmds.makeIdentity(pArgs, apply=True)
 
 def sliderChange(*pArgs):
     ''' Update the GUI colour slider's height when function called (every time dropdown menu is changed)
@@ -258,50 +563,641 @@ def colUpdate(*pArgs):
         On Exit:
         All curves of selected shapes are updated to the selected colour.'''
 
+    applyColour(cmds.ls(sl=True), sliderColour())
+
+
+def sliderColour():
+    ''' Query the colour of whichever GUI colour slider is active
+    
+        On Exit:
+        Returns the index slider's value (1-32) in Index mode, or an (r, g, b) tuple in RGB mode.'''
+
     tracker = cmds.optionMenu("colDropdown", q=True, value=True) 
-    shapeList = cmds.ls(sl=True)
+
+    if tracker == "RGB":
+        return tuple(cmds.colorSliderGrp("rgb", q=True, rgbValue=True))
+
+    return cmds.colorIndexSliderGrp("index", q=True, value=True)
+
+
+def applyColour(nodes, colour):
+    ''' Apply an override colour to the shapes of all given nodes
+    
+        nodes : transforms and/or shapes to colour
+        colour : colour index (1-32, as on the index slider) or (r, g, b) tuple
+        
+        On Exit:
+        Colour override enabled on every shape, in index or RGB mode to match the colour given.
+        Returns the shapes whose colour attributes were actually changed.'''
+
+    return writeColours([(shape, colour) for shape in resolveShapes(nodes)])
+
+
+@scoped
+def colourBySide(*pArgs):
+    ''' GUI callback: recolour every curve under the selected rig roots (or the whole scene if nothing is selected)
+        using the SIDE_COLOURS prefix rules.'''
+
+    selected = cmds.ls(sl=True, long=True)
+
+    if selected:
+        curves = sharedCache().listRelatives(selected, allDescendents=True, type="nurbsCurve", fullPath=True) or []
+    else:
+        curves = cmds.ls(type="nurbsCurve", long=True) or []
+
+    colourByRule(curves, SIDE_COLOURS)
+
+
+@scoped
+def colourByRule(nodes, rules):
+    ''' Colour the shapes of all given nodes by name prefix rules, in a single pass
+    
+        nodes : transforms and/or shapes to colour
+        rules : list of (prefix, colour) pairs, checked in order against the short name of each shape's transform.
+                Shapes whose transform matches no rule are left alone.
+        
+        On Exit:
+        Returns the shapes whose colour attributes were actually changed.'''
+
+    shapeColours = []
+
+    for shape in resolveShapes(nodes):
+        ctrlName = shape.split("|")[-2] if shape.count("|") > 1 else shape
+        for prefix, colour in rules:
+            if ctrlName.startswith(prefix):
+                shapeColours.append((shape, colour))
+                break
+
+    return writeColours(shapeColours)
+
+
+def resolveShapes(nodes):
+    ''' Resolve a mix of transforms and shapes to their shape nodes, with one query for all the transforms
     
+        On Exit:
+        Returns unique full shape paths, in the order given.'''
+
+    if not nodes:
+        return []
+
+    shapes = cmds.ls(nodes, shapes=True, long=True) or []
+    transforms = cmds.ls(nodes, transforms=True, long=True) or []
+    if transforms:
+        shapes += sharedCache().listRelatives(transforms, shapes=True, fullPath=True) or []
+
+    seen = set()
+    return [shape for shape in shapes if not (shape in seen or seen.add(shape))]
+
 
-    for i in range(len(shapeList)):
-        # Enable colour override for selected options if not enabled already.
-        cmds.setAttr("%s.overrideEnabled" % shapeList[i], 1)
+def writeColours(shapeColours):
+    ''' Colour engine behind applyColour/colourByRule: only the override attributes that differ from the target are set
+    
+        shapeColours : list of (shape, colour) pairs, colour as for applyColour
         
-        # Query the colour provided by the index/rgb slider, set the RGB/Index mode in the shape's attributes to match
-        # the one used in the GUI, and apply the colour appropriately.
- 
-        if tracker == "Index":
-            index = cmds.colorIndexSliderGrp("index", q=True, value=True)
-            cmds.setAttr("%s.overrideRGBColors" % shapeList[i], 0)
-            cmds.setAttr("%s.overrideColor" % shapeList[i], index-1)
-            
-        if tracker == "RGB":
-            rgb = cmds.colorSliderGrp("rgb", q=True, rgbValue=True)
-            cmds.setAttr("%s.overrideRGBColors" % shapeList[i], 1)
-            
-            cmds.setAttr("%s.overrideColorRGB" % shapeList[i], rgb[0], rgb[1], rgb[2])
+        On Exit:
+        Returns the shapes that had at least one attribute changed.'''
+
+    changed = []
+
+    for shape, colour in shapeColours:
+        rgbMode = isinstance(colour, tuple)
+        writes = []
+
+        if not cmds.getAttr("%s.overrideEnabled" % shape):
+            writes.append(("overrideEnabled", (1,)))
+        if bool(cmds.getAttr("%s.overrideRGBColors" % shape)) != rgbMode:
+            writes.append(("overrideRGBColors", (int(rgbMode),)))
+
+        if rgbMode:
+            current = cmds.getAttr("%s.overrideColorRGB" % shape)[0]
+            if max(abs(a - b) for a, b in zip(current, colour)) > 1e-6:
+                writes.append(("overrideColorRGB", tuple(colour)))
+        elif cmds.getAttr("%s.overrideColor" % shape) != colour-1:
+            writes.append(("overrideColor", (colour-1,)))
+
+        for attr, values in writes:
+            cmds.setAttr("%s.%s" % (shape, attr), *values)
+        if writes:
+            changed.append(shape)
+
+    return changed
+        
+        
+def shapeCacheDialog(cacheFunc, *pArgs):
+    ''' GUI callback: pick a shape cache file and export to / import from it.
+        Exports cover the curves under the selected rig roots, or the whole scene if nothing is selected.'''
+
+    fileMode = 0 if cacheFunc is exportCtrlShapes else 1
+    path = cmds.fileDialog2(fileFilter="Control Shape Cache (*.ncsc)", dialogStyle=2, fileMode=fileMode)
+
+    if path and cacheFunc is exportCtrlShapes:
+        exportCtrlShapes(path[0], cmds.ls(sl=True) or None)
+    elif path:
+        importCtrlShapes(path[0])
+
+
+@scoped
+def exportCtrlShapes(path, roots=None):
+    ''' Write the CVs, degree, knots, form and override colour of every control shape to a binary shape cache
+    
+        path : cache file to write, one per character
+        roots : rig roots whose curves are exported, defaults to every nurbsCurve in the scene
+        
+        On Exit:
+        Cache written, see SHAPE_CACHE_RECORD for its layout. Returns the number of shapes exported.'''
+
+    if roots:
+        shapes = sharedCache().listRelatives(roots, allDescendents=True, type="nurbsCurve", fullPath=True) or []
+    else:
+        shapes = cmds.ls(type="nurbsCurve", long=True) or []
+
+    names = []
+    records = []
+    values = array.array("d")
+    nameOffset = 0
+
+    for shape in shapes:
+        degree, form, knots, cvs = readCurve(shape)
+
+        # Only the colour attributes in use are stored, the rest are left as defaults.
+        colour = readColour(shape)
+        enabled = colour is not None
+        rgbMode = isinstance(colour, tuple)
+        index = colour-1 if enabled and not rgbMode else 0
+        rgb = colour if rgbMode else (0.0, 0.0, 0.0)
+
+        name = shape.split("|")[-1].encode("utf-8")
+        knotStart = len(values)
+        values.extend(knots)
+        cvStart = len(values)
+        values.extend(v for cv in cvs for v in cv)
+
+        records.append(SHAPE_CACHE_RECORD.pack(nameOffset, len(name), degree, form, int(bool(enabled)), int(bool(rgbMode)),
+                                               index, knotStart, len(knots), cvStart, len(cvs), rgb[0], rgb[1], rgb[2],
+                                               _curveHash(degree, form, knots, cvs)))
+        names.append(name)
+        nameOffset += len(name)
+
+    nameBlob = b"".join(names)
+    nameBlob += b"\0" * (-len(nameBlob) % 8)
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    cacheFile = open(path, "wb")
+    try:
+        cacheFile.write(SHAPE_CACHE_HEADER.pack(SHAPE_CACHE_MAGIC, 1, len(records), len(nameBlob), len(values)))
+        cacheFile.write(b"".join(records))
+        cacheFile.write(nameBlob)
+        cacheFile.write(_arrayBytes(values))
+    finally:
+        cacheFile.close()
+
+    return len(records)
+
+
+def importCtrlShapes(path):
+    ''' Restore control shapes and colours from a shape cache, matching shapes by name
+    
+        path : cache file written by exportCtrlShapes
+        
+        On Exit:
+        Every shape in the scene that has a cache record and whose CVs/degree/form/knots differ from it is rebuilt from the cache
+        (shapes whose content hash matches are not rewritten), and override colours restored where they differ.
+        All done in a single undo chunk. Returns the names of the shapes whose curves were rewritten.'''
+
+    cacheFile = open(path, "rb")
+    try:
+        cache = mmap.mmap(cacheFile.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        cacheFile.close()
+
+    try:
+        magic, version, count, nameBytes, valueCount = SHAPE_CACHE_HEADER.unpack_from(cache, 0)
+        if magic != SHAPE_CACHE_MAGIC or version != 1:
+            raise ValueError("%s is not a control shape cache" % path)
+
+        nameStart = SHAPE_CACHE_HEADER.size + count * SHAPE_CACHE_RECORD.size
+        valueStart = nameStart + nameBytes
+        records = [SHAPE_CACHE_RECORD.unpack_from(cache, SHAPE_CACHE_HEADER.size + i * SHAPE_CACHE_RECORD.size) for i in range(count)]
+        names = [cache[nameStart + record[0]:nameStart + record[0] + record[1]].decode("utf-8") for record in records]
+        values = array.array("d")
+        _arrayLoad(values, cache[valueStart:valueStart + valueCount * 8])
+    finally:
+        cache.close()
+
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    # One existence query for every cached name.
+    existing = set(cmds.ls(names) or [])
+    rewritten = []
+    shapeColours = []
+
+    cmds.undoInfo(openChunk=True, chunkName="importCtrlShapes")
+    try:
+        for name, record in zip(names, records):
+            if name not in existing:
+                continue
+            degree, form, enabled, rgbMode, index, knotStart, knotCount, cvStart, cvCount = record[2:11]
+            rgb, cacheHash = record[11:14], record[14]
+
+            current = [tuple(cv) for cv in cmds.getAttr("%s.cv[*]" % name)]
+            if _curveHash(cmds.getAttr("%s.degree" % name), cmds.getAttr("%s.form" % name), _curveKnots(name), current) != cacheHash:
+                cvs = values[cvStart:cvStart + cvCount * 3]
+                # Periodic curves are written with their first 'degree' CVs repeated at the end.
+                if form == 2:
+                    cvs.extend(cvs[:degree * 3])
+                curve = (degree, form, values[knotStart:knotStart + knotCount], cvs)
+                cmds.setAttr("%s.cc" % name, *curveData(curve), type="nurbsCurve")
+                rewritten.append(name)
+
+            if enabled:
+                shapeColours.append((name, tuple(rgb) if rgbMode else index + 1))
+
+        writeColours(shapeColours)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+    return rewritten
+
+
+def readCurve(shape):
+    ''' Read a curve shape's data, in the same form as a shapeLibrary() curve but with CVs as a list of points
+    
+        On Exit:
+        Returns (degree, form, knots, cvs). Periodic curves give only their distinct CVs, see fullCVs.'''
+
+    degree = cmds.getAttr("%s.degree" % shape)
+    form = cmds.getAttr("%s.form" % shape)
+    cvs = [tuple(cv) for cv in cmds.getAttr("%s.cv[*]" % shape)]
+
+    return (degree, form, _curveKnots(shape), cvs)
+
+
+def _curveKnots(shape):
+    ''' a curve shape's knots as Maya stores them, read through the API (MFnNurbsCurve) rather than a curveInfo node
+        wired to the shape. Outside Maya, the cmds stand-in's curveKnots answers instead (see offline_cmds).'''
+
+    # The stand-in is the cmds module itself, not whatever wraps it here (e.g. cmds_profiler's proxy).
+    import maya.cmds as sceneCmds
+
+    if hasattr(sceneCmds, "curveKnots"):
+        return sceneCmds.curveKnots(shape)
+
+    import maya.api.OpenMaya as om
+
+    selection = om.MSelectionList()
+    selection.add(shape)
+    return list(om.MFnNurbsCurve(selection.getDagPath(0)).knots())
+
+
+def fullCVs(degree, form, cvs):
+    ''' flat CV array for a curve's .cc data: periodic curves repeat their first 'degree' CVs at the end'''
+
+    flat = array.array("d", [v for cv in cvs for v in cv])
+    if form == 2:
+        flat.extend(flat[:degree * 3])
+    return flat
+
+
+def readColour(shape):
+    ''' Read a shape's override colour, in the form applyColour takes
+    
+        On Exit:
+        Returns the colour index (1-32, as on the index slider), an (r, g, b) tuple, or None if the override is disabled.'''
+
+    if not cmds.getAttr("%s.overrideEnabled" % shape):
+        return None
+    if cmds.getAttr("%s.overrideRGBColors" % shape):
+        return tuple(cmds.getAttr("%s.overrideColorRGB" % shape)[0])
+    return cmds.getAttr("%s.overrideColor" % shape) + 1
+
+
+def _curveHash(degree, form, knots, cvs):
+    ''' content hash of a curve's degree, form, knots and (distinct) CVs, rounded so float noise doesn't count as a change'''
+
+    values = array.array("d", [round(v, 6) + 0.0 for v in knots] + [round(v, 6) + 0.0 for cv in cvs for v in cv])
+    return hashlib.md5(struct.pack("<III", degree, form, len(knots)) + _arrayBytes(values)).digest()
+
+
+def _arrayBytes(values):
+    return values.tobytes() if hasattr(values, "tobytes") else values.tostring()
+
+
+def _arrayLoad(values, data):
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+
+
+def _numpy(toolName):
+    ''' numpy, imported on first use: it is slow to import, and only shipped with newer Maya versions'''
+
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("%s needs numpy, which this Maya version doesn't provide" % toolName)
+    return numpy
+
+
+def mirrorSelected(*pArgs):
+    ''' GUI callback: mirror the selected l_ controls (or every l_ control, if none are selected) onto their r_ counterparts across X'''
+
+    mirrorCtrls(cmds.ls(sl=True, type="transform") or None)
+
+
+@scoped
+def mirrorCtrls(ctrls=None, axis="x", plane=0.0, sourcePrefix="l_", targetPrefix="r_", colourSwap=SIDE_COLOUR_SWAP):
+    ''' Mirror control shapes from one side to the other, all CVs transformed at once with numpy
+    
+        ctrls : source controls, defaults to every transform named sourcePrefix*. Controls without the prefix are ignored.
+        axis : "x", "y" or "z", the axis the mirror plane is perpendicular to
+        plane : position of the mirror plane along axis
+        sourcePrefix, targetPrefix : e.g. "l_arm_ctrl" is mirrored onto "r_arm_ctrl"
+        colourSwap : colour map for the target side (index and RGB colours), see SIDE_COLOUR_SWAP
         
+        On Exit:
+        Every target control's curve shapes are the world-space mirror of its source's, coloured through colourSwap.
+        Missing targets are created at the mirrored position (keeping a right-handed transform), like buildCtrl would.
+        Each shape costs one bulk CV read and one curve write. Returns the target control names.'''
+
+    numpy = _numpy("mirrorCtrls")
+
+    if ctrls is None:
+        ctrls = cmds.ls(sourcePrefix + "*", type="transform") or []
+    ctrls = [ctrl for ctrl in ctrls if ctrl.split("|")[-1].startswith(sourcePrefix)]
+    if not ctrls:
+        return []
+
+    # Group every source curve by control, from one listRelatives for all of them.
+    shapesByCtrl = {}
+    for shape in sharedCache().listRelatives(ctrls, shapes=True, type="nurbsCurve", fullPath=True) or []:
+        shapesByCtrl.setdefault(shape.rsplit("|", 1)[0], []).append(shape)
+    sources = [path for path in cmds.ls(ctrls, long=True) if path in shapesByCtrl]
+    targets = [targetPrefix + path.split("|")[-1][len(sourcePrefix):] for path in sources]
+    existing = set(cmds.ls(targets) or [])
+
+    curves = [[readCurve(shape) for shape in shapesByCtrl[source]] for source in sources]
+    colours = [[readColour(shape) for shape in shapesByCtrl[source]] for source in sources]
+    sourceMatrices = numpy.array([cmds.getAttr("%s.worldMatrix[0]" % source) for source in sources], dtype=float).reshape(-1, 4, 4)
+
+    # Reflection across the plane, for row vectors (point * matrix) as Maya uses.
+    axisIndex = "xyz".index(axis)
+    reflection = numpy.identity(4)
+    reflection[axisIndex, axisIndex] = -1.0
+    reflection[3, axisIndex] = 2.0 * plane
+
+    # Missing targets are placed at the mirrored source matrix, flipped back to right-handed by a local reflection:
+    # their CVs then come out as a plain local-space mirror of the source's.
+    localReflection = numpy.identity(4)
+    localReflection[axisIndex, axisIndex] = -1.0
+    targetMatrices = numpy.array([cmds.getAttr("%s.worldMatrix[0]" % target) if target in existing
+                                  else numpy.dot(numpy.dot(localReflection, matrix), reflection).ravel()
+                                  for target, matrix in zip(targets, sourceMatrices)], dtype=float).reshape(-1, 4, 4)
+
+    # Every CV of every shape in one array, with the index of the control it belongs to.
+    points = numpy.array([cv + (1.0,) for ctrlCurves in curves for curve in ctrlCurves for cv in curve[3]], dtype=float).reshape(-1, 4)
+    owners = numpy.array([i for i, ctrlCurves in enumerate(curves) for curve in ctrlCurves for cv in curve[3]], dtype=int)
+    toTarget = numpy.einsum("nij,njk->nik", sourceMatrices, reflection[numpy.newaxis].repeat(len(sources), 0))
+    toTarget = numpy.einsum("nij,njk->nik", toTarget, numpy.linalg.inv(targetMatrices))
+    mirrored = numpy.einsum("ni,nij->nj", points, toTarget[owners])[:, :3]
+
+    # Target shapes, grouped by control, from one listRelatives.
+    targetShapes = {}
+    for shape in sharedCache().listRelatives([target for target in targets if target in existing], shapes=True, type="nurbsCurve", fullPath=True) or []:
+        targetShapes.setdefault(shape.rsplit("|", 1)[0].split("|")[-1], []).append(shape)
+
+    # A batch: one index of the scene serves every target and shape name.
+    names = NameAllocator(indexScene=True)
+
+    cmds.undoInfo(openChunk=True, chunkName="mirrorCtrls")
+    cmds.refresh(suspend=True)
+    try:
+        first = 0
+        shapeColours = []
+
+        for i, target in enumerate(targets):
+            if target not in existing:
+                target = cmds.createNode("transform", n=names.allocate(target), ss=True)
+                cmds.xform(target, worldSpace=True, matrix=list(targetMatrices[i].ravel()))
+                targets[i] = target
+            shapes = targetShapes.get(target, [])
+
+            # Match the target's shape count to the source's.
+            for extra in shapes[len(curves[i]):]:
+                cmds.delete(extra)
+                names.release(extra)
+            while len(shapes) < len(curves[i]):
+                shapes.append(cmds.createNode("nurbsCurve", n=names.allocate("%s" % target + "Shape"), p=target, ss=True))
+
+            for shape, (degree, form, knots, cvs), colour in zip(shapes, curves[i], colours[i]):
+                points = [tuple(point) for point in mirrored[first:first + len(cvs)]]
+                first += len(cvs)
+                cmds.setAttr("%s.cc" % shape, *curveData((degree, form, knots, fullCVs(degree, form, points))), type="nurbsCurve")
+
+                if colour is not None:
+                    shapeColours.append((shape, colourSwap.get(colour, colour)))
+
+        writeColours(shapeColours)
+    finally:
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+
+    return targets
+
+
+def simplifySelected(*pArgs):
+    ''' GUI callback: simplify the selected controls' shapes (or every control's, if none are selected) to the GUI's tolerance,
+        printing the CV counts and deviation'''
+
+    tolerance = cmds.floatField("simplifyTolerance", q=True, value=True)
+    result = simplifyCtrls(cmds.ls(sl=True, type="transform") or None, tolerance=tolerance)
+    print("Simplified %i shapes, removed %i overlapping: %i CVs -> %i CVs, max deviation %.4f" %
+          (len(result["rebuilt"]), len(result["removed"]), result["cvsBefore"], result["cvsAfter"], result["maxDeviation"]))
+
+
+@scoped
+def simplifyCtrls(ctrls=None, tolerance=0.01, maxCVs=None, ops=None):
+    ''' Rebuild control shapes with fewer CVs, and remove overlapping duplicate curves, all geometry done with numpy
+    
+        ctrls : controls whose curve shapes are simplified, defaults to every nurbsCurve in the scene
+        tolerance : largest distance (scene units) a rebuilt curve may stray from the original
+        maxCVs : CV budget per rebuilt curve. If given, curves are rebuilt to it even beyond the tolerance.
+        ops : OperationRecorder to record the edits into (committed by the caller), otherwise they are committed here
         
+        On Exit:
+        Curves that a degree 1 curve with fewer CVs can follow (within tolerance, or within budget) are rebuilt as one,
+        with collinear segments merged: e.g. the straight degree 3 edges of squares, cubes and pyramids become 2 CV lines.
+        Curves that overlap another of the same control's (as the two halves of a nurbsDiamond do) are deleted.
+        Returns {"rebuilt" : shapes, "removed" : shapes, "cvsBefore", "cvsAfter" : CV totals of all shapes considered,
+        "maxDeviation" : largest distance of a rebuilt curve from its original}.'''
+
+    numpy = _numpy("simplifyCtrls")
+
+    if ctrls:
+        shapes = sharedCache().listRelatives(ctrls, shapes=True, type="nurbsCurve", fullPath=True) or []
+    else:
+        shapes = cmds.ls(type="nurbsCurve", long=True) or []
+
+    curves = [readCurve(shape) for shape in shapes]
+
+    # Curves sharing a degree and knot vector share their basis functions, so each group is sampled with one matrix product.
+    # Library controls only use a handful of knot vectors, however many of them a rig has.
+    groups = {}
+    for i, (degree, form, knots, cvs) in enumerate(curves):
+        groups.setdefault((degree, tuple(knots), len(fullCVs(degree, form, cvs)) // 3), []).append(i)
+
+    rebuilt, removed, seen = [], set(), {}
+    newCurves = {}
+    maxDeviation = 0.0
+
+    for (degree, knots, numCVs), members in groups.items():
+        points = numpy.array([fullCVs(degree, curves[i][1], curves[i][3]) for i in members], dtype=float).reshape(len(members), numCVs, 3)
+        basis = _bsplineBasis(degree, numpy.array(knots, dtype=float), (numCVs - degree) * SIMPLIFY_SAMPLES + 1)
+        samples = numpy.einsum("sc,ncd->nsd", basis, points)
+
+        # Overlapping curves: same samples, in either direction, on the same control.
+        grid = numpy.rint(samples / SIMPLIFY_DUPLICATE_GRID).astype(numpy.int64)
+        for i, forward, backward in zip(members, grid, grid[:, ::-1]):
+            key = (shapes[i].rsplit("|", 1)[0], min(forward.tobytes(), backward.tobytes()))
+            if key in seen:
+                removed.add(shapes[i])
+            else:
+                seen[key] = shapes[i]
+
+        keep, deviation = _simplifyPolylines(samples, tolerance, maxCVs)
+        for i, curveSamples, kept, error in zip(members, samples, keep, deviation):
+            count = int(kept.sum())
+            if count >= len(curves[i][3]) or (error > tolerance and maxCVs is None) or shapes[i] in removed:
+                continue
+            closed = numpy.allclose(curveSamples[0], curveSamples[-1])
+            newCurves[i] = (1, 1 if closed else 0, array.array("d", range(count)), array.array("d", curveSamples[kept].ravel()))
+            maxDeviation = max(maxDeviation, float(error))
+
+    recorder = ops or OperationRecorder()
+    for i, shape in enumerate(shapes):
+        if shape in removed:
+            recorder.delete(shape)
+        elif i in newCurves:
+            recorder.setAttr("%s.cc" % shape, *curveData(newCurves[i]), type="nurbsCurve")
+            rebuilt.append(shape)
+
+    if ops is None:
+        recorder.commit(chunkName="simplifyCtrls")
+
+    cvsBefore = sum(len(curve[3]) for curve in curves)
+    cvsAfter = sum(len(newCurves[i][3]) // 3 if i in newCurves else len(curve[3])
+                   for i, curve in enumerate(curves) if shapes[i] not in removed)
+
+    return {"rebuilt" : rebuilt, "removed" : [shape for shape in shapes if shape in removed], "cvsBefore" : cvsBefore, "cvsAfter" : cvsAfter, "maxDeviation" : maxDeviation}
+
+
+def _bsplineBasis(degree, knots, count):
+    ''' (count, CVs) matrix of B-spline basis functions at count parameters evenly spread over the curve's domain
+
+        knots : the curve's knots as Maya stores them (without the two outermost knots of the textbook knot vector,
+                which don't affect the curve)'''
+
+    numpy = _numpy("simplifyCtrls")
+
+    t = numpy.concatenate(([knots[0]], knots, [knots[-1]]))
+    numCVs = len(t) - degree - 1
+    u = numpy.linspace(t[degree], t[numCVs], count)[:, numpy.newaxis]
+
+    # Degree 0: each parameter lies in one knot span. The domain's end belongs to the last non-empty span.
+    basis = ((t[:-1] <= u) & (u < t[1:])).astype(float)
+    lastSpan = numpy.nonzero(t[:-1] < t[numCVs])[0][-1]
+    basis[-1, :] = 0.0
+    basis[-1, lastSpan] = 1.0
+
+    # Cox-de Boor recursion, for every parameter at once. Empty spans (repeated knots) contribute nothing.
+    for p in range(1, degree + 1):
+        leftSpan = t[p:-1] - t[:-p - 1]
+        rightSpan = t[p + 1:] - t[1:-p]
+        left = numpy.where(leftSpan > 0, (u - t[:-p - 1]) / numpy.where(leftSpan > 0, leftSpan, 1.0), 0.0)
+        right = numpy.where(rightSpan > 0, (t[p + 1:] - u) / numpy.where(rightSpan > 0, rightSpan, 1.0), 0.0)
+        basis = left * basis[:, :-1] + right * basis[:, 1:]
+
+    return basis
+
+
+def _simplifyPolylines(samples, tolerance, maxCVs=None):
+    ''' Pick the fewest samples of each curve whose polyline stays within tolerance of all of them (or maxCVs samples)
+
+        samples : (curves, samples, 3) array. Each curve's first and last sample are always kept.
+
+        On Exit:
+        Returns (keep, deviation): a (curves, samples) bool array of the samples kept, and each polyline's largest distance
+        from its curve's samples. Points are added where the polyline strays furthest, for all curves at once, so
+        collinear runs of samples collapse into single segments.'''
+
+    numpy = _numpy("simplifyCtrls")
+
+    numCurves, numSamples = samples.shape[:2]
+    index = numpy.arange(numSamples)
+    rows = numpy.arange(numCurves)[:, numpy.newaxis]
+    keep = numpy.zeros((numCurves, numSamples), dtype=bool)
+    keep[:, 0] = keep[:, -1] = True
+    budget = numSamples if maxCVs is None else max(2, maxCVs)
+
+    while True:
+        # Each sample's distance from the polyline segment between the kept samples either side of it.
+        before = numpy.maximum.accumulate(numpy.where(keep, index, 0), axis=1)
+        after = numpy.minimum.accumulate(numpy.where(keep, index, numSamples - 1)[:, ::-1], axis=1)[:, ::-1]
+        start, end = samples[rows, before], samples[rows, after]
+        segment = end - start
+        length = numpy.einsum("nsd,nsd->ns", segment, segment)
+        along = numpy.clip(numpy.einsum("nsd,nsd->ns", samples - start, segment) / numpy.where(length > 0, length, 1.0), 0.0, 1.0)
+        distance = numpy.linalg.norm(samples - start - along[..., numpy.newaxis] * segment, axis=2)
+
+        worst = distance.argmax(axis=1)
+        deviation = distance.max(axis=1)
+        active = (deviation > tolerance) & (keep.sum(axis=1) < budget)
+        if not active.any():
+            return keep, deviation
+        keep[active, worst[active]] = True
+
+
 def cvSelect(*pArgs):
-    ''' Allows selection of all of first input nurbsShape's CVs
+    ''' Allows selection of all CVs of every selected nurbs control
+    
+        On Exit: All CVs of all shapes of the selected controls are selected and active.'''
+
+    selectCVs(cmds.ls(sl=True))
+
+
+def selectCVs(nodes, select=True):
+    ''' Gather the CV components of every curve shape under the given controls, and select them in one call
     
-        On Exit: All CVs of first given shape are selected and active.'''
+        nodes : controls (transforms) and/or curve shapes
+        select : replace the selection with the CVs. Pass False to only get the component list, e.g. for bulk shape edits.
+        
+        On Exit:
+        Returns the list of "shape.cv[0:n]" components, one per curve shape.'''
+
+    shapes = cmds.ls(resolveShapes(nodes), type="nurbsCurve", long=True) or []
+    components = []
 
-    # Get list of all selected objs, and clear selection 
-    selected = cmds.ls(sl=True)
-    cmds.select(clear=True)
+    for shape in shapes:
+        spans = cmds.getAttr("%s.spans" % shape)
+        degree = cmds.getAttr("%s.degree" % shape)
 
-    # Gets list of shapes in first nurb object
-    for i in range(len(selected)):
-        shapes = cmds.listRelatives(selected[0], s=True) 
+        # Periodic curves (form 2, e.g. circles) wrap their last 'degree' CVs onto the first ones,
+        # so only 'spans' of them are distinct components. Open and closed curves have spans+degree.
+        if cmds.getAttr("%s.form" % shape) == 2:
+            numCVs = spans
+        else:
+            numCVs = spans + degree
 
-        for i in range(len(shapes)):
-            # Get spans and degrees of each shape to calculate num of CVs, and select them additively.
+        components.append("%s.cv[0:%i]" % (shape, numCVs - 1))
 
-            spans = cmds.getAttr("%s.spans" % shapes[i])
-            degree = cmds.getAttr("%s.degree" % shapes[i])
-            numCVs = (spans+degree) - 1
-            
-            cmds.select("%s.cv[0:%i]" % (shapes[i], numCVs), add=True)
+    if select and components:
+        cmds.select(components, replace=True)
+    elif select:
+        cmds.select(clear=True)
+
+    return components
         
 def closeWindow(myWin, *pArgs ):
 
@@ -310,6 +1206,8 @@ def closeWindow(myWin, *pArgs ):
         myWin : the specific instance of nurbCtrl's GUI window'''
 
     if cmds.window(myWin, exists=True):
-        cmds.deleteUI(myWin) 
-        
-createCtrlGUI()
\ No newline at end of file
+        cmds.deleteUI(myWin)
+
+
+if __name__ == "__main__":
+    createCtrlGUI()
@@ -0,0 +1,856 @@
+''' Pure-Python stand-in for the subset of maya.cmds used by the rigging tools, for running them outside of Maya.
+
+    Models the DAG (transforms, shapes, world matrices, freezing), Maya-style unique name auto-increment,
+    attributes and connections, nurbsCurve data, and the selection (including the selection changes
+    Maya makes when nodes are created). Every command call is counted.
+
+    UI commands are accepted and do nothing, so the GUI modules import cleanly.
+
+    Scenes can be saved to and loaded from JSON scene files (saveScene/loadScene), e.g. for batch_runner.
+
+    For example:
+        import offline_cmds
+        cmds = offline_cmds.install()           # registered as maya.cmds
+        import nurbCtrls
+        nurbCtrls.nurbDiamond()
+        print(cmds.counts)'''
+
+import fnmatch
+import json
+import math
+import re
+import sys
+import types
+
+IDENTITY = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+# Version of the JSON scene files written by saveScene.
+SCENE_VERSION = 1
+
+# Node types and the types they inherit from (for type= filters), and which of them are shapes.
+INHERITED_TYPES = {"joint" : ("transform",), "ikHandle" : ("transform",), "ikEffector" : ("transform",)}
+SHAPE_TYPES = set(["nurbsCurve", "locator", "mesh"])
+DAG_TYPES = set(["transform", "joint", "ikHandle", "ikEffector"]) | SHAPE_TYPES
+
+# Values returned by getAttr for attributes that have never been set.
+ATTR_DEFAULTS = {"overrideEnabled" : False, "overrideRGBColors" : False, "overrideColor" : 0,
+                 "overrideColorRGB" : [(0.0, 0.0, 0.0)], "visibility" : True,
+                 "rotate" : [(0.0, 0.0, 0.0)], "jointOrient" : [(0.0, 0.0, 0.0)]}
+
+# UI commands: accepted and ignored.
+UI_COMMANDS = set(["window", "showWindow", "deleteUI", "rowColumnLayout", "rowLayout", "columnLayout", "text",
+                   "separator", "button", "optionMenu", "menuItem", "colorIndexSliderGrp", "colorSliderGrp", "floatField",
+                   "textField", "checkBox", "fileDialog2", "shelfLayout", "shelfButton", "setParent"])
+
+_SUFFIX = re.compile(r"^(.*?)(\d*)$")
+
+
+class Node(object):
+    ''' A DG/DAG node: name, type, parent/children (DAG only), attribute values and, for curves, curve data'''
+
+    def __init__(self, name, nodeType):
+        self.name = name
+        self.type = nodeType
+        self.parent = None
+        self.children = []
+        self.attrs = {}
+        self.userAttrs = []
+        self.matrix = list(IDENTITY)
+        self.pivot = (0.0, 0.0, 0.0)
+        self.curve = None
+        self.points = None
+        self.history = []
+
+    def isA(self, nodeType):
+        return self.type == nodeType or nodeType in INHERITED_TYPES.get(self.type, ())
+
+    def isShape(self):
+        return self.type in SHAPE_TYPES
+
+    def path(self):
+        names = []
+        node = self
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return "|" + "|".join(reversed(names))
+
+
+def multMatrix(a, b):
+    ''' a * b for row-major 4x4 matrices stored as flat lists (Maya's row-vector convention: local * parent)'''
+
+    return [sum(a[row*4 + k] * b[k*4 + col] for k in range(4)) for row in range(4) for col in range(4)]
+
+
+def inverseMatrix(m):
+    ''' inverse of a flat 4x4 matrix, by Gauss-Jordan elimination'''
+
+    rows = [list(m[i*4:i*4 + 4]) + [1.0 if i == j else 0.0 for j in range(4)] for i in range(4)]
+
+    for col in range(4):
+        pivot = max(range(col, 4), key=lambda r: abs(rows[r][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        scale = rows[col][col]
+        if abs(scale) < 1e-12:
+            raise ValueError("Matrix is singular")
+        rows[col] = [v / scale for v in rows[col]]
+        for r in range(4):
+            if r != col and rows[r][col]:
+                factor = rows[r][col]
+                rows[r] = [v - factor * p for v, p in zip(rows[r], rows[col])]
+
+    return [rows[i][4 + j] for i in range(4) for j in range(4)]
+
+
+def rotationMatrix(ro):
+    ''' flat 4x4 matrix of an xyz rotate order rotation (degrees), in Maya's row-vector convention'''
+
+    cx, cy, cz = [math.cos(math.radians(a)) for a in ro]
+    sx, sy, sz = [math.sin(math.radians(a)) for a in ro]
+    rx = [1, 0, 0, 0, 0, cx, sx, 0, 0, -sx, cx, 0, 0, 0, 0, 1]
+    ry = [cy, 0, -sy, 0, 0, 1, 0, 0, sy, 0, cy, 0, 0, 0, 0, 1]
+    rz = [cz, sz, 0, 0, -sz, cz, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+    return multMatrix(multMatrix(rx, ry), rz)
+
+
+def translationMatrix(t):
+    return [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, t[0], t[1], t[2], 1]
+
+
+def transformPoint(point, m):
+    ''' point (x, y, z) * matrix m'''
+
+    x, y, z = point
+    return (x*m[0] + y*m[4] + z*m[8] + m[12], x*m[1] + y*m[5] + z*m[9] + m[13], x*m[2] + y*m[6] + z*m[10] + m[14])
+
+
+def _flatten(values):
+    ''' flatten nested lists/tuples of setAttr values'''
+
+    flat = []
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            flat.extend(_flatten(value))
+        else:
+            flat.append(value)
+    return flat
+
+
+def _asList(nodes):
+    if nodes is None:
+        return []
+    if isinstance(nodes, (list, tuple)):
+        return _flatten(nodes)
+    return [nodes]
+
+
+class OfflineCmds(types.ModuleType):
+    ''' In-memory scene with a maya.cmds style interface. Unsupported commands raise AttributeError.'''
+
+    def __init__(self):
+        types.ModuleType.__init__(self, "maya.cmds")
+        self.counts = {}
+        self.selectionChanges = 0
+        self.nameClashes = 0
+        self.newScene()
+
+    # --- Scene bookkeeping (not maya.cmds commands, not counted) ---
+
+    def newScene(self):
+        ''' Empty the scene, keeping command counts'''
+
+        self.nodes = {}
+        self.sources = {}           # destination plug -> source plug
+        self.nodeConnections = {}   # node name -> [(source plug, destination plug)] it takes part in
+        self.selection = []
+        self._nextSuffix = {}
+
+        # Called with no arguments after every selection change, standing in for Maya's SelectionChanged listeners
+        # (Outliner, channel box, attribute editor). Kept across newScene.
+        if not hasattr(self, "selectionCallbacks"):
+            self.selectionCallbacks = []
+
+        # Called as callback(event, *args) for every scene change, standing in for Maya's scene messages (e.g. for
+        # scene_cache). Events: "nodeAdded" (path), "nodeRemoved" (path), "nodeRenamed" (old path, new name),
+        # "parentChanged" (old path, new path), "attributeChanged" (plug), "sceneCleared" (). Kept across newScene.
+        if not hasattr(self, "sceneCallbacks"):
+            self.sceneCallbacks = []
+        self._sceneEvent("sceneCleared")
+
+    def sceneData(self):
+        ''' The scene as JSON-ready data: nodes (parents before children) with their attributes, curves and mesh points, and connections.
+            The selection isn't saved.'''
+
+        roots = [node for node in self.nodes.values() if node.parent is None]
+        ordered = []
+        for root in sorted(roots, key=lambda node: node.name):
+            ordered.append(root)
+            ordered.extend(self._descendants(root))
+
+        nodes = []
+        for node in ordered:
+            data = {"name" : node.name, "type" : node.type}
+            if node.parent is not None:
+                data["parent"] = node.parent.name
+            if node.matrix != IDENTITY:
+                data["matrix"] = node.matrix
+            if node.pivot != (0.0, 0.0, 0.0):
+                data["pivot"] = list(node.pivot)
+            for key in ("attrs", "userAttrs", "curve", "points", "history"):
+                if getattr(node, key):
+                    data[key] = getattr(node, key)
+            nodes.append(data)
+
+        return {"version" : SCENE_VERSION, "nodes" : nodes, "connections" : sorted([source, destination] for destination, source in self.sources.items())}
+
+    def loadSceneData(self, data):
+        ''' Replace the scene with one from sceneData(), keeping command counts'''
+
+        if data.get("version") != SCENE_VERSION:
+            raise ValueError("Unsupported scene version: %s" % data.get("version"))
+
+        self.newScene()
+        for nodeData in data["nodes"]:
+            node = Node(nodeData["name"], nodeData["type"])
+            self.nodes[node.name] = node
+            if "parent" in nodeData:
+                self._reparent(node, self.nodes[nodeData["parent"]])
+            node.matrix = [float(v) for v in nodeData.get("matrix", IDENTITY)]
+            node.pivot = tuple(nodeData.get("pivot", (0.0, 0.0, 0.0)))
+            node.userAttrs = list(nodeData.get("userAttrs", []))
+            node.history = list(nodeData.get("history", []))
+            # JSON turns the tuples of compound values (e.g. [(r, g, b)]) and CVs into lists.
+            for attr, value in nodeData.get("attrs", {}).items():
+                if isinstance(value, list) and value and isinstance(value[0], list):
+                    value = [tuple(item) for item in value]
+                node.attrs[attr] = value
+            if "curve" in nodeData:
+                node.curve = dict(nodeData["curve"])
+                node.curve["cvs"] = [tuple(cv) for cv in node.curve["cvs"]]
+            if "points" in nodeData:
+                node.points = [tuple(point) for point in nodeData["points"]]
+
+        for source, destination in data.get("connections", []):
+            self._connect(source, destination)
+
+    def saveScene(self, path):
+        ''' Write the scene to a JSON scene file, see sceneData()'''
+
+        sceneFile = open(path, "w")
+        try:
+            json.dump(self.sceneData(), sceneFile, sort_keys=True)
+        finally:
+            sceneFile.close()
+
+    def loadScene(self, path):
+        ''' Replace the scene with a JSON scene file's, see loadSceneData()'''
+
+        sceneFile = open(path)
+        try:
+            self.loadSceneData(json.load(sceneFile))
+        finally:
+            sceneFile.close()
+
+    def reset(self):
+        ''' Clear command counts, selection change counts and name clash counts'''
+
+        self.counts = {}
+        self.selectionChanges = 0
+        self.nameClashes = 0
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def __getattr__(self, command):
+        if command in UI_COMMANDS:
+            counted = self._command(command, lambda *args, **kwargs: None if kwargs.get("q") or kwargs.get("query") else "%s1" % command)
+        elif command.startswith("_") or not hasattr(type(self), "cmd_" + command):
+            raise AttributeError("offline_cmds does not support '%s'" % command)
+        else:
+            counted = self._command(command, getattr(self, "cmd_" + command))
+
+        # Cache the counted command, so later calls skip __getattr__.
+        setattr(self, command, counted)
+        return counted
+
+    def _command(self, command, func):
+        def counted(*args, **kwargs):
+            self.counts[command] = self.counts.get(command, 0) + 1
+            return func(*args, **kwargs)
+        counted.__name__ = command
+        return counted
+
+    def uniqueName(self, name):
+        ''' name, or the next free name with the same base (Maya-style auto-increment: foo1 -> foo2)'''
+
+        if name not in self.nodes:
+            return name
+
+        # Counted: every clash is a scene-wide name search in Maya, and an unpredictable name for the caller.
+        self.nameClashes += 1
+        base, digits = _SUFFIX.match(name).groups()
+        number = max(int(digits or 0), self._nextSuffix.get(base, 1))
+        while "%s%i" % (base, number) in self.nodes:
+            number += 1
+        self._nextSuffix[base] = number + 1
+        return "%s%i" % (base, number)
+
+    def node(self, name):
+        ''' Node for a name, path or plug/component (RuntimeError, as Maya raises, if missing)'''
+
+        key = name.split(".", 1)[0].split("|")[-1]
+        if key not in self.nodes:
+            raise RuntimeError("No object matches name: %s" % name)
+        return self.nodes[key]
+
+    def curveKnots(self, shape):
+        ''' A curve shape's knots, standing in for MFnNurbsCurve.knots() (an API call in Maya, so not a counted command)'''
+
+        return list(self.node(shape).curve["knots"])
+
+    def addNode(self, name, nodeType, parent=None):
+        node = Node(self.uniqueName(name), nodeType)
+        self.nodes[node.name] = node
+        if parent is not None:
+            self._reparent(node, parent)
+        self._sceneEvent("nodeAdded", self._name(node, True))
+        return node
+
+    def worldMatrix(self, node):
+        matrix = node.matrix
+        parent = node.parent
+        while parent is not None:
+            matrix = multMatrix(matrix, parent.matrix)
+            parent = parent.parent
+        return matrix
+
+    def _reparent(self, node, parent):
+        oldPath = self._name(node, True)
+        if node.parent is not None:
+            node.parent.children.remove(node)
+        node.parent = parent
+        if parent is not None:
+            parent.children.append(node)
+        self._sceneEvent("parentChanged", oldPath, self._name(node, True))
+
+    def _sceneEvent(self, event, *args):
+        for callback in self.sceneCallbacks:
+            callback(event, *args)
+
+    def _descendants(self, node):
+        result = []
+        stack = list(reversed(node.children))
+        while stack:
+            child = stack.pop()
+            result.append(child)
+            stack.extend(reversed(child.children))
+        return result
+
+    def _name(self, node, long):
+        return node.path() if long and node.type in DAG_TYPES else node.name
+
+    def _setSelection(self, nodes):
+        if nodes != self.selection:
+            self.selection = nodes
+            self.selectionChanges += 1
+            for callback in self.selectionCallbacks:
+                callback()
+
+    def _nodesOrSelection(self, args):
+        names = _asList(args[0] if len(args) == 1 else list(args)) if args else []
+        return [self.node(name) for name in names] if names else list(self.selection)
+
+    # --- Node creation ---
+
+    def cmd_createNode(self, nodeType, n=None, name=None, p=None, parent=None, ss=False, skipSelect=False):
+        parentNode = self.node(p or parent) if (p or parent) else None
+        if nodeType in SHAPE_TYPES and parentNode is None:
+            parentNode = self.addNode(nodeType + "1" if nodeType != "nurbsCurve" else "curve1", "transform")
+        node = self.addNode(n or name or "%s1" % nodeType, nodeType, parentNode)
+        if node.type in DAG_TYPES and not (ss or skipSelect):
+            self._setSelection([node])
+        return node.name
+
+    def cmd_group(self, *objects, **kwargs):
+        parentName = kwargs.get("p") or kwargs.get("parent")
+        grp = self.addNode(kwargs.get("n") or kwargs.get("name") or "group1", "transform", self.node(parentName) if parentName else None)
+        if not (kwargs.get("em") or kwargs.get("empty")):
+            for node in self._nodesOrSelection(objects):
+                self._parentKeepWorld(node, grp)
+        self._setSelection([grp])
+        return grp.name
+
+    def _createCurveObject(self, name, shapeName, points, periodic, parent=None, historyType=None):
+        xform = self.addNode(name, "transform", parent)
+        shape = self.addNode(shapeName, "nurbsCurve", xform)
+        knots = range(-2, len(points)) if periodic else [0, 0, 0, 1, 1, 1]
+        shape.curve = {"degree" : 3, "form" : 2 if periodic else 0, "knots" : [float(k) for k in knots], "cvs" : list(points)}
+        if historyType:
+            shape.history.append(self.addNode(historyType + "1", historyType).name)
+        return xform
+
+    def cmd_circle(self, n=None, name=None):
+        radius = 6.0 / (4.0 + math.sqrt(2.0))
+        points = [(radius * math.cos(math.radians(45 + 45*i)), radius * math.sin(math.radians(45 + 45*i)), 0.0) for i in range(8)]
+        xform = self._createCurveObject(n or name or "nurbsCircle1", "nurbsCircleShape1", points + points[:3], True, historyType="makeNurbCircle")
+        self._setSelection([xform])
+        return [xform.name, self.node(xform.children[0].history[0]).name]
+
+    def cmd_nurbsSquare(self, n=None, name=None):
+        square = self.addNode(n or name or "nurbsSquare1", "transform")
+        corners = [(0.5, 0.5, 0.0), (-0.5, 0.5, 0.0), (-0.5, -0.5, 0.0), (0.5, -0.5, 0.0)]
+        for i, side in enumerate(["top", "left", "bottom", "right"]):
+            start, end = corners[i], corners[(i + 1) % 4]
+            points = [tuple(start[a] + (end[a] - start[a]) * k / 3.0 for a in range(3)) for k in range(4)]
+            self._createCurveObject(side + square.name, side + square.name + "Shape", points, False, square)
+        # One history node feeds all four sides.
+        history = self.addNode("makeNurbsSquare1", "makeNurbsSquare")
+        for side in square.children:
+            side.children[0].history.append(history.name)
+        self._setSelection([square])
+        return [square.name, history.name]
+
+    def cmd_polyCube(self, w=1.0, h=1.0, d=1.0, width=None, height=None, depth=None, n=None, name=None):
+        xform = self.addNode(n or name or "pCube1", "transform")
+        mesh = self.addNode(xform.name.replace("pCube", "pCubeShape") if "pCube" in xform.name else xform.name + "Shape", "mesh", xform)
+        size = (width or w, height or h, depth or d)
+        mesh.points = [(x * size[0] / 2.0, y * size[1] / 2.0, z * size[2] / 2.0) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]
+        history = self.addNode("polyCube1", "polyCube")
+        self._setSelection([xform])
+        return [xform.name, history.name]
+
+    def cmd_spaceLocator(self, n=None, name=None):
+        xform = self.addNode(n or name or "locator1", "transform")
+        self.addNode(xform.name.replace("locator", "locatorShape") if "locator" in xform.name else xform.name + "Shape", "locator", xform)
+        self._setSelection([xform])
+        return [xform.name]
+
+    def cmd_ikHandle(self, sj=None, ee=None, n=None, name=None, startJoint=None, endEffector=None):
+        for joint in (sj or startJoint, ee or endEffector):
+            self.node(joint)
+        handle = self.addNode(n or name or "ikHandle1", "ikHandle")
+        effector = self.addNode("effector1", "ikEffector", self.node(ee or endEffector))
+        self._setSelection([handle])
+        return [handle.name, effector.name]
+
+    # --- Hierarchy ---
+
+    def _parentKeepWorld(self, node, parent):
+        world = self.worldMatrix(node)
+        self._reparent(node, parent)
+        node.matrix = multMatrix(world, inverseMatrix(self.worldMatrix(parent))) if parent is not None else world
+
+    def cmd_parent(self, *args, **kwargs):
+        names = _flatten(args)
+        if kwargs.get("w") or kwargs.get("world"):
+            children, parent = names, None
+        else:
+            children, parent = names[:-1], self.node(names[-1])
+        relative = kwargs.get("r") or kwargs.get("relative") or kwargs.get("s") or kwargs.get("shape")
+
+        result = []
+        for child in [self.node(name) for name in children]:
+            if relative:
+                self._reparent(child, parent)
+            else:
+                self._parentKeepWorld(child, parent)
+            result.append(child.name)
+        return result
+
+    def cmd_listRelatives(self, *args, **kwargs):
+        shapes = kwargs.get("s") or kwargs.get("shapes")
+        parentFlag = kwargs.get("p") or kwargs.get("parent")
+        descendants = kwargs.get("ad") or kwargs.get("allDescendents")
+        nodeType = kwargs.get("type")
+        long = kwargs.get("f") or kwargs.get("fullPath")
+
+        result = []
+        for node in self._nodesOrSelection(args):
+            if parentFlag:
+                related = [node.parent] if node.parent is not None else []
+            elif descendants:
+                related = self._descendants(node)
+            else:
+                related = node.children
+            if shapes:
+                related = [rel for rel in related if rel.isShape()]
+            if nodeType:
+                related = [rel for rel in related if any(rel.isA(t) for t in _asList(nodeType))]
+            result.extend(self._name(rel, long) for rel in related)
+
+        if parentFlag:
+            seen = set()
+            result = [name for name in result if not (name in seen or seen.add(name))]
+        return result or None
+
+    def cmd_rename(self, old, new):
+        node = self.node(old)
+        oldName = node.name
+        self._sceneEvent("nodeRenamed", self._name(node, True), new.split("|")[-1])
+        del self.nodes[oldName]
+        node.name = self.uniqueName(new.split("|")[-1])
+        self.nodes[node.name] = node
+
+        # Connections refer to plugs by name, so move the renamed node's over to its new name.
+        for src, dst in list(self.nodeConnections.get(oldName, [])):
+            self._disconnect(src, dst)
+            self._connect(self._renamedPlug(src, oldName, node.name), self._renamedPlug(dst, oldName, node.name))
+        return node.name
+
+    def _renamedPlug(self, plug, oldName, newName):
+        nodeName, attr = plug.split(".", 1)
+        return "%s.%s" % (newName if nodeName == oldName else nodeName, attr)
+
+    def cmd_delete(self, *args, **kwargs):
+        nodes = self._nodesOrSelection(args)
+
+        if kwargs.get("ch") or kwargs.get("constructionHistory"):
+            for node in nodes:
+                for shape in [node] + self._descendants(node):
+                    for history in shape.history:
+                        if self.nodes.pop(history, None) is not None:
+                            self._sceneEvent("nodeRemoved", history)
+                    shape.history = []
+            return
+
+        for node in nodes:
+            if node.name not in self.nodes:
+                continue
+            for dead in [node] + self._descendants(node):
+                self._sceneEvent("nodeRemoved", self._name(dead, True))
+                self.nodes.pop(dead.name, None)
+                for src, dst in list(self.nodeConnections.get(dead.name, [])):
+                    self._disconnect(src, dst)
+            self._reparent(node, None)
+        self._setSelection([node for node in self.selection if node.name in self.nodes])
+
+    def cmd_objExists(self, name):
+        nodeName, _, attr = name.partition(".")
+        node = self.nodes.get(nodeName.split("|")[-1])
+        if node is None:
+            return False
+        return not attr or attr in node.attrs or attr in node.userAttrs or attr in ATTR_DEFAULTS
+
+    # --- Selection ---
+
+    def cmd_select(self, *args, **kwargs):
+        if kwargs.get("cl") or kwargs.get("clear"):
+            self._setSelection([])
+            return
+        nodes = [self.node(name) for name in _flatten(args)] if args else []
+        if kwargs.get("add"):
+            nodes = self.selection + [node for node in nodes if node not in self.selection]
+        elif kwargs.get("d") or kwargs.get("deselect"):
+            nodes = [node for node in self.selection if node not in nodes] if nodes else []
+        self._setSelection(nodes)
+
+    def cmd_ls(self, *args, **kwargs):
+        long = kwargs.get("l") or kwargs.get("long")
+        components = []
+        if kwargs.get("sl") or kwargs.get("selection"):
+            nodes = list(self.selection)
+        elif args:
+            nodes = []
+            for name in _flatten(args):
+                # Every vertex of a mesh (or of a transform's mesh) lists as one compacted range.
+                if name.endswith(".vtx[*]"):
+                    mesh = self._mesh(self.nodes.get(name.split(".", 1)[0].split("|")[-1]))
+                    if mesh is not None:
+                        components.append("%s.vtx[0:%i]" % (name.split(".", 1)[0], len(mesh.points) - 1))
+                    continue
+                name = name.split(".", 1)[0].split("|")[-1]
+                # Prefix patterns ("foo*", as NameAllocator looks names up) skip the general wildcard match.
+                if name.endswith("*") and not any(c in name[:-1] for c in "*?["):
+                    nodes.extend(node for key, node in self.nodes.items() if key.startswith(name[:-1]))
+                    continue
+                if "*" in name or "?" in name:
+                    nodes.extend(node for key, node in self.nodes.items() if fnmatch.fnmatchcase(key, name))
+                    continue
+                node = self.nodes.get(name)
+                if node is not None:
+                    nodes.append(node)
+        else:
+            nodes = list(self.nodes.values())
+
+        nodeType = kwargs.get("type")
+        if nodeType:
+            nodes = [node for node in nodes if any(node.isA(t) for t in _asList(nodeType))]
+        if kwargs.get("shapes"):
+            nodes = [node for node in nodes if node.isShape()]
+        if kwargs.get("transforms"):
+            nodes = [node for node in nodes if node.isA("transform")]
+        return [self._name(node, long) for node in nodes] + components
+
+    def _mesh(self, node):
+        ''' node if it is a mesh, its first mesh shape if it is a transform, else None'''
+
+        if node is None or node.points is not None:
+            return node
+        return next((child for child in node.children if child.points is not None), None)
+
+    def cmd_pickWalk(self, direction="up", d=None):
+        if (d or direction) == "up":
+            self._setSelection([node.parent or node for node in self.selection])
+        return [node.name for node in self.selection]
+
+    # --- Transforms ---
+
+    def cmd_xform(self, *args, **kwargs):
+        nodes = self._nodesOrSelection(args)
+        query = kwargs.get("q") or kwargs.get("query")
+        worldSpace = kwargs.get("ws") or kwargs.get("worldSpace")
+        matrix = kwargs.get("m", kwargs.get("matrix"))
+        pivots = kwargs.get("piv", kwargs.get("pivots"))
+
+        if query:
+            node = nodes[0]
+            if matrix is not None:
+                return self.worldMatrix(node) if worldSpace else list(node.matrix)
+            if kwargs.get("rp") or kwargs.get("rotatePivot"):
+                return list(transformPoint(node.pivot, self.worldMatrix(node)) if worldSpace else node.pivot)
+            if kwargs.get("t") or kwargs.get("translation"):
+                # Several objects (or vertex ranges, "mesh.vtx[0:7]") give all their positions in one flat list.
+                names = _flatten(args) or [node.name for node in nodes]
+                values = []
+                for name in names:
+                    node = self.node(name)
+                    vertices = re.search(r"\.vtx\[(\d+)(?::(\d+))?\]$", name)
+                    if vertices:
+                        mesh = self._mesh(node)
+                        first = int(vertices.group(1))
+                        last = int(vertices.group(2) or first)
+                        matrix = self.worldMatrix(mesh) if worldSpace else IDENTITY
+                        values.extend(v for point in mesh.points[first:last + 1] for v in transformPoint(point, matrix))
+                    else:
+                        values.extend((self.worldMatrix(node) if worldSpace else node.matrix)[12:15])
+                return values
+            raise RuntimeError("offline_cmds xform query supports m, rp and t")
+
+        relative = kwargs.get("r") or kwargs.get("relative")
+        rotation = kwargs.get("ro", kwargs.get("rotation"))
+        translation = kwargs.get("t", kwargs.get("translation"))
+
+        for node in nodes:
+            # Relative rotations turn about the node's rotate pivot. They compose with any earlier rotation,
+            # which matches Maya's channel addition for the single rotations the tools make before freezing.
+            if relative and rotation is not None:
+                pivot = node.pivot
+                turn = multMatrix(multMatrix(translationMatrix([-v for v in pivot]), rotationMatrix(rotation)), translationMatrix(pivot))
+                node.matrix = multMatrix(turn, node.matrix)
+            if translation is not None:
+                for axis in range(3):
+                    node.matrix[12 + axis] = (node.matrix[12 + axis] if relative else 0.0) + float(translation[axis])
+            if matrix is not None:
+                matrix = [float(v) for v in matrix]
+                node.matrix = multMatrix(matrix, inverseMatrix(self.worldMatrix(node.parent))) if worldSpace and node.parent else matrix
+            if pivots is not None:
+                node.pivot = transformPoint(pivots, inverseMatrix(self.worldMatrix(node))) if worldSpace else tuple(pivots)
+
+    def cmd_move(self, x, y, z, *args, **kwargs):
+        ''' move supports setting pivots ("node.rotatePivot", "node.scalePivot") to a world position'''
+
+        for name in _flatten(args):
+            node, _, attr = name.partition(".")
+            if attr not in ("rotatePivot", "rp", "scalePivot", "sp") or kwargs.get("r") or kwargs.get("relative"):
+                raise RuntimeError("offline_cmds move supports absolute pivot moves only")
+            node = self.node(node)
+            if attr in ("rotatePivot", "rp"):
+                node.pivot = transformPoint((x, y, z), inverseMatrix(self.worldMatrix(node)))
+
+    def cmd_makeIdentity(self, *args, **kwargs):
+        for node in self._nodesOrSelection(args):
+            self._freeze(node, list(IDENTITY))
+
+    def _freeze(self, node, inherited):
+        matrix = multMatrix(node.matrix, inherited)
+        for child in node.children:
+            if child.isShape() and child.curve:
+                child.curve["cvs"] = [transformPoint(cv, matrix) for cv in child.curve["cvs"]]
+            elif not child.isShape():
+                self._freeze(child, matrix)
+        node.matrix = list(IDENTITY)
+
+    # --- Attributes and connections ---
+
+    def cmd_addAttr(self, node, longName=None, ln=None, dv=None, defaultValue=None, **kwargs):
+        node = self.node(node)
+        attr = longName or ln
+        if attr in node.userAttrs:
+            raise RuntimeError("Found a duplicate attribute name: %s" % attr)
+        node.userAttrs.append(attr)
+        node.attrs[attr] = dv if dv is not None else (defaultValue or 0)
+        self._sceneEvent("attributeChanged", "%s.%s" % (node.name, attr))
+
+    def cmd_listAttr(self, *args, **kwargs):
+        node = self._nodesOrSelection(args)[0]
+        if kwargs.get("ud") or kwargs.get("userDefined"):
+            return list(node.userAttrs) or None
+        return sorted(set(node.attrs) | set(ATTR_DEFAULTS) | set(node.userAttrs))
+
+    def cmd_setAttr(self, plug, *values, **kwargs):
+        node = self.node(plug)
+        attr = plug.split(".", 1)[1]
+        self._sceneEvent("attributeChanged", "%s.%s" % (node.name, attr))
+
+        if kwargs.get("type") == "nurbsCurve":
+            flat = _flatten(values)
+            degree, form = int(flat[0]), int(flat[2])
+            numKnots = int(flat[5])
+            knots = [float(k) for k in flat[6:6 + numKnots]]
+            numCVs = int(flat[6 + numKnots])
+            coords = [float(v) for v in flat[7 + numKnots:]]
+            node.curve = {"degree" : degree, "form" : form, "knots" : knots, "cvs" : [tuple(coords[i*3:i*3 + 3]) for i in range(numCVs)]}
+            return
+
+        cv = re.match(r"(?:cv|controlPoints)\[(\d+)\]$", attr)
+        if cv:
+            index = int(cv.group(1))
+            point = tuple(float(v) for v in _flatten(values))
+            node.curve["cvs"][index] = point
+            if node.curve["form"] == 2 and index < node.curve["degree"]:
+                node.curve["cvs"][index - node.curve["degree"]] = point
+            return
+
+        flat = _flatten(values)
+        axis = {"translateX" : 12, "translateY" : 13, "translateZ" : 14, "tx" : 12, "ty" : 13, "tz" : 14}.get(attr)
+        if axis is not None:
+            node.matrix[axis] = float(flat[0])
+        elif attr in ("translate", "t"):
+            node.matrix[12:15] = [float(v) for v in flat]
+        elif kwargs.get("type") == "stringArray":
+            # Maya takes the string count first.
+            node.attrs[attr] = list(flat[1:])
+        elif kwargs.get("type") in ("doubleArray", "Int32Array") or len(flat) > 3:
+            node.attrs[attr] = list(flat)
+        elif len(flat) == 1:
+            node.attrs[attr] = flat[0]
+        else:
+            node.attrs[attr] = [tuple(flat)]
+
+    def cmd_getAttr(self, plug, **kwargs):
+        node = self.node(plug)
+        attr = plug.split(".", 1)[1]
+
+        if attr in ("worldMatrix", "worldMatrix[0]", "wm[0]"):
+            return self.worldMatrix(node)
+        if attr in ("matrix", "m"):
+            return list(node.matrix)
+        axis = {"translateX" : 12, "translateY" : 13, "translateZ" : 14, "tx" : 12, "ty" : 13, "tz" : 14}.get(attr)
+        if axis is not None:
+            return node.matrix[axis]
+        if attr in ("translate", "t"):
+            return [tuple(node.matrix[12:15])]
+
+        if node.curve is not None:
+            curve = node.curve
+            if attr == "degree":
+                return curve["degree"]
+            if attr == "form":
+                return curve["form"]
+            if attr == "spans":
+                return len(curve["cvs"]) - curve["degree"]
+            cv = re.match(r"(?:cv|controlPoints)\[(\*|\d+)\]$", attr)
+            if cv:
+                # Periodic curves only expose their distinct CVs, the wrapped ones repeat the first 'degree'.
+                cvs = curve["cvs"][:-curve["degree"]] if curve["form"] == 2 else curve["cvs"]
+                return list(cvs) if cv.group(1) == "*" else [cvs[int(cv.group(1))]]
+
+        # curveInfo reports on whichever curve is connected to its inputCurve.
+        if node.type == "curveInfo" and attr in ("knots[*]", "knots"):
+            source = self.sources.get("%s.inputCurve" % node.name)
+            return list(self.node(source).curve["knots"]) if source else []
+
+        if attr in node.attrs:
+            return node.attrs[attr]
+        return ATTR_DEFAULTS.get(attr, 0)
+
+    def _connect(self, source, destination):
+        self.sources[destination] = source
+        for plug in (source, destination):
+            self.nodeConnections.setdefault(plug.split(".")[0], []).append((source, destination))
+            self._sceneEvent("attributeChanged", plug)
+
+    def _disconnect(self, source, destination):
+        if self.sources.get(destination) != source:
+            return
+        del self.sources[destination]
+        for plug in (source, destination):
+            connections = self.nodeConnections.get(plug.split(".")[0], [])
+            if (source, destination) in connections:
+                connections.remove((source, destination))
+            self._sceneEvent("attributeChanged", plug)
+
+    def _plug(self, plug):
+        ''' Plug name as Maya reports it: node name and leaf attribute ("joint1.translate.translateX" -> "joint1.translateX")'''
+
+        return "%s.%s" % (self.node(plug).name, plug.split(".")[-1])
+
+    def cmd_connectAttr(self, source, destination, f=False, force=False):
+        source = self._plug(source)
+        destination = self._plug(destination)
+        if destination in self.sources:
+            if not (f or force):
+                raise RuntimeError("%s is already connected" % destination)
+            self._disconnect(self.sources[destination], destination)
+        self._connect(source, destination)
+
+    def cmd_disconnectAttr(self, source, destination):
+        self._disconnect(self._plug(source), self._plug(destination))
+
+    def cmd_listConnections(self, *args, **kwargs):
+        sources = kwargs.get("s", kwargs.get("source", True))
+        destinations = kwargs.get("d", kwargs.get("destination", True))
+        plugs = kwargs.get("p") or kwargs.get("plugs")
+        pairs = kwargs.get("c") or kwargs.get("connections")
+        nodeType = kwargs.get("type")
+
+        names = _flatten(args) if args else [node.name for node in self.selection]
+        result = []
+        for name in names:
+            isPlug = "." in name
+            nodeName = self.node(name).name
+            if isPlug:
+                name = self._plug(name)
+            for src, dst in self.nodeConnections.get(nodeName, []):
+                for mine, other, wanted in ((dst, src, sources), (src, dst, destinations)):
+                    matches = mine == name if isPlug else mine.split(".")[0] == nodeName
+                    if not (wanted and matches):
+                        continue
+                    if nodeType and not self.node(other).isA(nodeType):
+                        continue
+                    if pairs:
+                        result.append(mine)
+                    result.append(other if plugs else other.split(".")[0])
+        return result or None
+
+    # --- Undo and refresh: nothing to do offline ---
+
+    def cmd_undoInfo(self, *args, **kwargs):
+        return None
+
+    def cmd_refresh(self, *args, **kwargs):
+        return None
+
+    def cmd_matchTransform(self, *args, **kwargs):
+        nodes = self._nodesOrSelection(args)
+        for node in nodes[:-1]:
+            self.cmd_xform(node.name, worldSpace=True, matrix=self.worldMatrix(nodes[-1]))
+
+
+def install():
+    ''' Register an OfflineCmds as maya.cmds (once; use newScene() to start over), refusing to replace a real Maya
+
+        On Exit:
+        Returns the installed OfflineCmds. Tool modules must be imported after this to pick it up.'''
+
+    current = sys.modules.get("maya.cmds")
+    if isinstance(current, OfflineCmds):
+        return current
+    if current is not None:
+        raise RuntimeError("maya.cmds is already loaded")
+
+    maya = sys.modules.get("maya") or types.ModuleType("maya")
+    maya.cmds = OfflineCmds()
+    sys.modules["maya"] = maya
+    sys.modules["maya.cmds"] = maya.cmds
+    return maya.cmds
@@ -0,0 +1,382 @@
+''' Operation recorder: plan a tool's scene edits, then commit them as one batch and one undo step.
+
+    Tools given a recorder call its createNode, connectAttr, setAttr, parent, rename, ... instead of cmds'.
+    Nothing touches the scene until commit(), which first simplifies the plan (see OperationRecorder.plan)
+    and then hands it to a modifier that applies it in a single undo chunk with viewport refresh suspended.
+
+    Created nodes must be named up front (see name_allocator), so later operations can refer to them.
+    Reads still go to cmds and see the scene as last committed, apart from the recorder's own objExists and
+    getAttr, which take the plan into account.
+
+    For example:
+        ops = OperationRecorder()
+        create_group.makeOffsetGrps(objects, ops=ops)
+        ik_limb_gui.stretchSwitch(ankle, settings, ops=ops)
+        ops.commit(dryRun=True)         # print the plan
+        ops.commit()                    # apply it'''
+
+import re
+
+import maya.cmds as cmds
+
+# Name types: JSON and Maya can hand back unicode names under Python 2.
+_STRING_TYPES = (str, type(u""))
+
+# Recorded commands the plan never needs: headless tools don't depend on the selection or the viewport.
+DROPPED_COMMANDS = ("select", "refresh")
+
+# Hooks tracing planned commands back to whoever recorded them, set by cmds_profiler while it is enabled:
+# recordHook() names the caller recording an operation, and CmdsModifier applies each planned command inside
+# replayHook(name), a context manager, so its cost lands on the caller that recorded it rather than the one committing.
+recordHook = None
+replayHook = None
+
+
+def _short(name):
+    ''' node short name of a node, path or plug'''
+
+    return name.split(".")[0].split("|")[-1]
+
+
+def _plugKey(plug):
+    ''' plug as (node short name, leaf attribute), so "a|b.translate.translateX" and "b.translateX" match'''
+
+    return (_short(plug), plug.split(".")[-1])
+
+
+def _renamed(value, old, new):
+    ''' value (a name, path, plug or list of them) with every reference to node old replaced by new'''
+
+    if isinstance(value, (list, tuple)):
+        return type(value)(_renamed(item, old, new) for item in value)
+    if isinstance(value, _STRING_TYPES):
+        return re.sub(r"(?<![\w:])%s(?![\w:])" % re.escape(old), new, value)
+    return value
+
+
+def _flat(args):
+    ''' command arguments with any lists of names expanded'''
+
+    return [name for arg in args for name in (arg if isinstance(arg, (list, tuple)) else [arg])]
+
+
+def _historyOnly(kwargs):
+    ''' True for a delete that only removes construction history'''
+
+    return bool(kwargs.get("ch") or kwargs.get("constructionHistory"))
+
+
+class OperationRecorder(object):
+    ''' Collects scene edits in cmds' form, and commits them as one simplified batch'''
+
+    def __init__(self):
+        self.operations = []
+        self._sources = []
+
+        # Planned existence of nodes and attributes ("node" or "node.attr" -> bool), and planned plug values.
+        self._exists = {}
+        self._values = {}
+
+    # --- Recorded commands (same arguments as cmds) ---
+
+    def createNode(self, nodeType, n=None, name=None, p=None, parent=None, **kwargs):
+        nodeName = n or name
+        if not nodeName:
+            raise ValueError("OperationRecorder.createNode needs a node name, e.g. from a NameAllocator")
+
+        kwargs["n"] = nodeName
+        if p or parent:
+            kwargs["p"] = p or parent
+        if not kwargs.get("skipSelect"):
+            kwargs["ss"] = True
+
+        self._record("createNode", [nodeType], kwargs)
+        self._exists[nodeName] = True
+        return nodeName
+
+    def rename(self, old, new):
+        self._record("rename", [old, new], {})
+        self._exists[_short(old)] = False
+        self._exists[new] = True
+        return new
+
+    def parent(self, *args, **kwargs):
+        self._record("parent", list(args), kwargs)
+        children = _flat(args if kwargs.get("w") or kwargs.get("world") else args[:-1])
+        return [_short(child) for child in children]
+
+    def addAttr(self, node, **kwargs):
+        self._record("addAttr", [node], kwargs)
+        self._exists["%s.%s" % (_short(node), kwargs.get("longName") or kwargs.get("ln"))] = True
+
+    def setAttr(self, plug, *values, **kwargs):
+        self._record("setAttr", [plug] + list(values), kwargs)
+        if kwargs.get("type") == "stringArray":
+            # Planned as getAttr returns it: the strings, without the count setAttr takes first.
+            self._values[_plugKey(plug)] = list(values[1:])
+        elif kwargs.get("type") in ("doubleArray", "Int32Array"):
+            self._values[_plugKey(plug)] = list(values[0])
+        else:
+            self._values[_plugKey(plug)] = values[0] if len(values) == 1 else [tuple(values)]
+
+    def connectAttr(self, source, destination, **kwargs):
+        self._record("connectAttr", [source, destination], kwargs)
+
+    def disconnectAttr(self, source, destination):
+        self._record("disconnectAttr", [source, destination], {})
+
+    def delete(self, *args, **kwargs):
+        self._record("delete", list(args), kwargs)
+        if not _historyOnly(kwargs):
+            for name in _flat(args):
+                self._exists[_short(name)] = False
+
+    def xform(self, *args, **kwargs):
+        if kwargs.get("q") or kwargs.get("query"):
+            return cmds.xform(*args, **kwargs)
+        self._record("xform", list(args), kwargs)
+
+    def select(self, *args, **kwargs):
+        self._record("select", list(args), kwargs)
+
+    def refresh(self, *args, **kwargs):
+        self._record("refresh", list(args), kwargs)
+
+    def _record(self, command, args, kwargs):
+        self.operations.append((command, args, kwargs))
+        self._sources.append(recordHook() if recordHook else None)
+
+    # --- Plan-aware reads ---
+
+    def objExists(self, name):
+        ''' cmds.objExists, as the scene will be once the plan is committed'''
+
+        key = "%s.%s" % (_short(name), name.split(".", 1)[1]) if "." in name else _short(name)
+        if key in self._exists:
+            return self._exists[key]
+        if self._exists.get(_short(name)) is False:
+            return False
+        return cmds.objExists(name)
+
+    def getAttr(self, plug, **kwargs):
+        ''' cmds.getAttr, returning the planned value of plugs the plan sets'''
+
+        if _plugKey(plug) in self._values:
+            return self._values[_plugKey(plug)]
+        return cmds.getAttr(plug, **kwargs)
+
+    # --- Planning and committing ---
+
+    def plan(self, sources=False):
+        ''' The recorded operations, simplified:
+                - select and refresh calls are dropped
+                - rename chains collapse into one rename, or into the name a planned node is created with
+                - nodes created and deleted within the plan are never made, nor edited
+                - only the last setAttr of a plug, and the last connection into a destination, is kept
+                - repeated addAttrs of the same attribute are dropped
+                - nodes created at the world root or under planned nodes are created first (nothing else can
+                  depend on them not existing yet); everything else keeps its recorded order
+
+            sources : also return who recorded each planned command (see recordHook), None where unknown
+
+            On Exit:
+            Returns (plan, dropped): the list of (command, args, kwargs), and {reason : operations dropped}.
+            With sources, returns (plan, dropped, sources), sources matching plan item for item.'''
+
+        dropped = {}
+        def drop(reason, count=1):
+            dropped[reason] = dropped.get(reason, 0) + count
+
+        ops = []
+        # Each operation carries its source along, whatever happens to it below.
+        for (command, args, kwargs), source in zip(self.operations, self._sources):
+            if command in DROPPED_COMMANDS:
+                drop(command)
+            else:
+                ops.append([command, list(args), dict(kwargs), source])
+
+        # Rename chains: fold each rename into the create (or earlier rename) that made the old name.
+        made = {}
+        for i, op in enumerate(ops):
+            command, args, kwargs = op[:3]
+            if command == "createNode":
+                made[kwargs["n"]] = i
+            elif command == "rename" and _short(args[0]) in made:
+                old, new = _short(args[0]), args[1]
+                first = made.pop(old)
+                if ops[first][0] == "createNode":
+                    ops[first][2]["n"] = new
+                else:
+                    ops[first][1][1] = new
+                for later in [later for later in ops[first + 1:i] if later is not None]:
+                    later[1] = _renamed(later[1], old, new)
+                    later[2] = dict((key, _renamed(value, old, new)) for key, value in later[2].items())
+                made[new] = first
+                ops[i] = None
+                drop("rename")
+            elif command == "rename":
+                made[args[1]] = i
+        ops = [op for op in ops if op is not None]
+
+        # Nodes created then deleted within the plan are never made, nor are their own edits. Nodes that had anything
+        # parented under them, or that drove another node's plug, are still made: deleting them has side effects.
+        created = set(op[2]["n"] for op in ops if op[0] == "createNode")
+        doomed = set()
+        for command, args, kwargs, source in ops:
+            if command == "delete" and not _historyOnly(kwargs):
+                doomed.update(_short(name) for name in _flat(args) if _short(name) in created)
+        for command, args, kwargs, source in ops:
+            if command == "parent" and not (kwargs.get("w") or kwargs.get("world")):
+                doomed.discard(_short(args[-1]))
+            elif command == "createNode" and kwargs.get("p"):
+                doomed.discard(_short(kwargs["p"]))
+            elif command == "connectAttr":
+                doomed.discard(_short(args[0]))
+
+        if doomed:
+            kept = []
+            for op in ops:
+                command, args, kwargs = op[:3]
+                if command == "createNode":
+                    target = kwargs["n"]
+                elif command in ("connectAttr", "disconnectAttr"):
+                    target = _short(args[1])
+                elif command == "parent":
+                    target = _short(args[0]) if len(_flat(args)) == 2 else None
+                elif command == "delete" and not _historyOnly(kwargs):
+                    names = [name for name in _flat(args) if _short(name) not in doomed]
+                    if len(names) < len(_flat(args)):
+                        drop("created and deleted", len(_flat(args)) - len(names))
+                    if not names:
+                        continue
+                    op[1], target = names, None
+                else:
+                    target = _short(args[0])
+
+                if target in doomed:
+                    drop("created and deleted")
+                else:
+                    kept.append(op)
+            ops = kept
+
+        # Last setAttr per plug, last connection per destination (unless disconnected in between),
+        # first addAttr per attribute.
+        setPlugs, connected, kept = set(), set(), []
+        for op in reversed(ops):
+            command, args, kwargs = op[:3]
+            if command == "setAttr":
+                if _plugKey(args[0]) in setPlugs:
+                    drop("setAttr")
+                    continue
+                setPlugs.add(_plugKey(args[0]))
+            elif command == "connectAttr":
+                if _plugKey(args[1]) in connected:
+                    drop("connectAttr")
+                    continue
+                connected.add(_plugKey(args[1]))
+            elif command == "disconnectAttr":
+                connected.discard(_plugKey(args[1]))
+            kept.append(op)
+        kept.reverse()
+
+        attrs, ops = set(), []
+        for op in kept:
+            if op[0] == "addAttr":
+                key = (_short(op[1][0]), op[2].get("longName") or op[2].get("ln"))
+                if key in attrs:
+                    drop("addAttr")
+                    continue
+                attrs.add(key)
+            ops.append(op)
+
+        # Hoist creations that depend on nothing else in the plan, unless an earlier operation freed their name.
+        hoisted, freed, first, rest = set(), set(), [], []
+        for op in ops:
+            command, args, kwargs = op[:3]
+            if command == "createNode" and kwargs["n"] not in freed and (not kwargs.get("p") or _short(kwargs["p"]) in hoisted):
+                if kwargs.get("p"):
+                    kwargs["p"] = _short(kwargs["p"])
+                hoisted.add(kwargs["n"])
+                first.append(op)
+                continue
+            if command == "delete" and not _historyOnly(kwargs):
+                freed.update(_short(name) for name in _flat(args))
+            elif command == "rename":
+                freed.add(_short(args[0]))
+            rest.append(op)
+
+        plan = [(command, args, kwargs) for command, args, kwargs, source in first + rest]
+        if sources:
+            return plan, dropped, [source for command, args, kwargs, source in first + rest]
+        return plan, dropped
+
+    def format(self, plan=None, dropped=None):
+        ''' The plan as text, one cmds call per line, after a summary of what was dropped'''
+
+        if plan is None:
+            plan, dropped = self.plan()
+
+        lines = ["# %i operations recorded, %i planned" % (len(self.operations), len(plan))]
+        if dropped:
+            lines[0] += " (dropped: %s)" % ", ".join("%i %s" % (count, reason) for reason, count in sorted(dropped.items()))
+        for command, args, kwargs in plan:
+            arguments = [repr(arg) for arg in args] + ["%s=%r" % item for item in sorted(kwargs.items())]
+            lines.append("cmds.%s(%s)" % (command, ", ".join(arguments)))
+        return "\n".join(lines)
+
+    def commit(self, dryRun=False, chunkName="OperationRecorder", modifier=None):
+        ''' Apply the simplified plan, as one undo step
+
+            dryRun : print the plan instead of applying it (the recording is kept)
+            chunkName : name of the undo chunk
+            modifier : what applies the plan, defaults to a CmdsModifier
+
+            On Exit:
+            Returns the plan. Unless dryRun, the scene is changed and the recorder is emptied for reuse.
+            An empty plan doesn't reach the modifier, so it leaves no undo step.'''
+
+        plan, dropped, sources = self.plan(sources=True)
+
+        if dryRun:
+            print(self.format(plan, dropped))
+            return plan
+
+        if plan:
+            modifier = modifier or CmdsModifier()
+            if isinstance(modifier, CmdsModifier):
+                modifier.doIt(plan, chunkName, sources)
+            else:
+                modifier.doIt(plan, chunkName)
+        self.operations = []
+        self._sources = []
+        self._exists = {}
+        self._values = {}
+        return plan
+
+
+class CmdsModifier(object):
+    ''' Applies a plan through maya.cmds (or any stand-in for it) in one undo chunk, with viewport refresh suspended.
+        Anything with the same doIt(plan, chunkName) can replace it, e.g. to apply plans through a plugin command.
+
+        commands : module to run the plan's commands through, defaults to whatever cmds is at doIt time'''
+
+    def __init__(self, commands=None):
+        self.commands = commands
+
+    def doIt(self, plan, chunkName, sources=None):
+        ''' Apply plan. sources : who recorded each planned command (see OperationRecorder.plan), for replayHook'''
+
+        commands = self.commands or cmds
+
+        commands.undoInfo(openChunk=True, chunkName=chunkName)
+        commands.refresh(suspend=True)
+        try:
+            for (command, args, kwargs), source in zip(plan, sources or [None] * len(plan)):
+                if replayHook and source is not None:
+                    with replayHook(source):
+                        getattr(commands, command)(*args, **kwargs)
+                else:
+                    getattr(commands, command)(*args, **kwargs)
+        finally:
+            commands.refresh(suspend=False)
+            commands.undoInfo(closeChunk=True)
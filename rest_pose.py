@@ -0,0 +1,181 @@
+''' Rest-pose snapshots: a skeleton's translate/rotate/jointOrient values, recorded once and stored on a rig metadata node.
+
+    Tools that need rest values (e.g. ik_limb_gui's stretch toggle rest lengths) read them from the snapshot instead of
+    the live pose, so rebuilding a network while the rig is posed or stretched still captures the rest lengths, and a
+    whole batch of limbs is served by one read of the snapshot.
+
+    The snapshot lives on a network node as array attributes: the joints' full paths (stringArray), and one doubleArray
+    per channel with 3 values per joint, in the same order.
+
+    For example:
+        rest_pose.snapshotRestPose()                # every joint in the scene, while it is in its rest pose
+        ...
+        rest_pose.diffPose()["changed"]             # {joint : {"rotate" : (rest, current)}, ...}'''
+
+import maya.cmds as cmds
+
+from op_recorder import OperationRecorder
+
+# Rig metadata node holding the snapshot.
+REST_POSE_NODE = "rigRestPose"
+
+# Snapshot attributes: the joints, and the channel each doubleArray attribute holds.
+REST_POSE_JOINTS_ATTR = "restJoints"
+REST_POSE_CHANNELS = (("translate", "restTranslate"), ("rotate", "restRotate"), ("jointOrient", "restJointOrient"))
+
+# Largest difference from the rest pose diffPose still counts as unchanged.
+DIFF_TOLERANCE = 1e-4
+
+
+def _livePose(joints):
+    ''' joints' current values, {channel : [x, y, z per joint]}, read in one pass over the joints'''
+
+    pose = dict((channel, []) for channel, attr in REST_POSE_CHANNELS)
+    for joint in joints:
+        for channel, attr in REST_POSE_CHANNELS:
+            pose[channel].extend(cmds.getAttr("%s.%s" % (joint, channel))[0])
+    return pose
+
+
+def _storedPose(node, reader):
+    ''' the snapshot's joints and {channel : flat values} as stored on node, or ([], {}) if it has none'''
+
+    if not reader.objExists("%s.%s" % (node, REST_POSE_JOINTS_ATTR)):
+        return [], {}
+    joints = list(reader.getAttr("%s.%s" % (node, REST_POSE_JOINTS_ATTR)) or [])
+    return joints, dict((channel, list(reader.getAttr("%s.%s" % (node, attr)) or [])) for channel, attr in REST_POSE_CHANNELS)
+
+
+def snapshotRestPose(joints=None, node=REST_POSE_NODE, ops=None):
+    ''' Record joints' current translate/rotate/jointOrient as their rest pose
+
+        joints : joints to record, defaults to every joint in the scene
+        node : metadata node to store the snapshot on, created (as a network node) if it doesn't exist
+        ops : OperationRecorder to record the edits into, for the caller to commit. By default they are committed straight away.
+
+        On Exit:
+        The joints' values written to node's array attributes, replacing any earlier snapshot of the same joints and
+        keeping those of other joints. Returns the whole snapshot, as readRestPose would.'''
+
+    recorder = ops or OperationRecorder()
+    joints = cmds.ls(joints, type="joint", long=True) if joints is not None else cmds.ls(type="joint", long=True)
+    joints = joints or []
+
+    stored, values = _storedPose(node, recorder)
+    live = _livePose(joints)
+    recorded = set(joints)
+
+    # Earlier entries of joints not being recorded now are kept, ahead of the new ones.
+    kept = [i for i, joint in enumerate(stored) if joint not in recorded]
+    paths = [stored[i] for i in kept] + joints
+    pose = dict((channel, [v for i in kept for v in values[channel][i * 3:i * 3 + 3]] + live[channel])
+                for channel, attr in REST_POSE_CHANNELS)
+
+    if not recorder.objExists(node):
+        recorder.createNode("network", n=node)
+    if not recorder.objExists("%s.%s" % (node, REST_POSE_JOINTS_ATTR)):
+        recorder.addAttr(node, longName=REST_POSE_JOINTS_ATTR, dataType="stringArray")
+    recorder.setAttr("%s.%s" % (node, REST_POSE_JOINTS_ATTR), len(paths), *paths, type="stringArray")
+    for channel, attr in REST_POSE_CHANNELS:
+        if not recorder.objExists("%s.%s" % (node, attr)):
+            recorder.addAttr(node, longName=attr, dataType="doubleArray")
+        recorder.setAttr("%s.%s" % (node, attr), pose[channel], type="doubleArray")
+
+    if ops is None:
+        recorder.commit(chunkName="snapshotRestPose")
+
+    return _indexed(paths, pose)
+
+
+def readRestPose(node=REST_POSE_NODE, ops=None):
+    ''' The rest pose snapshot stored on node
+
+        ops : OperationRecorder whose planned snapshot (see snapshotRestPose) should be read, if any
+
+        On Exit:
+        Returns {joint : {"translate", "rotate", "jointOrient" : (x, y, z)}}, keyed by full path and, where no other
+        recorded joint shares it, by short name. Empty if node holds no snapshot.'''
+
+    paths, pose = _storedPose(node, ops or cmds)
+    return _indexed(paths, pose)
+
+
+def _indexed(paths, pose):
+    ''' snapshot lookup (see readRestPose) from its joints and flat channel values'''
+
+    snapshot = {}
+    leaves = {}
+    for i, path in enumerate(paths):
+        snapshot[path] = dict((channel, tuple(pose[channel][i * 3:i * 3 + 3])) for channel, attr in REST_POSE_CHANNELS)
+        leaves.setdefault(path.split("|")[-1], []).append(path)
+
+    for leaf, matches in leaves.items():
+        if len(matches) == 1 and leaf not in snapshot:
+            snapshot[leaf] = snapshot[matches[0]]
+    return snapshot
+
+
+def diffPose(joints=None, node=REST_POSE_NODE, tolerance=DIFF_TOLERANCE):
+    ''' Compare joints' current pose against the rest pose snapshot
+
+        joints : joints to compare, defaults to every joint in the snapshot
+        tolerance : largest difference in any axis still treated as unchanged
+
+        On Exit:
+        Returns {"changed" : {joint path : {channel : (rest (x, y, z), current (x, y, z))}} for channels that moved,
+                 "missing" : snapshot joints no longer in the scene,
+                 "unrecorded" : joints asked about that the snapshot doesn't cover}'''
+
+    stored, values = _storedPose(node, cmds)
+    snapshot = _indexed(stored, values)
+    if joints is None:
+        present = cmds.ls(stored, long=True) if stored else []
+        missing = sorted(set(stored) - set(present))
+    else:
+        present = cmds.ls(joints, type="joint", long=True) or []
+        missing = []
+
+    unrecorded = [joint for joint in present if joint not in snapshot and joint.split("|")[-1] not in snapshot]
+    compared = [joint for joint in present if joint not in unrecorded]
+    live = _livePose(compared)
+
+    changed = {}
+    for i, joint in enumerate(compared):
+        rest = snapshot.get(joint) or snapshot[joint.split("|")[-1]]
+        for channel, attr in REST_POSE_CHANNELS:
+            current = tuple(live[channel][i * 3:i * 3 + 3])
+            if any(abs(a - b) > tolerance for a, b in zip(rest[channel], current)):
+                changed.setdefault(joint, {})[channel] = (rest[channel], current)
+
+    return {"changed" : changed, "missing" : missing, "unrecorded" : unrecorded}
+
+
+def _selectedSkeletons():
+    ''' the selected joints and every joint below them, or None if no joints are selected'''
+
+    selected = cmds.ls(sl=True, type="joint", long=True)
+    if not selected:
+        return None
+    return selected + (cmds.listRelatives(selected, allDescendents=True, type="joint", fullPath=True) or [])
+
+
+def snapshotSelected(*pArgs):
+    ''' GUI callback: snapshot the rest pose of the selected skeletons (selected joints and their children),
+        or of every joint if no joints are selected'''
+
+    pose = snapshotRestPose(_selectedSkeletons())
+    print("Rest pose snapshot holds %i joints" % len([joint for joint in pose if joint.startswith("|")]))
+
+
+def reportPoseDiff(*pArgs):
+    ''' GUI callback: print how the selected skeletons (or every snapshot joint) differ from the rest pose snapshot'''
+
+    diff = diffPose(_selectedSkeletons())
+    for joint in sorted(diff["changed"]):
+        for channel, (rest, current) in sorted(diff["changed"][joint].items()):
+            print("%s.%s: rest %s, now %s" % (joint, channel, tuple(round(v, 4) for v in rest), tuple(round(v, 4) for v in current)))
+    for joint in diff["missing"]:
+        print("%s: in the snapshot, but no longer in the scene" % joint)
+    for joint in diff["unrecorded"]:
+        print("%s: not in the snapshot" % joint)
+    print("%i joints differ from the rest pose" % len(diff["changed"]))
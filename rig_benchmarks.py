@@ -0,0 +1,1058 @@
+''' Command count and wall time benchmarks for the rigging tools, run outside of Maya.
+
+    The tools run unchanged against offline_cmds, an in-memory stand-in for maya.cmds, so every command is
+    counted and the timings are of the tools' own Python plus a cheap scene model. Command counts are what
+    a live Maya session would have to execute.
+
+    Usage:
+        python rig_benchmarks.py                run every benchmark
+        python rig_benchmarks.py shapes ...     run the named benchmarks'''
+
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import offline_cmds
+
+# Scene sizes swept by the scaling benchmark.
+SCALING_SIZES = (10, 100, 1000, 10000)
+
+
+def installCmds():
+    ''' Register offline_cmds as maya.cmds (once) so the tool modules can be imported without Maya.
+
+        On Exit:
+        Returns the OfflineCmds scene, emptied.'''
+
+    cmds = offline_cmds.install()
+    cmds.newScene()
+    return cmds
+
+
+def installStubModule(name):
+    ''' Register an empty module for a lecturer-provided dependency that isn't distributed with these tools'''
+
+    if name not in sys.modules:
+        sys.modules[name] = types.ModuleType(name)
+    return sys.modules[name]
+
+
+def report(label, count, cmds, seconds):
+    ''' Print one result row: commands issued per item and wall time'''
+
+    print("%-36s %6i items %9i cmds %8.2f cmds/item %9.4f s %8.1f us/item" %
+          (label, count, cmds.total(), cmds.total() / float(count), seconds, seconds * 1e6 / count))
+
+
+def timed(cmds, func):
+    ''' Run func with fresh command counts, returning its wall time'''
+
+    cmds.reset()
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def makeJoints(cmds, count, prefix="joint"):
+    ''' count joints spread along X under a "skeleton" group, returning their names'''
+
+    root = cmds.group(em=True, n="skeleton")
+    joints = []
+    for i in range(count):
+        joint = cmds.createNode("joint", n="%s%i" % (prefix, i), p=root)
+        cmds.xform(joint, worldSpace=True, matrix=[1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, i, 0, 0, 1])
+        joints.append(joint)
+    return joints
+
+
+def makeLimbs(cmds, count):
+    ''' count stretchy result chains (hip > knee > ankle, knee and ankle driven through unitConversion nodes),
+        each with a settings control. Returns (ankle joint, settings control) pairs.'''
+
+    limbs = []
+    for i in range(count):
+        side = "l_" if i % 2 else "r_"
+        hip = cmds.createNode("joint", n="%sLeg%i_hip_result" % (side, i))
+        knee = cmds.createNode("joint", n="%sLeg%i_knee_result" % (side, i), p=hip)
+        ankle = cmds.createNode("joint", n="%sLeg%i_ankle_result" % (side, i), p=knee)
+        for joint in (knee, ankle):
+            cmds.setAttr("%s.translateX" % joint, 4.0)
+            conversion = cmds.createNode("unitConversion", n="%s_unitConversion" % joint)
+            cmds.connectAttr("%s.output" % conversion, "%s.translateX" % joint)
+        settings = cmds.createNode("transform", n="%sLeg%i_settings_ctrl" % (side, i))
+        limbs.append((ankle, settings))
+    return limbs
+
+
+def makeNestedCtrls(cmds, count, depth=10):
+    ''' count controls nested in chains of depth, returning their names'''
+
+    ctrls = []
+    for chain in range(max(1, count // depth)):
+        parent = None
+        for link in range(min(depth, count)):
+            parent = cmds.createNode("transform", n="chain%i_ctrl%i" % (chain, link), p=parent)
+            cmds.setAttr("%s.translateX" % parent, 1.0)
+            ctrls.append(parent)
+    return ctrls
+
+
+def benchShapes(count=1000):
+    ''' Build count controls of every shape library type with nurbCtrls.buildCtrl'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    for shapeType in sorted(nurbCtrls.shapeLibrary()):
+        cmds.newScene()
+        names = NameAllocator(indexScene=True)
+        seconds = timed(cmds, lambda: [nurbCtrls.buildCtrl(shapeType, names=names) for i in range(count)])
+        report(shapeType, count, cmds, seconds)
+
+
+def legacyShape(cmds, shapeType):
+    ''' Build a library shape the way nurbCtrls did before the shape library: Maya primitives, moved, rotated and
+        frozen. Returns the top-level transforms holding its curves, in the order cleanupCtrl merged them.'''
+
+    if shapeType == "nurbsCircle":
+        return [cmds.circle()[0]]
+
+    if shapeType == "nurbsSquare":
+        return [cmds.nurbsSquare()[0]]
+
+    if shapeType == "nurbsSphere":
+        circles = [cmds.circle()[0]]
+        for ro in ([90,0,0], [0,90,0]):
+            circles.append(cmds.circle()[0])
+            cmds.xform(r=True, ro=ro)
+        cmds.makeIdentity(circles, apply=True)
+        return circles
+
+    if shapeType == "nurbsCube":
+        squares = []
+        for t, ro in (([-0.5,0,0], [0,90,0]), ([0.5,0,0], [0,-90,0]), ([0,0,-0.5], [0,0,0]), ([0,0,0.5], [0,0,0])):
+            squares.append(cmds.nurbsSquare()[0])
+            cmds.xform(r=True, t=t, ro=ro)
+        cmds.makeIdentity(squares, apply=True)
+        return squares
+
+    if shapeType == "nurbsPyramid":
+        dirList = ["top", "left", "bottom", "right"]
+        xcoordList = (0.5, 0.5, -0.5, -0.5)
+        zcoordList = (0.5, -0.5, -0.5, 0.5)
+        pivotList = ([45,0,-45], [0,-45,-45], [-45,0,-45], [0,45,-45])
+        pyrSides = cmds.nurbsSquare()
+        cmds.xform(r=True, ro=[90,0,0])
+        for i in range(len(dirList)):
+            relativeList = cmds.listRelatives(pyrSides[0])
+            cmds.rename(relativeList[i], "%s%s" % (dirList[i], pyrSides[0]))
+            cmds.move(xcoordList[i], 0, zcoordList[i], "%s%s.scalePivot" % (dirList[i], pyrSides[0]),
+                      "%s%s.rotatePivot" % (dirList[i], pyrSides[0]), absolute=True)
+            cmds.select("%s%s" % (dirList[i], pyrSides[0]))
+            cmds.xform(r=True, ro=pivotList[i])
+        pyrBase = cmds.nurbsSquare()
+        cmds.xform(r=True, ro=[90,0,0])
+        cmds.makeIdentity([pyrSides[0], pyrBase[0]], apply=True)
+        return [pyrSides[0], pyrBase[0]]
+
+    if shapeType == "nurbsDiamond":
+        bottomHalf = legacyShape(cmds, "nurbsPyramid")
+        topHalf = cmds.group(*legacyShape(cmds, "nurbsPyramid"))
+        cmds.xform(topHalf, r=True, ro=[180,0,0])
+        cmds.makeIdentity(topHalf, apply=True)
+        return bottomHalf + [topHalf]
+
+    raise ValueError("No legacy construction for %s" % shapeType)
+
+
+def benchLegacyShapes(tolerance=1e-6):
+    ''' Every library shape must match the old primitive construction's frozen curves (degree, form, knots and CVs,
+        curve by curve).'''
+
+    cmds = installCmds()
+    import nurbCtrls
+
+    def curves(roots):
+        return [cmds.nodes[shape].curve for shape in cmds.listRelatives(roots, allDescendents=True, type="nurbsCurve")]
+
+    for shapeType in sorted(nurbCtrls.shapeLibrary()):
+        cmds.newScene()
+        roots = []
+        seconds = timed(cmds, lambda: roots.extend(legacyShape(cmds, shapeType)))
+        legacy = curves(roots)
+        report("%s (legacy construction)" % shapeType, 1, cmds, seconds)
+        built = curves(nurbCtrls.buildCtrl(shapeType, "library1"))
+
+        assert len(built) == len(legacy), "%s has %i curves, the old construction %i" % (shapeType, len(built), len(legacy))
+        for i, (old, new) in enumerate(zip(legacy, built)):
+            assert (old["degree"], old["form"], old["knots"]) == (new["degree"], new["form"], new["knots"]), "%s curve %i" % (shapeType, i)
+            deviation = max(abs(a - b) for oldCV, newCV in zip(old["cvs"], new["cvs"]) for a, b in zip(oldCV, newCV))
+            assert len(old["cvs"]) == len(new["cvs"]) and deviation <= tolerance, \
+                "%s curve %i is %.2e from the old construction" % (shapeType, i, deviation)
+
+
+def benchCleanupCtrl(count=100):
+    ''' Merge circle and nurbsSquare primitives with cleanupCtrl: each must become one control with named shapes,
+        and no leftover transforms or construction history.'''
+
+    cmds = installCmds()
+    import nurbCtrls
+
+    for create, name, shapes in ((cmds.circle, "nurbsCircle1", 1), (cmds.nurbsSquare, "nurbsSquare1", 4)):
+        cmds.newScene()
+        primitives = [create()[0] for i in range(count)]
+        ctrls = []
+        seconds = timed(cmds, lambda: ctrls.extend(nurbCtrls.cleanupCtrl(name, primitive) for primitive in primitives))
+        report("cleanupCtrl (%s)" % name[:-1], count, cmds, seconds)
+
+        assert sorted(cmds.ls(type="transform")) == sorted(ctrls), "cleanupCtrl should leave only the controls"
+        for ctrl in ctrls:
+            assert cmds.listRelatives(ctrl, shapes=True) == ["%sShape" % ctrl] + ["%sShape%i" % (ctrl, i) for i in range(1, shapes)]
+        assert not cmds.ls(type=["makeNurbCircle", "makeNurbsSquare"]), "cleanupCtrl should delete construction history"
+
+
+def benchCtrlPerTransform(sizes=(100, 1000, 10000)):
+    ''' Batch-build circle controls on increasing numbers of joints, commands per control should stay flat'''
+
+    cmds = installCmds()
+    import nurbCtrls
+
+    for size in sizes:
+        cmds.newScene()
+        joints = makeJoints(cmds, size)
+        seconds = timed(cmds, lambda: nurbCtrls.ctrlPerTransform("nurbsCircle", joints, colour=14))
+        report("ctrlPerTransform", size, cmds, seconds)
+
+
+def benchColour(count=5000):
+    ''' Colour count shapes: first pass writes, a repeat pass should only read, then recolour by side prefix'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    sides = ["l_", "r_", "c_"]
+    names = NameAllocator(indexScene=True)
+    ctrls = [nurbCtrls.buildCtrl("nurbsCircle", "%sctrl%i" % (sides[i % 3], i), names=names) for i in range(count)]
+
+    for label, colourFunc in [("applyColour (first)", lambda: nurbCtrls.applyColour(ctrls, 18)),
+                              ("applyColour (repeat)", lambda: nurbCtrls.applyColour(ctrls, 18)),
+                              ("colourByRule (sides)", lambda: nurbCtrls.colourByRule(ctrls, nurbCtrls.SIDE_COLOURS))]:
+        report(label, count, cmds, timed(cmds, colourFunc))
+
+
+def benchCVSelect(sizes=(100, 1000, 10000)):
+    ''' Gather and select the CVs of increasing numbers of controls, selection changes should stay at one'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    for size in sizes:
+        cmds.newScene()
+        names = NameAllocator(indexScene=True)
+        ctrls = [nurbCtrls.buildCtrl("nurbsCube", names=names) for i in range(size)]
+        seconds = timed(cmds, lambda: nurbCtrls.selectCVs(ctrls))
+        report("selectCVs (%i selection change)" % cmds.selectionChanges, size, cmds, seconds)
+
+
+def benchOffsetGrps(count=1000, depth=10):
+    ''' Offset-group count controls, nested in chains of depth, with a two group stack each'''
+
+    cmds = installCmds()
+    import create_group
+
+    ctrls = makeNestedCtrls(cmds, count, depth)
+    seconds = timed(cmds, lambda: create_group.makeOffsetGrps(ctrls, ("_offsetGrp", "_sdkGrp")))
+    report("makeOffsetGrps (2 groups)", len(ctrls), cmds, seconds)
+
+
+def benchStretchSwitch(limbs=50):
+    ''' Stretch toggle networks for limbs limbs, one blendColors node per joint against packed R/G/B channels.
+
+        Reports DG nodes and connections created. Evaluation time of the resulting graphs needs a live Maya session.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import ik_limb_gui
+    from name_allocator import NameAllocator
+
+    for packed in (False, True):
+        cmds.newScene()
+        pairs = makeLimbs(cmds, limbs)
+        names = NameAllocator(indexScene=True)
+        seconds = timed(cmds, lambda: [ik_limb_gui.stretchSwitch(ankle, settings, packed=packed, names=names) for ankle, settings in pairs])
+        label = "stretchSwitch %s (%i nodes, %i conns)" % ("packed" if packed else "per joint", len(cmds.ls(type="blendColors")), len(cmds.sources))
+        report(label, limbs, cmds, seconds)
+
+
+def benchProfile(count=100):
+    ''' Run a mix of tools under cmds_profiler and print its per-command report. The edits tools make through an
+        OperationRecorder must be counted against the tool that recorded them, even when the plan is committed
+        outside any tool.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import cmds_profiler
+    import create_group
+    import ik_limb_gui
+    import nurbCtrls
+    from op_recorder import OperationRecorder
+
+    limbs = makeLimbs(cmds, count)
+    ctrls = makeNestedCtrls(cmds, count)
+
+    cmds_profiler.reset()
+    cmds_profiler.enable()
+    try:
+        for ankle, settings in limbs[:count // 2]:
+            nurbCtrls.nurbDiamond()
+            nurbCtrls.nurbSphere()
+            ik_limb_gui.stretchSwitch(ankle, settings)
+        create_group.makeOffsetGrps(ctrls)
+
+        ops = OperationRecorder()
+        for ankle, settings in limbs[count // 2:]:
+            ik_limb_gui.stretchSwitch(ankle, settings, ops=ops)
+        ops.commit()
+    finally:
+        cmds_profiler.disable()
+
+    print(cmds_profiler.report())
+
+    tools = dict((row["command"], row["tools"]) for row in cmds_profiler.stats())
+    # Each limb connects a toggle, stretch source and joint per joint (2 joints).
+    assert tools["connectAttr"].get("ik_limb_gui.stretchSwitch") == count * 6, "stretchSwitch's connectAttrs are missing: %s" % tools["connectAttr"]
+    assert tools["createNode"].get("create_group.makeOffsetGrps") == count, "makeOffsetGrps' createNodes are missing"
+    assert "undoInfo" in tools and "ls" in tools, "commits' undo chunks and name indexing should be profiled"
+    # Only the external commit's own undo chunk and refresh belong to no tool.
+    assert [command for command, counts in tools.items() if "<none>" in counts] in ([], ["refresh", "undoInfo"], ["undoInfo", "refresh"])
+
+
+def benchScaling(sizes=SCALING_SIZES):
+    ''' Sweep scene size for each tool. Each tool works on every item of a scene of that size, so us/item and
+        cmds/item should stay flat as the scene grows; growth means non-linear behaviour.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import create_group
+    import ik_limb_gui
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    # Each setup builds a scene of the given size and returns the work to time on it.
+    # Batches share one NameAllocator, as the tools' own batch functions do.
+    def diamonds(size):
+        names = NameAllocator(indexScene=True)
+        return lambda: [nurbCtrls.buildCtrl("nurbsDiamond", names=names) for i in range(size)]
+
+    def ctrlPerTransform(size):
+        joints = makeJoints(cmds, size)
+        return lambda: nurbCtrls.ctrlPerTransform("nurbsCircle", joints)
+
+    def colourByRule(size):
+        names = NameAllocator(indexScene=True)
+        ctrls = [nurbCtrls.buildCtrl("nurbsCircle", "l_ctrl%i" % i, names=names) for i in range(size)]
+        return lambda: nurbCtrls.colourByRule(ctrls, nurbCtrls.SIDE_COLOURS)
+
+    def selectCVs(size):
+        names = NameAllocator(indexScene=True)
+        ctrls = [nurbCtrls.buildCtrl("nurbsSquare", names=names) for i in range(size)]
+        return lambda: nurbCtrls.selectCVs(ctrls)
+
+    def offsetGrps(size):
+        ctrls = makeNestedCtrls(cmds, size)
+        return lambda: create_group.makeOffsetGrps(ctrls)
+
+    def stretchSwitch(size):
+        limbs = makeLimbs(cmds, max(1, size // 3))
+        names = NameAllocator(indexScene=True)
+        return lambda: [ik_limb_gui.stretchSwitch(ankle, settings, names=names) for ankle, settings in limbs]
+
+    for name, setup in [("buildCtrl", diamonds), ("ctrlPerTransform", ctrlPerTransform), ("colourByRule", colourByRule),
+                        ("selectCVs", selectCVs), ("makeOffsetGrps", offsetGrps), ("stretchSwitch", stretchSwitch)]:
+        for size in sizes:
+            cmds.newScene()
+            seconds = timed(cmds, setup(size))
+            report("%s @ %i nodes" % (name, len(cmds.nodes)), size, cmds, seconds)
+
+
+def benchShapeCache(count=2000):
+    ''' Export and re-import the shapes of count controls through a shape cache file, checking the round trip:
+        edited shapes (knots included) and colours must come back exactly, and untouched shapes must not be rewritten.
+        A hand-made curve with non-uniform knots that is only re-parameterised must come back with its own knots.
+        The export must stay at a fixed handful of queries per shape, with no curveInfo rewiring. Wall times are
+        reported, not asserted, since they depend on the machine.'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    shapeTypes = sorted(nurbCtrls.shapeLibrary())
+    names = NameAllocator(indexScene=True)
+    ctrls = [nurbCtrls.buildCtrl(shapeTypes[i % len(shapeTypes)], "l_ctrl%i" % i, names=names) for i in range(count)]
+    nurbCtrls.colourByRule(ctrls, nurbCtrls.SIDE_COLOURS)
+    cvs = [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0, 2.0, 1.0, 0.0, 2.0, 0.0, 0.0]
+    sculpted = cmds.createNode("nurbsCurve", n="l_sculptedShape", p=ctrls[0])
+    cmds.setAttr("%s.cc" % sculpted, *nurbCtrls.curveData((3, 0, [0, 0, 0, 0.3, 1, 1, 1], cvs)), type="nurbsCurve")
+    shapes = cmds.ls(type="nurbsCurve")
+    original = dict((shape, (dict((key, list(cmds.node(shape).curve[key])) for key in ("cvs", "knots")), cmds.getAttr("%s.overrideColor" % shape)))
+                    for shape in shapes)
+
+    handle, path = tempfile.mkstemp(suffix=".ncsc")
+    os.close(handle)
+    try:
+        exportSeconds = timed(cmds, lambda: nurbCtrls.exportCtrlShapes(path))
+        report("exportCtrlShapes (%i shapes, %i KB)" % (len(shapes), os.path.getsize(path) // 1024), count, cmds, exportSeconds)
+        exportCounts = dict(cmds.counts)
+
+        # Sculpt every tenth shape and recolour every seventh, as a rebuild would have lost them.
+        edited = shapes[::10]
+        for shape in edited:
+            cmds.setAttr("%s.cv[0]" % shape, 9.0, 9.0, 9.0)
+        # Same CVs, uniform knots: only the knots tell the shapes apart.
+        cmds.setAttr("%s.cc" % sculpted, *nurbCtrls.curveData((3, 0, [0, 0, 0, 1, 2, 2, 2], cvs)), type="nurbsCurve")
+        edited = sorted(set(edited) | set([sculpted]))
+        for shape in shapes[::7]:
+            cmds.setAttr("%s.overrideColor" % shape, 0)
+
+        rewritten = []
+        importSeconds = timed(cmds, lambda: rewritten.extend(nurbCtrls.importCtrlShapes(path)))
+        report("importCtrlShapes (%i rewritten)" % len(rewritten), count, cmds, importSeconds)
+    finally:
+        os.remove(path)
+
+    assert not exportCounts.get("connectAttr") and not exportCounts.get("createNode"), "export should not rewire curveInfo nodes"
+    # degree, form and cv[*] per shape, plus at most 3 colour queries.
+    assert exportCounts.get("getAttr", 0) <= 6 * len(shapes), "%i getAttr calls for %i shapes" % (exportCounts["getAttr"], len(shapes))
+    assert sorted(rewritten) == sorted(edited), "only edited shapes should be rewritten"
+    for shape in shapes:
+        curve, colour = original[shape]
+        assert cmds.node(shape).curve["cvs"] == curve["cvs"], "%s CVs not restored" % shape
+        assert cmds.node(shape).curve["knots"] == curve["knots"], "%s knots not restored" % shape
+        assert cmds.getAttr("%s.overrideColor" % shape) == colour, "%s colour not restored" % shape
+
+
+def benchMirror(count=500):
+    ''' Mirror count l_ controls (half of them with an existing r_ control) across X, checking every r_ CV
+        lands on the world-space mirror of its l_ CV, and every r_ curve keeps its l_ curve's knots (one l_ curve has
+        non-uniform knots). Side colours must swap, index or RGB, and colours outside the swap map must be kept.'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+    from offline_cmds import transformPoint
+
+    shapeTypes = sorted(nurbCtrls.shapeLibrary())
+    names = NameAllocator(indexScene=True)
+    for i in range(count):
+        ctrl = nurbCtrls.buildCtrl(shapeTypes[i % len(shapeTypes)], "l_ctrl%i" % i, names=names)
+        cmds.xform(ctrl, worldSpace=True, matrix=[0, 1, 0, 0, -1, 0, 0, 0, 0, 0, 1, 0, i + 1.0, 2.0, 0.5, 1])
+        if i % 2:
+            nurbCtrls.buildCtrl("nurbsCircle", "r_ctrl%i" % i, names=names)
+    sculpted = cmds.createNode("nurbsCurve", n="l_ctrl0SculptedShape", p="l_ctrl0")
+    cmds.setAttr("%s.cc" % sculpted, *nurbCtrls.curveData((3, 0, [0, 0, 0, 0.3, 1, 1, 1], [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0,
+                                                                                          2.0, 1.0, 0.0, 2.0, 0.0, 0.0])), type="nurbsCurve")
+    nurbCtrls.colourByRule(cmds.ls("l_*", type="transform"), nurbCtrls.SIDE_COLOURS)
+    rgbColours = {2 : ((0.0, 0.0, 1.0), (1.0, 0.0, 0.0)), 4 : ((1.0, 1.0, 0.0), (1.0, 1.0, 0.0))}
+    for i, (colour, mirrored) in rgbColours.items():
+        nurbCtrls.applyColour("l_ctrl%i" % i, colour)
+
+    targets = []
+    seconds = timed(cmds, lambda: targets.extend(nurbCtrls.mirrorCtrls()))
+    report("mirrorCtrls", count, cmds, seconds)
+
+    def worldCVs(ctrl):
+        matrix = cmds.getAttr("%s.worldMatrix[0]" % ctrl)
+        return [transformPoint(cv, matrix) for shape in cmds.listRelatives(ctrl, shapes=True) for cv in cmds.node(shape).curve["cvs"]]
+
+    def knots(ctrl):
+        return [cmds.node(shape).curve["knots"] for shape in cmds.listRelatives(ctrl, shapes=True)]
+
+    assert len(targets) == count, "every l_ control should be mirrored"
+    for i in range(count):
+        source, target = worldCVs("l_ctrl%i" % i), worldCVs("r_ctrl%i" % i)
+        assert len(source) == len(target), "r_ctrl%i has the wrong CV count" % i
+        assert knots("l_ctrl%i" % i) == knots("r_ctrl%i" % i), "r_ctrl%i knots differ from l_ctrl%i's" % (i, i)
+        for (x, y, z), (mx, my, mz) in zip(source, target):
+            assert abs(x + mx) < 1e-9 and abs(y - my) < 1e-9 and abs(z - mz) < 1e-9, "r_ctrl%i CVs are not mirrored" % i
+        for shape in cmds.listRelatives("r_ctrl%i" % i, shapes=True):
+            if i in rgbColours:
+                assert nurbCtrls.readColour(shape) == rgbColours[i][1], "%s RGB colour not mirrored" % shape
+            else:
+                assert cmds.getAttr("%s.overrideColor" % shape) == 13, "%s colour not swapped" % shape
+
+
+def benchSimplify(count=1000, tolerance=0.01):
+    ''' Simplify count library controls of mixed types, reporting CV counts and deviation. Every rebuilt curve must stay
+        within tolerance of its original samples, overlapping edges must go, and a second pass must change nothing.'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    shapeTypes = sorted(nurbCtrls.shapeLibrary())
+    names = NameAllocator(indexScene=True)
+    for i in range(count):
+        nurbCtrls.buildCtrl(shapeTypes[i % len(shapeTypes)], names=names)
+    shapesBefore = len(cmds.ls(type="nurbsCurve"))
+
+    result = {}
+    seconds = timed(cmds, lambda: result.update(nurbCtrls.simplifyCtrls(tolerance=tolerance)))
+    report("simplifyCtrls (%i -> %i CVs)" % (result["cvsBefore"], result["cvsAfter"]), count, cmds, seconds)
+    print("%-36s %i shapes rebuilt, %i overlapping removed, max deviation %.2e" %
+          ("", len(result["rebuilt"]), len(result["removed"]), result["maxDeviation"]))
+
+    assert result["maxDeviation"] <= tolerance, "rebuilt curves strayed beyond the tolerance"
+    assert len(cmds.ls(type="nurbsCurve")) == shapesBefore - len(result["removed"])
+    # 4 edges shared by a cube's squares, and a diamond's 4 base edges drawn twice.
+    expected = sum(4 for i in range(count) if shapeTypes[i % len(shapeTypes)] in ("nurbsCube", "nurbsDiamond"))
+    assert len(result["removed"]) == expected, "%i overlapping curves removed, expected %i" % (len(result["removed"]), expected)
+
+    seconds = timed(cmds, lambda: result.update(nurbCtrls.simplifyCtrls(tolerance=tolerance)))
+    report("simplifyCtrls (already simplified)", count, cmds, seconds)
+    assert not result["rebuilt"] and not result["removed"], "simplified controls should be left alone"
+
+
+def benchAutoSize(sizes=(50, 500)):
+    ''' Auto-size circle controls on a mix of joint chains and meshes. Sizing must take the same few queries at every
+        batch size, the radii must match the bones and mesh bounds, and be baked into the CVs without freezing.'''
+
+    cmds = installCmds()
+    import nurbCtrls
+
+    queries = set()
+    for size in sizes:
+        cmds.newScene()
+        targets, expected = [], []
+        for i in range(size // 5):
+            # Chain of 4 unit bones: 1.0 for every joint (the end joint by its parent bone), 2.2 for a 2x4x1 box.
+            hip = cmds.createNode("joint", n="hip%i" % i)
+            knee = cmds.createNode("joint", n="knee%i" % i, p=hip)
+            ankle = cmds.createNode("joint", n="ankle%i" % i, p=knee)
+            for joint in (knee, ankle):
+                cmds.setAttr("%s.translateX" % joint, 4.0)
+            box = cmds.polyCube(w=2, h=4, d=1, n="box%i" % i)[0]
+            cmds.xform(box, worldSpace=True, matrix=[1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, i, 5, 0, 1])
+            # A lone joint has nothing to size it by, and stays at unit size.
+            lone = cmds.createNode("joint", n="lone%i" % i)
+            targets.extend([hip, knee, ankle, box, lone])
+            expected.extend([1.0, 1.0, 1.0, 2.2, None])
+
+        radii = []
+        seconds = timed(cmds, lambda: radii.extend(nurbCtrls.targetRadii(targets)))
+        report("targetRadii", len(targets), cmds, seconds)
+        queries.add(cmds.total())
+        assert all((r is None and e is None) or (r is not None and e is not None and abs(r - e) < 1e-9) for r, e in zip(radii, expected)), \
+            "auto sizes should follow the bones and mesh bounds"
+
+        seconds = timed(cmds, lambda: nurbCtrls.ctrlPerTransform("nurbsCircle", targets, autoSize=True))
+        report("ctrlPerTransform (autoSize)", len(targets), cmds, seconds)
+        assert not cmds.counts.get("makeIdentity"), "auto sizes should be baked, not frozen"
+
+    assert len(queries) == 1, "sizing queries should not grow with the batch (%s)" % sorted(queries)
+
+    unit = max(abs(v) for curve in nurbCtrls.shapeLibrary()["nurbsCircle"] for v in curve[3])
+    for target, radius in zip(targets, expected):
+        ctrl = "%s_ctrl" % target
+        shape = cmds.listRelatives(ctrl, shapes=True)[0]
+        size = max(abs(v) for cv in cmds.nodes[shape].curve["cvs"] for v in cv)
+        assert abs(size - unit * (radius or 1.0)) < 1e-6, "%s should be baked to radius %s" % (ctrl, radius)
+        assert cmds.xform(ctrl, q=True, m=True)[0] == 1.0, "%s should keep unit scale" % ctrl
+
+
+def benchBatch(files=32, ctrls=100):
+    ''' Run batch_runner's default pipeline plus simplify over files rig files of ctrls controls each, in this process
+        and in a process pool. Both must write identical files, and a saved scene must load back unchanged.'''
+
+    cmds = installCmds()
+    import batch_runner
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    shapeTypes = sorted(nurbCtrls.shapeLibrary())
+    directory = tempfile.mkdtemp()
+    rigDir = os.path.join(directory, "rigs")
+    os.makedirs(rigDir)
+
+    for f in range(files):
+        cmds.newScene()
+        names = NameAllocator(indexScene=True)
+        for i in range(ctrls):
+            ctrl = nurbCtrls.buildCtrl(shapeTypes[(i + f) % len(shapeTypes)], "%s_ctrl%i" % ("lr"[i % 2], i), names=names)
+            cmds.xform(ctrl, worldSpace=True, matrix=[1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, i + 1.0, f, 0, 1])
+        cmds.saveScene(os.path.join(rigDir, "rig%03i.json" % f))
+
+    data = cmds.sceneData()
+    cmds.loadScene(os.path.join(rigDir, "rig%03i.json" % (files - 1)))
+    assert json.loads(json.dumps(cmds.sceneData())) == json.loads(json.dumps(data)), "a saved scene should load back unchanged"
+
+    paths = sorted(os.path.join(rigDir, name) for name in os.listdir(rigDir))
+    pipeline = ["colours", "offsetGrps", "simplify"]
+    outputs = []
+    # At least 2 workers, so the process pool is used even on a single core.
+    for workers in (1, max(2, multiprocessing.cpu_count())):
+        outputDir = os.path.join(directory, "out%s" % workers)
+        os.makedirs(outputDir)
+        start = time.time()
+        results = batch_runner.runBatch(paths, outputDir, pipeline, workers=workers)
+        seconds = time.time() - start
+        assert all(result["ok"] for result in results), [result.get("error") for result in results if not result["ok"]]
+        commands = sum(result["commands"] for result in results)
+        print("%-36s %6i items %9i cmds %8.2f cmds/item %9.4f s %8.1f ms/file" %
+              ("runBatch (%s)" % ("1 process" if workers == 1 else "%i worker processes" % workers),
+               files, commands, commands / float(files), seconds, seconds * 1e3 / files))
+        outputs.append([open(os.path.join(outputDir, os.path.basename(path))).read() for path in paths])
+
+    assert outputs[0] == outputs[1], "pooled and in-process runs should write the same files"
+    cmds.loadScene(os.path.join(directory, "out1", "rig000.json"))
+    assert len(cmds.ls("*_offsetGrp", type="transform")) == ctrls, "every control should have an offset group"
+
+
+def shelfInit(approach):
+    ''' Time one shelf initialisation in this (fresh) process, printing {"seconds", "cmds", "modules"} as JSON.
+        "imports" is the old launch: every tool imported (opening its window, and importing numpy and the lecturer
+        scripts). "registry" builds the shelf from tool_registry.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    before = set(sys.modules)
+
+    start = time.time()
+    if approach == "imports":
+        import numpy
+        import create_group
+        import ik_limb_gui
+        import ik_stretchy_joints_pm
+        import nurbCtrls
+        nurbCtrls.createCtrlGUI()
+        ik_limb_gui.limbGUI()
+    else:
+        import tool_registry
+        tool_registry.buildShelf()
+    seconds = time.time() - start
+
+    modules = sorted(name for name in set(sys.modules) - before if name.split(".")[0] in ("numpy", "nurbCtrls", "ik_limb_gui", "create_group"))
+    print(json.dumps({"seconds" : seconds, "cmds" : cmds.total(), "modules" : modules}))
+
+
+def benchShelf(runs=5):
+    ''' Shelf initialisation at Maya launch: importing every tool (as their GUI-at-import modules required) against
+        building the shelf from tool_registry. Each run is a new process, so imports are cold; the median is reported.'''
+
+    for approach in ("imports", "registry"):
+        results = []
+        for run in range(runs):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--shelf-init", approach])
+            results.append(json.loads(output.decode("utf-8").strip().splitlines()[-1]))
+        results.sort(key=lambda result: result["seconds"])
+        median = results[len(results) // 2]
+        print("%-36s %6i runs  %9i cmds %9.4f s  %s" % ("shelf init (%s)" % approach, runs, median["cmds"], median["seconds"],
+                                                        "imports: " + (", ".join(sorted(set(name.split(".")[0] for name in median["modules"]))) or "none")))
+        if approach == "registry":
+            assert not median["modules"], "building the shelf should import no tools"
+
+
+def benchSceneCache(edits=5000, limbs=200):
+    ''' Scene query cache: random queries interleaved with random edits (offline_cmds' scene events standing in for
+        Maya's) must always match uncached queries, with a small cache so eviction is exercised too. Then the hit rate
+        and commands saved when stretchSwitch re-checks an unchanged rig.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import ik_limb_gui
+    import scene_cache
+    from name_allocator import NameAllocator
+
+    random = __import__("random").Random(1)
+    cache = scene_cache.SceneQueryCache(maxSize=64)
+    cmds.sceneCallbacks.append(cache.sceneEvent)
+
+    makeJoints(cmds, 20)
+    for i in range(20):
+        cmds.createNode("unitConversion", n="conversion%i" % i, ss=True)
+
+    queries = [("listRelatives", {}), ("listRelatives", {"parent" : True}), ("listRelatives", {"allDescendents" : True, "fullPath" : True}),
+               ("listConnections", {"plugs" : True}), ("listConnections", {"source" : True, "destination" : False}), ("listAttr", {"ud" : True})]
+
+    def edit(nodes, dagNodes):
+        choice = random.randrange(7)
+        node = random.choice(nodes)
+        if choice == 0:
+            if random.random() < 0.8:
+                cmds.createNode("transform", p=random.choice(dagNodes), ss=True)
+            else:
+                cmds.createNode("unitConversion", ss=True)
+        elif choice == 1 and len(nodes) > 10 and not cmds.listRelatives(node):
+            cmds.delete(node)
+        elif choice == 2:
+            cmds.rename(node, "renamed1")
+        elif choice == 3 and node in dagNodes:
+            parent = random.choice(dagNodes)
+            if parent != node and not cmds.ls(parent, long=True)[0].startswith(cmds.ls(node, long=True)[0] + "|"):
+                cmds.parent(node, parent, relative=True)
+        elif choice == 4:
+            cmds.connectAttr("%s.output" % node, "%s.input%i" % (random.choice(nodes), random.randrange(3)), force=True)
+        elif choice == 5 and cmds.listConnections(node, plugs=True, connections=True, source=True, destination=False):
+            destination, source = cmds.listConnections(node, plugs=True, connections=True, source=True, destination=False)[:2]
+            cmds.disconnectAttr(source, destination)
+        elif choice == 6:
+            attr = "custom%i" % random.randrange(5)
+            if attr not in (cmds.listAttr(node, ud=True) or []):
+                cmds.addAttr(node, longName=attr, attributeType="float")
+
+    start = time.time()
+    for i in range(edits):
+        nodes = sorted(cmds.nodes)
+        dagNodes = [node for node in nodes if cmds.nodes[node].type in offline_cmds.DAG_TYPES]
+        for j in range(3):
+            command, kwargs = random.choice(queries)
+            node = random.choice(dagNodes if command == "listRelatives" else nodes)
+            assert getattr(cache, command)(node, **kwargs) == getattr(cmds, command)(node, **kwargs), "stale %s(%s, %s)" % (command, node, kwargs)
+        edit(nodes, dagNodes)
+    seconds = time.time() - start
+    cmds.sceneCallbacks.remove(cache.sceneEvent)
+
+    stats = cache.stats()
+    print("%-36s %6i edits %8.1f%% hits %6i evictions %6i invalidations %9.4f s" %
+          ("SceneQueryCache (consistency)", edits, stats["hitRate"] * 100, stats["evictions"], stats["invalidations"], seconds))
+
+    # Round trips saved by the shared cache, re-checking an unchanged rig.
+    cmds.newScene()
+    pairs = makeLimbs(cmds, limbs)
+    names = NameAllocator(indexScene=True)
+    for ankle, settings in pairs:
+        ik_limb_gui.updateStretchSwitch(ankle, settings, names=names)
+
+    # One scope around the batch keeps the cache attached across the re-runs; each tool call opens its own otherwise.
+    with scene_cache.sharedScope() as queries:
+        for rerun in ("cold", "warm"):
+            if rerun == "cold":
+                queries.clear()
+            queries.resetStats()
+            seconds = timed(cmds, lambda: [ik_limb_gui.updateStretchSwitch(ankle, settings) for ankle, settings in pairs])
+            report("updateStretchSwitch (%s cache, %.0f%% hits)" % (rerun, queries.stats()["hitRate"] * 100), limbs, cmds, seconds)
+    assert queries.stats()["hitRate"] == 1.0, "an unchanged rig should be re-checked from the cache alone"
+
+    # Scopes must not leave the shared cache listening to the scene, or holding results, once the tools return.
+    ik_limb_gui.updateStretchSwitch(*pairs[0])
+    assert queries.sceneEvent not in cmds.sceneCallbacks, "shared cache still attached after its scope"
+    assert not queries.stats()["entries"] and not queries.maxSize, "shared cache holding results outside a scope"
+
+
+def benchNames(sizes=SCALING_SIZES, growth=3.0):
+    ''' Build 100 controls into scenes of growing size, all of whose default names are already taken.
+        Batches share one NameAllocator index, so Maya should never have to resolve a clash itself (clashes column).
+        Standalone controls (a GUI button press) each get their own allocator, which checks its candidate names one
+        objExists at a time and never lists the scene. Time per control, batch or standalone, must stay flat: the
+        largest scene's may be at most growth times the smallest's (best of 3 runs each).'''
+
+    cmds = installCmds()
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    perItem = {"batch" : [], "standalone" : []}
+    for size in sizes:
+        cmds.newScene()
+        for i in range(size):
+            cmds.createNode("transform", n="nurbsCube%i" % (i + 1))
+        for i in range(size + 100):
+            cmds.createNode("transform", n="nurbsCube%iShape" % (i + 1))
+
+        names = []
+        seconds = timed(cmds, lambda: names.append(NameAllocator(indexScene=True)))
+        report("NameAllocator index @ %i nodes" % len(cmds.nodes), size, cmds, seconds)
+
+        seconds = timed(cmds, lambda: [nurbCtrls.buildCtrl("nurbsCube", names=names[0]) for i in range(100)])
+        report("buildCtrl @ %i nodes (%i clashes)" % (len(cmds.nodes), cmds.nameClashes), 100, cmds, seconds)
+        assert cmds.nameClashes == 0, "Maya had to resolve a name clash"
+        assert cmds.objExists("nurbsCube%i" % (size + 100)) and cmds.objExists("nurbsCube%iShape16" % (size + 100))
+        perItem["batch"].append(min([seconds] + [timed(cmds, lambda: [nurbCtrls.buildCtrl("nurbsCube", names=names[0])
+                                                                      for i in range(100)]) for run in range(2)]) / 100)
+
+        runs = []
+        for run in range(3):
+            runs.append(timed(cmds, lambda: [nurbCtrls.buildCtrl("nurbsCube", "c_run%iCtrl%i" % (run, i)) for i in range(100)]))
+            assert not cmds.counts.get("ls"), "standalone buildCtrl listed the scene"
+        report("buildCtrl standalone @ %i nodes (%i clashes)" % (len(cmds.nodes), cmds.nameClashes), 100, cmds, runs[-1])
+        assert cmds.nameClashes == 0, "Maya had to resolve a name clash"
+        perItem["standalone"].append(min(runs) / 100)
+
+        # On their taken default names, standalone controls probe a few numbers then list that base's names once.
+        seconds = timed(cmds, lambda: [nurbCtrls.buildCtrl("nurbsCube") for i in range(10)])
+        report("buildCtrl standalone, taken names", 10, cmds, seconds)
+        assert cmds.nameClashes == 0, "Maya had to resolve a name clash"
+        assert cmds.counts.get("ls", 0) <= 10, "standalone buildCtrl made %i ls calls" % cmds.counts["ls"]
+        assert cmds.objExists("nurbsCube%i" % (size + 310)) and cmds.objExists("nurbsCube%iShape" % (size + 310))
+
+    for label, times in sorted(perItem.items()):
+        assert max(times) <= growth * min(times), "%s buildCtrl time per control grew from %.0f to %.0f us" % \
+            (label, min(times) * 1e6, max(times) * 1e6)
+
+
+def benchSelection(count=1000):
+    ''' Selection changes caused by the GUI callbacks versus the headless API they wrap, timed with a stand-in
+        selection listener (the Outliner and channel box re-reading the selection on every change).
+        The headless functions must not change the selection at all.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import create_group
+    import ik_limb_gui
+    import nurbCtrls
+    from name_allocator import NameAllocator
+
+    # Not counted as commands: this is Maya's own work, not the tools'.
+    cmds.selectionCallbacks.append(lambda: cmds.cmd_ls(sl=True, long=True))
+    try:
+        # The GUI callbacks are the headless call plus a select, timed here with a shared NameAllocator as well.
+        runs = [("buildCtrl + select (GUI)", False, lambda: [cmds.select(nurbCtrls.buildCtrl("nurbsDiamond", names=names)) for i in range(count)]),
+                ("buildCtrl", True, lambda: [nurbCtrls.buildCtrl("nurbsDiamond", names=names) for i in range(count)]),
+                ("makeLocator + select (GUI)", False, lambda: [cmds.select(nurbCtrls.makeLocator(names=names)) for i in range(count)]),
+                ("makeLocator", True, lambda: [nurbCtrls.makeLocator(names=names) for i in range(count)])]
+
+        for label, headless, func in runs:
+            cmds.newScene()
+            names = NameAllocator(indexScene=True)
+            seconds = timed(cmds, func)
+            report("%s (%i selection changes)" % (label, cmds.selectionChanges), count, cmds, seconds)
+            assert not headless or cmds.selectionChanges == 0, "%s changed the selection" % label
+
+        # Batch tools: none of them may touch the selection.
+        cmds.newScene()
+        joints = makeJoints(cmds, count)
+        ctrls = makeNestedCtrls(cmds, count)
+        limbs = makeLimbs(cmds, max(1, count // 3))
+        cmds.select(joints[0])
+        names = NameAllocator(indexScene=True)
+
+        for label, func in [("ctrlPerTransform", lambda: nurbCtrls.ctrlPerTransform("nurbsCircle", joints, 14)),
+                            ("freeze", lambda: nurbCtrls.freeze(*ctrls)),
+                            ("makeOffsetGrps", lambda: create_group.makeOffsetGrps(ctrls)),
+                            ("stretchSwitch", lambda: [ik_limb_gui.stretchSwitch(ankle, settings, names=names) for ankle, settings in limbs])]:
+            seconds = timed(cmds, func)
+            report("%s (%i selection changes)" % (label, cmds.selectionChanges), count, cmds, seconds)
+            assert cmds.selectionChanges == 0, "%s changed the selection" % label
+    finally:
+        cmds.selectionCallbacks.pop()
+
+
+def benchStretchRebuild(limbs=200):
+    ''' Re-run stretchSwitch over a built rig: unchanged limbs must be no-ops, and broken or re-configured
+        limbs (a cut toggle connection, a deleted node, a switch to packed) must only get the patch they need.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import ik_limb_gui
+    from name_allocator import NameAllocator
+
+    pairs = makeLimbs(cmds, limbs)
+    names = NameAllocator(indexScene=True)
+    seconds = timed(cmds, lambda: [ik_limb_gui.updateStretchSwitch(ankle, settings, names=names) for ankle, settings in pairs])
+    report("updateStretchSwitch (first build)", limbs, cmds, seconds)
+
+    # A fresh NameAllocator per run, as the scene is edited in between.
+    def rerun(packedLimbs=()):
+        reports = []
+        names = NameAllocator(indexScene=True)
+        seconds = timed(cmds, lambda: reports.extend(ik_limb_gui.updateStretchSwitch(ankle, settings, (ankle, settings) in packedLimbs, names)
+                                                     for ankle, settings in pairs))
+        return reports, seconds
+
+    reports, seconds = rerun()
+    report("updateStretchSwitch (unchanged)", limbs, cmds, seconds)
+    assert not any(r["added"] or r["removed"] or r["reconnected"] for r in reports), "unchanged limbs were patched"
+
+    # Break or re-configure a few limbs.
+    for ankle, settings in pairs[::10]:
+        cmds.disconnectAttr("%s.ikStretchToggle" % settings, "%s_stretchToggle_blendColors.blender" % ankle)
+    for ankle, settings in pairs[1::10]:
+        cmds.delete("%s_stretchToggle_blendColors" % ankle)
+    packedLimbs = set(pairs[2::10])
+
+    reports, seconds = rerun(packedLimbs)
+    patched = [pair for pair, r in zip(pairs, reports) if r["added"] or r["removed"] or r["reconnected"]]
+    report("updateStretchSwitch (%i patched)" % len(patched), limbs, cmds, seconds)
+    assert sorted(patched) == sorted(pairs[::10] + pairs[1::10] + pairs[2::10]), "only the changed limbs should be patched"
+
+    reports, seconds = rerun(packedLimbs)
+    assert not any(r["added"] or r["removed"] or r["reconnected"] for r in reports), "patched limbs should be up to date"
+
+    # Every joint must be driven through its toggle node, blending from the original stretch source and rest length.
+    for ankle, settings in pairs:
+        for joint in (ankle, cmds.listRelatives(ankle, parent=True)[0]):
+            driver = cmds.listConnections("%s.translateX" % joint, source=True, destination=False, plugs=True)[0]
+            node, channel = driver.split(".")[0], driver[-1]
+            assert cmds.listConnections("%s.color2%s" % (node, channel), source=True, destination=False)[0] == "%s_unitConversion" % joint
+            assert cmds.getAttr("%s.color1%s" % (node, channel)) == 4.0
+            assert cmds.listConnections("%s.blender" % node, source=True, destination=False, plugs=True)[0] == "%s.ikStretchToggle" % settings
+
+
+def benchRestPose(limbs=200):
+    ''' Snapshot the rest pose of limbs, stretch and rotate some, then build and re-run their stretch toggles from the
+        snapshot: rest lengths must be the snapshot's, not the posed ones, and one read of the snapshot must serve every
+        limb. diffPose must find exactly the posed joints, and the snapshot must survive a scene save and load.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import ik_limb_gui
+    import rest_pose
+    from name_allocator import NameAllocator
+
+    pairs = makeLimbs(cmds, limbs)
+    joints = cmds.ls(type="joint")
+    seconds = timed(cmds, lambda: rest_pose.snapshotRestPose())
+    report("snapshotRestPose", len(joints), cmds, seconds)
+
+    stretched = [joint for ankle, settings in pairs[::2] for joint in (ankle, cmds.listRelatives(ankle, parent=True)[0])]
+    for joint in stretched:
+        cmds.setAttr("%s.translateX" % joint, 6.0)
+    rotated = [cmds.listRelatives(cmds.listRelatives(ankle, parent=True)[0], parent=True)[0] for ankle, settings in pairs[1::4]]
+    for joint in rotated:
+        cmds.setAttr("%s.rotate" % joint, 0.0, 30.0, 0.0)
+
+    diff = {}
+    seconds = timed(cmds, lambda: diff.update(rest_pose.diffPose()))
+    report("diffPose (%i changed)" % len(diff["changed"]), len(joints), cmds, seconds)
+    assert sorted(path.split("|")[-1] for path in diff["changed"]) == sorted(stretched + rotated), "diffPose should find the posed joints"
+    assert all(list(diff["changed"][path]) == ["translate"] for path in diff["changed"] if path.split("|")[-1] in stretched)
+    assert not diff["missing"] and not diff["unrecorded"]
+
+    restPose = {}
+    seconds = timed(cmds, lambda: restPose.update(rest_pose.readRestPose()))
+    report("readRestPose", len(joints), cmds, seconds)
+    assert cmds.total() <= 5, "reading the snapshot should take a fixed few queries"
+
+    names = NameAllocator(indexScene=True)
+    seconds = timed(cmds, lambda: [ik_limb_gui.updateStretchSwitch(ankle, settings, names=names, restPose=restPose) for ankle, settings in pairs])
+    report("updateStretchSwitch (posed, snapshot)", limbs, cmds, seconds)
+    assert not cmds.counts.get("getAttr"), "a first build from the snapshot shouldn't read the joints"
+
+    def restLengths():
+        lengths = {}
+        for ankle, settings in pairs:
+            for joint in (ankle, cmds.listRelatives(ankle, parent=True)[0]):
+                driver = cmds.listConnections("%s.translateX" % joint, source=True, destination=False, plugs=True)[0]
+                lengths[joint] = cmds.getAttr("%s.color1%s" % (driver.split(".")[0], driver[-1]))
+        return lengths
+
+    assert set(restLengths().values()) == set([4.0]), "rest lengths should come from the snapshot, not the stretched pose"
+
+    # A new rest pose for one limb: only that limb's network is patched, to the new length.
+    ankle, settings = pairs[0]
+    for joint in (ankle, cmds.listRelatives(ankle, parent=True)[0]):
+        cmds.setAttr("%s.translateX" % joint, 5.0)
+    rest_pose.snapshotRestPose([ankle, cmds.listRelatives(ankle, parent=True)[0]])
+    assert len(cmds.getAttr("%s.%s" % (rest_pose.REST_POSE_NODE, rest_pose.REST_POSE_JOINTS_ATTR))) == len(joints), \
+        "a partial snapshot should keep the other joints"
+
+    names = NameAllocator(indexScene=True)
+    reports = []
+    seconds = timed(cmds, lambda: reports.extend(ik_limb_gui.updateStretchSwitch(ankle, settings, names=names) for ankle, settings in pairs))
+    report("updateStretchSwitch (re-run, 1 new rest)", limbs, cmds, seconds)
+    patched = [pair for pair, r in zip(pairs, reports) if r["added"] or r["removed"] or r["reconnected"]]
+    assert patched == [pairs[0]], "only the limb with a new rest pose should be patched"
+    lengths = restLengths()
+    assert lengths[ankle] == 5.0 and sorted(lengths.values()).count(4.0) == len(lengths) - 2
+
+    before = rest_pose.readRestPose()
+    cmds.loadSceneData(json.loads(json.dumps(cmds.sceneData())))
+    assert rest_pose.readRestPose() == before, "the snapshot should load back unchanged"
+
+
+def benchRecorder(limbs=200):
+    ''' Plans from an OperationRecorder: the optimiser's rules on a hand-made plan, then stretchSwitch over limbs
+        limbs committed per call against one shared recording, which must build the same networks.'''
+
+    cmds = installCmds()
+    installStubModule("ik_stretchy_joints_pm")
+    import ik_limb_gui
+    from name_allocator import NameAllocator
+    from op_recorder import OperationRecorder
+
+    # Redundant edits are planned away; a node is only skipped when creating and deleting it has no side effects.
+    cmds.createNode("transform", n="existing", ss=True)
+    ops = OperationRecorder()
+    ops.select("existing")
+    ops.createNode("transform", n="ctrl")
+    ops.rename("ctrl", "ctrl_renamed")
+    ops.setAttr("ctrl_renamed.translateX", 1.0)
+    ops.setAttr("ctrl_renamed.translateX", 2.0)
+    ops.createNode("transform", n="scratch")
+    ops.setAttr("scratch.translateX", 1.0)
+    ops.delete("scratch")
+    ops.createNode("transform", n="hold")
+    ops.parent("existing", "hold")
+    ops.delete("hold")
+    plan, dropped = ops.plan()
+    assert dropped == {"select" : 1, "rename" : 1, "setAttr" : 1, "created and deleted" : 3}, dropped
+    assert [op[0] for op in plan] == ["createNode", "createNode", "setAttr", "parent", "delete"], plan
+    assert plan[0][2]["n"] == "ctrl_renamed" and plan[2][1] == ["ctrl_renamed.translateX", 2.0]
+    ops.commit()
+    assert cmds.objExists("ctrl_renamed") and not cmds.objExists("hold") and not cmds.objExists("existing")
+
+    # The same networks, committed per call and as one plan.
+    scenes = []
+    for shared in (False, True):
+        cmds.newScene()
+        pairs = makeLimbs(cmds, limbs)
+        names = NameAllocator(indexScene=True)
+        ops = OperationRecorder() if shared else None
+
+        def build():
+            for ankle, settings in pairs:
+                ik_limb_gui.stretchSwitch(ankle, settings, names=names, ops=ops)
+            if ops:
+                ops.commit(chunkName="stretchSwitch")
+
+        seconds = timed(cmds, build)
+        report("stretchSwitch (%s)" % ("one recorder" if shared else "commit per call"), limbs, cmds, seconds)
+        scenes.append((sorted(cmds.ls()), sorted(cmds.sources.items()),
+                       sorted((plug, cmds.getAttr(plug)) for node in cmds.ls(type="blendColors") for plug in
+                              ("%s.color1%s" % (node, channel) for channel in "RGB"))))
+    assert scenes[0] == scenes[1], "a shared recording should build the same networks as per call commits"
+
+    # What a dry run prints.
+    cmds.newScene()
+    ankle, settings = makeLimbs(cmds, 1)[0]
+    ops = OperationRecorder()
+    ik_limb_gui.stretchSwitch(ankle, settings, ops=ops)
+    ops.commit(dryRun=True)
+
+
+BENCHMARKS = {"shapes" : benchShapes,
+              "legacyShapes" : benchLegacyShapes,
+              "cleanupCtrl" : benchCleanupCtrl,
+              "shapeCache" : benchShapeCache,
+              "mirror" : benchMirror,
+              "simplify" : benchSimplify,
+              "autoSize" : benchAutoSize,
+              "batch" : benchBatch,
+              "shelf" : benchShelf,
+              "sceneCache" : benchSceneCache,
+              "names" : benchNames,
+              "selection" : benchSelection,
+              "scaling" : benchScaling,
+              "profile" : benchProfile,
+              "stretchSwitch" : benchStretchSwitch,
+              "stretchRebuild" : benchStretchRebuild,
+              "recorder" : benchRecorder,
+              "restPose" : benchRestPose,
+              "offsetGrps" : benchOffsetGrps,
+              "cvSelect" : benchCVSelect,
+              "colour" : benchColour,
+              "ctrlPerTransform" : benchCtrlPerTransform}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--shelf-init"]:
+        shelfInit(sys.argv[2])
+    else:
+        for name in sys.argv[1:] or sorted(BENCHMARKS):
+            BENCHMARKS[name]()
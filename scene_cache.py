@@ -0,0 +1,318 @@
+''' Shared, bounded cache of scene queries: hierarchy (listRelatives), connections (listConnections) and user attributes
+    (listAttr), dropped as soon as the scene changes under them.
+
+    Every cached result remembers the nodes it depends on: those it was asked about, and those in its answer.
+    Scene events invalidate the results depending on the nodes involved:
+        nodeAdded, nodeRemoved (path)   results for the node and each of its ancestors (their descendants changed)
+        nodeRenamed (old path, name)    results for the node and its ancestors, and any result naming it in a path
+        parentChanged (old, new path)   as a removal from the old path and an addition at the new one
+        attributeChanged (plug)         connection and attribute results for the plug's node
+        sceneCleared ()                 everything
+    In Maya the events come from OpenMaya scene messages (attachMaya), offline from offline_cmds.sceneCallbacks.
+    Without an event source the cache holds nothing and every query goes straight to cmds.
+
+    The shared cache only listens to the scene inside sharedScope(), which the tools' entry points open for the
+    length of the call (see scoped), so no callbacks outlive a tool. Outside a scope it holds nothing.
+
+    getAttr isn't cached: many values (world matrices, outputs) change without an event on their own node.
+
+    For example:
+        with scene_cache.sharedScope() as queries:
+            shapes = queries.listRelatives(ctrl, shapes=True)
+            print(queries.stats())'''
+
+import collections
+import contextlib
+import functools
+
+import maya.cmds as cmds
+
+# Queries the cache answers, and which of them attribute changes invalidate.
+CACHED_COMMANDS = ("listRelatives", "listConnections", "listAttr")
+ATTRIBUTE_COMMANDS = ("listConnections", "listAttr")
+
+# Size of the shared cache, in results.
+SHARED_CACHE_SIZE = 20000
+
+# Shared cache, see sharedCache(), and how many sharedScope()s are open on it.
+_shared = None
+_scopeDepth = 0
+
+
+def _frozen(value):
+    ''' hashable copy of a query argument (lists become tuples)'''
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    return value
+
+
+def _names(value):
+    ''' every node name in a query argument or result: the nodes of plugs, and each node along paths'''
+
+    if isinstance(value, (list, tuple)):
+        return set(name for item in value for name in _names(item))
+    if isinstance(value, (str, type(u""))):
+        return set(name for name in value.split(".")[0].split("|") if name)
+    return set()
+
+
+def _pathNodes(path):
+    ''' the nodes along a path, from the root down'''
+
+    return [name for name in path.split(".")[0].split("|") if name]
+
+
+class SceneQueryCache(object):
+    ''' LRU cache of listRelatives/listConnections/listAttr results, invalidated by scene events (see module docs)
+
+        maxSize : most results kept, least recently used dropped first. 0 disables caching.
+        commands : module the queries run through on a miss, defaults to whatever cmds is at query time'''
+
+    def __init__(self, maxSize=SHARED_CACHE_SIZE, commands=None):
+        self.maxSize = maxSize
+        self.commands = commands
+        self.callbackIds = []
+
+        # query key -> (result, nodes it depends on, entry id), least recently used first.
+        self._entries = collections.OrderedDict()
+        # node name -> ids of the results depending on it, and entry id -> query key. Ids, since keys of queries
+        # about many nodes are long tuples, which would be re-hashed for every node.
+        self._byNode = {}
+        self._keys = {}
+        self._nextId = 0
+        self.resetStats()
+
+    # --- Cached queries (same arguments as cmds) ---
+
+    def listRelatives(self, *args, **kwargs):
+        return self._query("listRelatives", args, kwargs)
+
+    def listConnections(self, *args, **kwargs):
+        return self._query("listConnections", args, kwargs)
+
+    def listAttr(self, *args, **kwargs):
+        return self._query("listAttr", args, kwargs)
+
+    def _query(self, command, args, kwargs):
+        # Queries of the selection can't be cached: nothing says when it changes.
+        if not self.maxSize or not _names(args):
+            self._counts[command][1] += 1
+            return getattr(self.commands or cmds, command)(*args, **kwargs)
+
+        key = (command, _frozen(args), tuple(sorted((name, _frozen(value)) for name, value in kwargs.items())))
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+            result = entry[0]
+            self._counts[command][0] += 1
+        else:
+            self._counts[command][1] += 1
+            result = getattr(self.commands or cmds, command)(*args, **kwargs)
+            nodes = _names(args) | _names(result)
+            self._nextId += 1
+            self._entries[key] = (result, nodes, self._nextId)
+            self._keys[self._nextId] = key
+            for node in nodes:
+                self._byNode.setdefault(node, set()).add(self._nextId)
+            while len(self._entries) > self.maxSize:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+        # Callers get their own copy, so editing it can't corrupt the cache.
+        return list(result) if isinstance(result, list) else result
+
+    def _drop(self, key):
+        result, nodes, entryId = self._entries.pop(key)
+        del self._keys[entryId]
+        for node in nodes:
+            ids = self._byNode.get(node)
+            if ids is not None:
+                ids.discard(entryId)
+                if not ids:
+                    del self._byNode[node]
+
+    # --- Invalidation ---
+
+    def invalidate(self, nodes, commands=CACHED_COMMANDS):
+        ''' Drop the results (of the given query commands) depending on any of nodes'''
+
+        for node in nodes:
+            for key in [self._keys[entryId] for entryId in self._byNode.get(node, ())]:
+                if key[0] in commands:
+                    self._drop(key)
+                    self._invalidations += 1
+
+    def clear(self):
+        ''' Drop every result (stats are kept)'''
+
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+        self._byNode.clear()
+        self._keys.clear()
+
+    def nodeAdded(self, path):
+        self.invalidate(_pathNodes(path))
+
+    def nodeRemoved(self, path):
+        self.invalidate(_pathNodes(path))
+
+    def nodeRenamed(self, oldPath, newName):
+        self.invalidate(_pathNodes(oldPath) + [newName])
+
+    def parentChanged(self, oldPath, newPath):
+        self.invalidate(_pathNodes(oldPath) + _pathNodes(newPath))
+
+    def attributeChanged(self, plug):
+        self.invalidate(_pathNodes(plug)[-1:], ATTRIBUTE_COMMANDS)
+
+    def sceneCleared(self):
+        self.clear()
+
+    def sceneEvent(self, event, *args):
+        ''' Scene event callback, as offline_cmds.sceneCallbacks calls them: event is one of the handlers above'''
+
+        getattr(self, event)(*args)
+
+    # --- Stats ---
+
+    def stats(self):
+        ''' Hit rates, for seeing how many scene round trips the cache saves
+
+            On Exit:
+            Returns {"hits", "misses", "hitRate", "entries", "maxSize", "evictions", "invalidations",
+            "commands" : {command : {"hits", "misses", "hitRate"}}}. Uncacheable queries count as misses.'''
+
+        def rates(hits, misses):
+            return {"hits" : hits, "misses" : misses, "hitRate" : hits / float(hits + misses) if hits + misses else 0.0}
+
+        result = rates(sum(counts[0] for counts in self._counts.values()), sum(counts[1] for counts in self._counts.values()))
+        result.update(entries=len(self._entries), maxSize=self.maxSize, evictions=self._evictions, invalidations=self._invalidations,
+                      commands=dict((command, rates(*counts)) for command, counts in self._counts.items()))
+        return result
+
+    def resetStats(self):
+        self._counts = dict((command, [0, 0]) for command in CACHED_COMMANDS)
+        self._evictions = 0
+        self._invalidations = 0
+
+
+def attachMaya(cache):
+    ''' Drive a cache's invalidation from Maya's scene messages. Undo and redo clear it, as they can change anything.
+
+        On Exit:
+        Callbacks registered (their ids in cache.callbackIds, see detach). Returns the cache.'''
+
+    import maya.api.OpenMaya as om
+
+    def path(node):
+        if node.hasFn(om.MFn.kDagNode):
+            return om.MFnDagNode(node).fullPathName()
+        return om.MFnDependencyNode(node).name()
+
+    def connection(source, destination, made, clientData):
+        cache.attributeChanged(source.name())
+        cache.attributeChanged(destination.name())
+
+    def attributeAddedOrRemoved(message, plug, clientData):
+        cache.attributeChanged(plug.name())
+
+    # A node's attribute list only changes through its own messages, so the nodes listAttr is asked about are watched.
+    watched = set()
+    listAttr = cache.listAttr
+
+    def watchedListAttr(*args, **kwargs):
+        for name in [name for name in _names(args) if name not in watched]:
+            selection = om.MSelectionList()
+            selection.add(name)
+            cache.callbackIds.append(om.MNodeMessage.addAttributeAddedOrRemovedCallback(selection.getDependNode(0), attributeAddedOrRemoved))
+            watched.add(name)
+        return listAttr(*args, **kwargs)
+
+    cache.listAttr = watchedListAttr
+    cache.callbackIds.extend([
+        om.MDGMessage.addNodeAddedCallback(lambda node, clientData: cache.nodeAdded(path(node)), "dependNode"),
+        om.MDGMessage.addNodeRemovedCallback(lambda node, clientData: cache.nodeRemoved(path(node)), "dependNode"),
+        om.MNodeMessage.addNameChangedCallback(om.MObject.kNullObj, lambda node, oldName, clientData:
+                                               cache.nodeRenamed(oldName, om.MFnDependencyNode(node).name())),
+        om.MDagMessage.addParentAddedCallback(lambda child, parent, clientData: cache.nodeAdded(child.fullPathName())),
+        om.MDagMessage.addParentRemovedCallback(lambda child, parent, clientData:
+                                                cache.nodeRemoved("%s|%s" % (parent.fullPathName(), child.partialPathName()))),
+        om.MDGMessage.addConnectionCallback(connection),
+        om.MEventMessage.addEventCallback("Undo", lambda clientData: cache.clear()),
+        om.MEventMessage.addEventCallback("Redo", lambda clientData: cache.clear()),
+        om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, lambda clientData: cache.clear()),
+        om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, lambda clientData: cache.clear())])
+    return cache
+
+
+def detach(cache):
+    ''' Stop a cache's event callbacks, and empty it (it can no longer tell when results go stale)'''
+
+    import maya.cmds as sceneCmds
+
+    if cache.sceneEvent in getattr(sceneCmds, "sceneCallbacks", []):
+        sceneCmds.sceneCallbacks.remove(cache.sceneEvent)
+    if cache.callbackIds:
+        import maya.api.OpenMaya as om
+        om.MMessage.removeCallbacks(cache.callbackIds)
+        cache.callbackIds = []
+    # attachMaya's listAttr wrapper, whose watched nodes lost their callbacks with the rest.
+    vars(cache).pop("listAttr", None)
+    cache.clear()
+    cache.maxSize = 0
+
+
+def sharedCache():
+    ''' The scene query cache shared by the tools, created on first use. It caches only inside sharedScope(),
+        while it is attached to the scene's events; elsewhere every query goes straight to cmds.'''
+
+    global _shared
+
+    if _shared is None:
+        _shared = SceneQueryCache(maxSize=0)
+    return _shared
+
+
+@contextlib.contextmanager
+def sharedScope():
+    ''' Attach the shared cache to the scene's events for the length of a tool or batch call. Scopes nest: the
+        outermost one attaches, and detaches (emptying the cache) on exit, even if the call raises.
+        Outside Maya, cmds must provide sceneCallbacks (as offline_cmds does), or the cache stays empty.
+
+        On Exit:
+        Yields the shared cache.'''
+
+    global _scopeDepth
+
+    cache = sharedCache()
+    if not _scopeDepth:
+        # The events come from the cmds module itself, not whatever wraps it here (e.g. cmds_profiler's proxy).
+        import maya.cmds as sceneCmds
+
+        cache.maxSize = SHARED_CACHE_SIZE
+        if isinstance(getattr(sceneCmds, "sceneCallbacks", None), list):
+            sceneCmds.sceneCallbacks.append(cache.sceneEvent)
+        else:
+            try:
+                attachMaya(cache)
+            except ImportError:
+                cache.maxSize = 0
+
+    _scopeDepth += 1
+    try:
+        yield cache
+    finally:
+        _scopeDepth -= 1
+        if not _scopeDepth:
+            detach(cache)
+
+
+def scoped(func):
+    ''' Decorator running a tool entry point inside sharedScope()'''
+
+    @functools.wraps(func)
+    def scopedFunc(*args, **kwargs):
+        with sharedScope():
+            return func(*args, **kwargs)
+    return scopedFunc
@@ -0,0 +1,109 @@
+''' Registry of the rigging tools' entry points, and the shelf built from it.
+
+    Tools are declared here as data, so building the shelf imports none of them: a tool's module (and whatever
+    heavy dependencies it has) is only imported when one of its buttons is first pressed, or one of its headless
+    functions is first asked for.
+
+    For example, in userSetup.py:
+        import maya.utils, tool_registry
+        maya.utils.executeDeferred(tool_registry.buildShelf)
+
+    and from other scripts:
+        makeOffsetGrps = tool_registry.entryPoint("create_group", "makeOffsetGrps")'''
+
+import importlib
+
+import maya.cmds as cmds
+
+# Shelf the tools are put on.
+SHELF_NAME = "RiggingScripts"
+
+# Declared tools, in shelf order: name -> {"module", "command" (function run by the shelf button, e.g. the tool's
+# window), "label", "annotation", "image", "entryPoints" (headless functions other scripts may call)}.
+TOOLS = []
+_tools = {}
+
+
+def register(name, module, command, label=None, annotation="", image="pythonFamily.png", entryPoints=()):
+    ''' Declare a tool, without importing it
+
+        name : unique tool name, e.g. "nurbCtrls"
+        module : module the tool's functions live in
+        command : function of module the shelf button runs
+        label : shelf button label, defaults to name
+        annotation : shelf button tooltip
+        image : shelf button icon
+        entryPoints : names of module's headless functions, see entryPoint()
+
+        On Exit:
+        Tool added to TOOLS (replacing any earlier declaration of the same name). Returns its declaration.'''
+
+    tool = {"name" : name, "module" : module, "command" : command, "label" : label or name,
+            "annotation" : annotation, "image" : image, "entryPoints" : tuple(entryPoints)}
+
+    if name in _tools:
+        TOOLS[TOOLS.index(_tools[name])] = tool
+    else:
+        TOOLS.append(tool)
+    _tools[name] = tool
+    return tool
+
+
+def entryPoint(name, function=None):
+    ''' A tool's function, importing its module on first use
+
+        name : tool name
+        function : one of the tool's entry points (or its command), defaults to its command'''
+
+    tool = _tools[name]
+    function = function or tool["command"]
+    if function != tool["command"] and function not in tool["entryPoints"]:
+        raise ValueError("%s is not an entry point of %s (declared: %s)" % (function, name, ", ".join(tool["entryPoints"])))
+    return getattr(importlib.import_module(tool["module"]), function)
+
+
+def launch(name, *pArgs):
+    ''' Shelf button callback: run a tool's command, importing it on first use'''
+
+    return entryPoint(name)()
+
+
+def buildShelf(shelfName=SHELF_NAME, parent="ShelfLayout"):
+    ''' (Re)build the tools' shelf from TOOLS, without importing any of the tools
+
+        shelfName : shelf tab to fill, created if it doesn't exist
+        parent : Maya's shelf tab layout
+
+        On Exit:
+        The shelf holds one button per declared tool, in declaration order. Returns the shelf layout.'''
+
+    if cmds.shelfLayout(shelfName, exists=True):
+        for button in cmds.shelfLayout(shelfName, q=True, childArray=True) or []:
+            cmds.deleteUI(button)
+        shelf = shelfName
+    else:
+        shelf = cmds.shelfLayout(shelfName, parent=parent)
+
+    for tool in TOOLS:
+        cmds.shelfButton(label=tool["label"], imageOverlayLabel=tool["label"], annotation=tool["annotation"], image=tool["image"],
+                         sourceType="python", command="import tool_registry; tool_registry.launch(%r)" % tool["name"], parent=shelf)
+
+    return shelf
+
+
+register("nurbCtrls", "nurbCtrls", "createCtrlGUI", label="Ctrls",
+         annotation="Create, colour, mirror and simplify NURBS controls",
+         entryPoints=("buildCtrl", "makeLocator", "ctrlPerTransform", "targetRadii", "applyColour", "colourByRule", "selectCVs",
+                      "exportCtrlShapes", "importCtrlShapes", "mirrorCtrls", "simplifyCtrls", "cleanupCtrl"))
+
+register("ik_limb_gui", "ik_limb_gui", "limbGUI", label="IK Limb",
+         annotation="Build stretchy IK limbs with a stretch toggle",
+         entryPoints=("buildLimbs", "buildLimb", "stretchSwitch", "updateStretchSwitch"))
+
+register("rest_pose", "rest_pose", "snapshotSelected", label="Rest Pose",
+         annotation="Snapshot the selected skeleton's rest pose (or every joint's) onto the rig",
+         entryPoints=("snapshotRestPose", "readRestPose", "diffPose", "reportPoseDiff"))
+
+register("create_group", "create_group", "makeGrpFunc", label="Offset",
+         annotation="Zero out the selected objects under offset groups",
+         entryPoints=("makeOffsetGrps",))